@@ -19,6 +19,10 @@ tests_require = [
     "eradicate",
     "asynctest",
     "pytest",
+    "numpy",
+    "pyproj",
+    "pyarrow",
+    "shapely",
 ]
 
 setuptools.setup(
@@ -41,7 +45,13 @@ setuptools.setup(
         "bygfiles",
     ],
     tests_require=tests_require,
-    extras_require={"dev": tests_require},
+    extras_require={
+        "dev": tests_require,
+        "numpy": ["numpy"],
+        "pyproj": ["numpy", "pyproj"],
+        "arrow": ["pyarrow>=15"],
+        "shapely": ["shapely>=2.1"],
+    },
     packages=setuptools.find_packages(),
     classifiers=[
         "Programming Language :: Python :: 3",
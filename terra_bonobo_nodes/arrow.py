@@ -0,0 +1,499 @@
+"""
+Columnar record batches: pyarrow tables, geometries being GeoArrow WKB
+columns (binary columns with `geoarrow.wkb` extension metadata, the SRID in
+its crs), and the record identifier an `_identifier` column.
+
+A table takes far less memory than dicts of GEOSGeometry and is processed a
+column at a time. Converters build tables from extractions, `ToArrow` and
+`FromArrow` convert batches of records from and to tables, and loaders
+write tables.
+"""
+
+import csv
+import io
+import json
+from decimal import Decimal
+
+from bonobo.config import Configurable, Option
+from bonobo.constants import NOT_MODIFIED
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsWKB
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from .common import (
+    CsvDictReader,
+    ExcludeAttributes,
+    FilterAttributes,
+    GeojsonReader,
+    geometry_to_geojson,
+)
+from .elasticsearch import LoadInES
+from .sql import SQLExtract
+from .terra import ExtractFeatures, LoadFeatureInLayer
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover
+    pa = None
+
+IDENTIFIER = "_identifier"
+
+GEOARROW_WKB = b"geoarrow.wkb"
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required by columnar nodes")
+
+
+def geometry_field(name, srid=None):
+    """
+    GeoArrow WKB field of a geometry column
+    """
+    metadata = {"crs": f"EPSG:{srid}"} if srid else {}
+    return pa.field(
+        name,
+        pa.binary(),
+        metadata={
+            b"ARROW:extension:name": GEOARROW_WKB,
+            b"ARROW:extension:metadata": json.dumps(metadata).encode(),
+        },
+    )
+
+
+def geometry_columns(schema):
+    """
+    Return:
+      dict srid of each geometry column
+    """
+    columns = {}
+    for field in schema:
+        metadata = field.metadata or {}
+        if metadata.get(b"ARROW:extension:name") == GEOARROW_WKB:
+            crs = json.loads(metadata.get(b"ARROW:extension:metadata") or "{}")
+            srid = crs.get("crs", "").rpartition(":")[2]
+            columns[field.name] = int(srid) if srid.isdigit() else None
+    return columns
+
+
+def column_array(values):
+    """
+    Array of a list of values, JSON text if they do not share a type
+    """
+    try:
+        return pa.array(values)
+    except (pa.ArrowException, OverflowError):
+        return pa.array(
+            [
+                None if value is None else json.dumps(value, cls=DjangoJSONEncoder)
+                for value in values
+            ],
+            pa.string(),
+        )
+
+
+def properties_table(properties):
+    """
+    Table of a list of properties dicts, columns being the union of their keys.
+    Columns whose values do not share a type are JSON text columns.
+    """
+    if not properties:
+        return pa.table({})
+    try:
+        return pa.Table.from_struct_array(pa.array(properties))
+    except (pa.ArrowException, OverflowError):
+        pass
+    names = dict.fromkeys(name for values in properties for name in values)
+    return pa.table(
+        {
+            name: column_array([values.get(name) for values in properties])
+            for name in names
+        }
+    )
+
+
+def get_output_field(queryset, name):
+    """
+    Return:
+      Field of an annotation or a field of the queryset, None for lookups
+    """
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    try:
+        return queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def records_to_table(records, identifiers=None):
+    """
+    Table of a list of records, GEOSGeometry values being written to WKB
+    geometry columns. Identifiers, if any, are in the `_identifier` column.
+    """
+    geometries, srids, properties = {}, {}, []
+    for i, record in enumerate(records):
+        values = {}
+        for key, value in record.items():
+            if isinstance(value, GEOSGeometry):
+                if key not in geometries:
+                    geometries[key] = [None] * len(records)
+                    srids[key] = value.srid
+                geometries[key][i] = bytes(value.wkb)
+            else:
+                values[key] = value
+        properties.append(values)
+    for values in properties:
+        # Empty geometries of records
+        for name in geometries:
+            values.pop(name, None)
+
+    table = properties_table(properties)
+    for name, wkb in geometries.items():
+        table = table.append_column(
+            geometry_field(name, srids[name]), pa.array(wkb, pa.binary())
+        )
+    if identifiers is not None:
+        table = table.add_column(0, IDENTIFIER, pa.array(identifiers))
+    return table
+
+
+def table_to_records(table):
+    """
+    Records of a table, with GEOSGeometry from WKB geometry columns. Missing
+    properties are None.
+
+    Return:
+      list(identifier, record), identifier being None without `_identifier`
+    """
+    geometries = geometry_columns(table.schema)
+    identifiers = [None] * table.num_rows
+    if IDENTIFIER in table.column_names:
+        identifiers = table.column(IDENTIFIER).to_pylist()
+        table = table.drop_columns([IDENTIFIER])
+
+    records = table.to_pylist()
+    for record in records:
+        for name, srid in geometries.items():
+            if record[name] is not None:
+                record[name] = GEOSGeometry(memoryview(record[name]), srid=srid)
+    return list(zip(identifiers, records))
+
+
+class ToArrow(Configurable):
+    """
+    Convert batches of records, from `Batch`, to tables.
+
+    Return:
+      pyarrow.Table
+    """
+
+    def __call__(self, batch, *args, **kwargs):
+        require_pyarrow()
+        return records_to_table(
+            [record for _, record in batch], [identifier for identifier, _ in batch]
+        )
+
+
+class FromArrow(Configurable):
+    """
+    Convert tables back to records.
+
+    Return:
+      identifier, record or only record for tables without identifiers
+    """
+
+    def __call__(self, table, *args, **kwargs):
+        with_identifier = IDENTIFIER in table.column_names
+        for identifier, record in table_to_records(table):
+            yield (identifier, record) if with_identifier else record
+
+
+class ArrowCsvDictReader(CsvDictReader):
+    """
+    Same as CsvDictReader, reading the CSV file into tables of string columns.
+
+    Options:
+      All options from csv.DictReader class are available.
+      `block_size` bytes of CSV content read for each table
+
+    Return:
+      pyarrow.Table
+    """
+
+    block_size = Option(int, default=1 << 20)
+
+    def __call__(self, content):
+        require_pyarrow()
+        if isinstance(content, str):
+            content = content.encode(self.encoding)
+        if not content.strip():
+            return
+
+        dialect = self.get_dialect_kwargs()
+        header = next(
+            csv.reader(io.StringIO(content.decode(self.encoding)), **dialect), []
+        )
+        reader = pa_csv.open_csv(
+            io.BytesIO(content),
+            read_options=pa_csv.ReadOptions(
+                encoding=self.encoding, block_size=self.block_size
+            ),
+            parse_options=pa_csv.ParseOptions(
+                delimiter=dialect["delimiter"],
+                quote_char=dialect["quotechar"] or False,
+                double_quote=dialect["doublequote"],
+                escape_char=dialect["escapechar"] or False,
+                newlines_in_values=True,
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.string() for name in header},
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+        for batch in reader:
+            yield pa.Table.from_batches([batch])
+
+
+class ArrowGeojsonReader(GeojsonReader):
+    """
+    Same as GeojsonReader, features being read into tables.
+
+    Options:
+      `geom` set the column where the geometry will be inserted
+      `allowed_projection` defines list of accepted projections
+      `batch_size` features by table
+
+    Return:
+      pyarrow.Table
+    """
+
+    batch_size = Option(int, default=10000)
+
+    def __call__(self, raw_geojson_str):
+        require_pyarrow()
+        records = []
+        for record in super().__call__(raw_geojson_str):
+            records.append(record)
+            if len(records) >= self.batch_size:
+                yield records_to_table(records)
+                records = []
+        if records:
+            yield records_to_table(records)
+
+
+class ArrowSQLExtract(SQLExtract):
+    """
+    Same as SQLExtract, rows being fetched into tables. Geometry columns are
+    given as WKB, like ST_AsBinary() results, or as hexadecimal EWKB, like
+    geometry results.
+
+    Options:
+      `sql_query` SQL query to execute
+      `identifier` column containing record identifier
+      `db_alias` db alias used for connection
+      `geom` list of geometry columns
+      `batch_size` rows by table
+
+    Return:
+      pyarrow.Table
+    """
+
+    geom = Option(list, default=[])
+    batch_size = Option(int, default=10000)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.checkpoint is not None:
+            raise ValueError("ArrowSQLExtract does not support checkpoint")
+
+    def __call__(self, *args, **kwargs):
+        require_pyarrow()
+        with connections[self.db_alias].cursor() as cursor:
+            cursor.execute(self.sql_query)
+            columns = [col[0] for col in cursor.description]
+
+            for rows in iter(lambda: cursor.fetchmany(self.batch_size), []):
+                yield self.get_table(columns, list(zip(*rows)))
+
+    def get_table(self, columns, values):
+        fields, arrays = [], []
+        for name, column in zip(columns, values):
+            if name in self.geom:
+                wkb, srid = [], None
+                for value in column:
+                    if isinstance(value, str):
+                        value = GEOSGeometry(value)
+                        srid = srid or value.srid
+                        value = value.wkb
+                    wkb.append(bytes(value) if value is not None else None)
+                fields.append(geometry_field(name, srid))
+                arrays.append(pa.array(wkb, pa.binary()))
+            else:
+                column = [
+                    float(str(v)) if isinstance(v, Decimal) else v for v in column
+                ]
+                arrays.append(pa.array(column))
+                fields.append(pa.field(name, arrays[-1].type))
+
+        table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+        return table.add_column(0, IDENTIFIER, table.column(self.identifier))
+
+
+class ArrowExtractFeatures(ExtractFeatures):
+    """
+    Same as ExtractFeatures, features being fetched into tables, geometry
+    fields and annotations of `extra_properties` as WKB geometry columns.
+    Extra properties may also be lookups, like "layer__name".
+
+    Options:
+      `queryset` Feature QuerySet containing geometries and attributes
+      `id_field` field containing the identifier
+      `extra_properties` dict of extra attributes extracted from the feature
+      `spatial_order` geohash, hilbert or field ordering features
+
+    Return:
+      pyarrow.Table
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.checkpoint is not None:
+            raise ValueError("ArrowExtractFeatures does not support checkpoint")
+
+    def __call__(self, *args, **kwargs):
+        require_pyarrow()
+        queryset = self.get_queryset()
+        geometries, fields, annotations = {}, [], {}
+        for attribute, field in self.extra_properties.items():
+            output_field = get_output_field(queryset, field)
+            if isinstance(output_field, GeometryField):
+                annotations[f"_wkb_{attribute}"] = AsWKB(field)
+                geometries[attribute] = output_field.srid
+                fields.append(f"_wkb_{attribute}")
+            else:
+                fields.append(field)
+        queryset = queryset.annotate(**annotations).values_list(
+            self.id_field, "properties", *fields
+        )
+
+        count = queryset.count()
+        for start in range(0, count, self.batch_size):
+            end = min(start + self.batch_size, count)
+            rows = list(queryset[start:end])
+            identifiers, properties, *values = zip(*rows)
+
+            table = properties_table(list(properties))
+            table = table.drop_columns(
+                [name for name in self.extra_properties if name in table.column_names]
+            )
+            for attribute, column in zip(self.extra_properties, values):
+                if attribute in geometries:
+                    table = table.append_column(
+                        geometry_field(attribute, geometries[attribute]),
+                        pa.array(
+                            [bytes(v) if v is not None else None for v in column],
+                            pa.binary(),
+                        ),
+                    )
+                else:
+                    table = table.append_column(attribute, column_array(list(column)))
+            yield table.add_column(0, IDENTIFIER, pa.array(identifiers))
+
+
+class ArrowExcludeAttributes(ExcludeAttributes):
+    """
+    Same as ExcludeAttributes, dropping the columns of tables.
+
+    Options:
+      `excluded` list of excluded properties
+
+    Return:
+      pyarrow.Table
+    """
+
+    def __call__(self, table):
+        return table.drop_columns(
+            [name for name in self.excluded if name in table.column_names]
+        )
+
+
+class ArrowFilterAttributes(FilterAttributes):
+    """
+    Same as FilterAttributes, selecting the columns of tables.
+
+    Options:
+      `included` list of allowed properties
+
+    Return:
+      pyarrow.Table
+    """
+
+    def __call__(self, table):
+        return table.select(
+            [
+                name
+                for name in table.column_names
+                if name == IDENTIFIER or name in self.included
+            ]
+        )
+
+
+class ArrowLoadFeatureInLayer(LoadFeatureInLayer):
+    """
+    Same as LoadFeatureInLayer, loading tables. Rows are converted back to
+    records and written as LoadFeatureInLayer does, tables only save memory
+    up to the loader.
+
+    Options:
+      `geom` geom column where is located the geometry
+      `layer` layer where to insert the geometry and its attributes
+      `window_length` size of bulk import
+      `incremental` only write changes
+      `diff` property where to put the change of each changed feature emitted
+
+    Services:
+      `service_layer` Layer where to insert geometries, used if layer argument is empty
+
+    Return:
+      NOT_MODIFIED, or changed features if `diff`
+    """
+
+    def __call__(self, buffer, table, *args, **kwargs):
+        rows = []
+        for identifier, record in table_to_records(table):
+            result = super().__call__(buffer, identifier, record)
+            if self.diff and result:
+                rows.extend(result)
+        if self.diff:
+            return (row for row in rows)
+        return NOT_MODIFIED
+
+
+class ArrowLoadInES(LoadInES):
+    """
+    Same as LoadInES, loading tables, geometry columns being indexed as
+    GeoJSON.
+
+    Options:
+      `index` index name where to push the records
+
+    Services:
+      `es` ElasticSearch-dsl object
+
+    Return:
+      NOT_MODIFIED
+    """
+
+    def __call__(self, buffer, table, es, *args, **kwargs):
+        geometries = geometry_columns(table.schema)
+        for identifier, properties in table_to_records(table):
+            for name in geometries:
+                if properties[name] is not None:
+                    properties[name] = geometry_to_geojson(properties[name])
+            super().__call__(buffer, identifier, properties, es)
+        return NOT_MODIFIED
@@ -0,0 +1,190 @@
+"""
+Checkpoints of long-running pipelines, so that a rerun after a failure
+resumes extractions instead of starting from zero.
+
+Extractors declare each page of records they send, with the position
+following it (keyset, search_after values). Loaders declare the identifiers
+of each window they commit. Records go through nodes in order, so once every
+loader committed a record of a page, earlier pages went through the whole
+pipeline: the position of the last of them is a consistent resume point,
+saved to a local JSON file. Nothing is queried for that, the file is written
+at most once by `interval`.
+
+Identifiers must go unchanged from extractors to loaders. Records extracted
+after the saved position are extracted again by the rerun, loaders overwrite
+them.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+# Pages kept waiting for loaders, by extractor
+MAX_PENDING_PAGES = 1000
+
+
+class Checkpoint:
+    """
+    Resume position of the extractors and loaders of a pipeline, given to
+    them as `checkpoint` option. Nodes are identified by their class name.
+    The file is removed once all extractors are exhausted and all loaders
+    stopped.
+
+    Options:
+      `path` checkpoint file
+      `interval` minimum seconds between file writes
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        try:
+            with open(path) as checkpoint:
+                saved = json.load(checkpoint)
+        except FileNotFoundError:
+            saved = {}
+        self.extractors = dict(saved.get("extractors", {}))
+        self.loaders = dict(saved.get("loaders", {}))
+        self.resumed = bool(saved)
+        # extractor: deque((page, identifiers, position)), identifier: page
+        self.pages, self.index, self.sequences = {}, {}, {}
+        # loader: extractor: last page committed
+        self.committed_pages = {}
+        self.exhausted_extractors = set()
+        self.written = 0
+
+    def resume(self, extractor):
+        """
+        Start an extractor.
+
+        Return:
+          position following the records already loaded, None to start
+        """
+        with self.lock:
+            self.pages[extractor] = deque()
+            self.index[extractor] = {}
+            self.sequences[extractor] = 0
+            return self.extractors.get(extractor)
+
+    def extracted(self, extractor, identifiers, position):
+        """
+        Declare a page of records, before sending them
+        """
+        with self.lock:
+            page = self.sequences[extractor]
+            self.sequences[extractor] += 1
+            pages, index = self.pages[extractor], self.index[extractor]
+            if len(pages) >= MAX_PENDING_PAGES:
+                # Identifiers do not reach loaders, the position stays
+                dropped, dropped_identifiers, _ = pages.popleft()
+                self.forget(index, dropped, dropped_identifiers)
+                if dropped == 0:
+                    logger.warning(
+                        f"{extractor}: no page committed by loaders, checkpoint"
+                        " needs identifiers to go unchanged to loaders"
+                    )
+            identifiers = list(identifiers)
+            for identifier in identifiers:
+                index.setdefault(identifier, page)
+            pages.append((page, identifiers, position))
+
+    def exhausted(self, extractor):
+        with self.lock:
+            self.exhausted_extractors.add(extractor)
+
+    def register(self, loader):
+        """
+        Start a loader.
+
+        Return:
+          dict loader state of the resumed run, None to start
+        """
+        with self.lock:
+            self.committed_pages[loader] = {}
+            if not self.resumed:
+                return None
+            return self.loaders.setdefault(loader, {"windows": 0, "records": 0})
+
+    def committed(self, loader, identifiers):
+        """
+        Declare identifiers of a committed window
+        """
+        with self.lock:
+            identifiers = list(identifiers)
+            for extractor, index in self.index.items():
+                pages = [index[i] for i in identifiers if i in index]
+                if pages:
+                    committed = self.committed_pages[loader]
+                    committed[extractor] = max(committed.get(extractor, -1), *pages)
+                    self.advance(extractor)
+
+            state = self.loaders.setdefault(loader, {"windows": 0, "records": 0})
+            state["windows"] += 1
+            state["records"] += len(identifiers)
+            if identifiers:
+                state["identifier"] = identifiers[-1]
+
+            if time.monotonic() - self.written >= self.interval:
+                self.write()
+
+    def unregister(self, loader, complete=True):
+        """
+        Stop a loader. At the end of its input, `complete`, all extracted
+        records went through the pipeline, else the pipeline was killed.
+        """
+        with self.lock:
+            self.committed_pages.pop(loader, None)
+            if not complete:
+                self.write()
+                return
+            if self.committed_pages:
+                for extractor in self.pages:
+                    self.advance(extractor)
+                return
+            if self.exhausted_extractors >= set(self.pages):
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            for extractor, pages in self.pages.items():
+                if pages:
+                    self.extractors[extractor] = pages[-1][2]
+                    pages.clear()
+                    self.index[extractor].clear()
+            self.write()
+
+    def advance(self, extractor):
+        """
+        Move the extractor position to the last page all loaders went past
+        """
+        last = min(
+            committed.get(extractor, -1) for committed in self.committed_pages.values()
+        )
+        pages, index = self.pages[extractor], self.index[extractor]
+        while pages and pages[0][0] < last:
+            page, identifiers, position = pages.popleft()
+            self.forget(index, page, identifiers)
+            self.extractors[extractor] = position
+
+    def forget(self, index, page, identifiers):
+        for identifier in identifiers:
+            if index.get(identifier) == page:
+                del index[identifier]
+
+    def write(self):
+        # Written aside then moved, a crash never leaves a partial file
+        with open(f"{self.path}.tmp", "w") as checkpoint:
+            json.dump(
+                {"extractors": self.extractors, "loaders": self.loaders},
+                checkpoint,
+                cls=DjangoJSONEncoder,
+            )
+        os.replace(f"{self.path}.tmp", self.path)
+        self.written = time.monotonic()
@@ -1,20 +1,29 @@
 import csv
+import hashlib
 import io
 import json
 import logging
+import struct
+import threading
 import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from copy import deepcopy
+from time import sleep
 from urllib.parse import urljoin
 
+import requests
 from bonobo.config import Configurable, Option, Service
 from bonobo.config.processors import ContextProcessor
 from bonobo.util.objects import ValueHolder
 from django.conf import settings
 from django.contrib.gis.db.models import Collect
 from django.contrib.gis.geos import GEOSGeometry, LineString, Point, Polygon  # noqa
-from django.contrib.gis.geos.prototypes.io import wkt_w
+from django.contrib.gis.geos.prototypes.io import wkb_r, wkb_reader_read, wkb_w
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Count, FloatField, Sum
+from django.db import connection
+from django.db.models import Count, FloatField, QuerySet, Sum
+from geostore.models import Feature
 
 try:
     from django.db.models.fields.json import KeyTextTransform
@@ -23,9 +32,146 @@ except ImportError:
 
 from django.db.models.functions import Cast
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
 logger = logging.getLogger(__name__)
 
 
+class BulkTransform(Configurable):
+    """
+    Base class of transformations working on windows of records. Records are
+    buffered and processed `window_length` at a time by `process_window()`,
+    the last window is processed at the end of the pipeline.
+
+    Options:
+      `window_length` number of records processed at once
+
+    Return:
+      list(identifier, record) for each record of the window
+    """
+
+    window_length = Option(int, default=1000)
+
+    @ContextProcessor
+    def buffer(self, context, *args, **kwargs):
+        buffer = yield ValueHolder([])
+
+        if len(buffer):
+            # Final call if there is content in buffer
+            for row in self.process_window(buffer.get(), **kwargs):
+                context.send(*row)
+
+    def __call__(self, buffer, identifier, record, *args, **kwargs):
+        buffer.append((identifier, record))
+
+        if len(buffer) >= self.window_length:
+            window = buffer.get()
+            buffer.set([])
+            yield from self.process_window(window, **kwargs)
+
+    def process_window(self, window, **kwargs):
+        """
+        Override point of subclasses, processing a window of records.
+
+        Return:
+          iterable of (identifier, record)
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} must implement process_window()"
+        )
+
+
+# Batches
+
+
+class Batch(Configurable):
+    """
+    Group records in batches, so that following batch-aware nodes process a
+    list of records by call. The last batch is sent at the end of the
+    pipeline.
+
+    Options:
+      `size` number of records by batch
+
+    Return:
+      list((identifier, record))
+    """
+
+    size = Option(int, default=1000)
+
+    @ContextProcessor
+    def buffer(self, context, *args, **kwargs):
+        buffer = yield ValueHolder([])
+
+        if len(buffer):
+            context.send(buffer.get())
+
+    def __call__(self, buffer, identifier, record, *args, **kwargs):
+        buffer.append((identifier, record))
+
+        if len(buffer) >= self.size:
+            batch = buffer.get()
+            buffer.set([])
+            return batch
+
+
+class Unbatch(Configurable):
+    """
+    Split batches back into records.
+
+    Return:
+      list(identifier, record) for each record of the batch
+    """
+
+    def __call__(self, batch, *args, **kwargs):
+        yield from batch
+
+
+class BatchTransform(Configurable):
+    """
+    Base class of batch-aware transformations, receiving batches of records
+    from `Batch` and sending the processed batch.
+
+    Return:
+      list((identifier, record))
+    """
+
+    def __call__(self, batch, *args, **kwargs):
+        return self.process_batch(batch, **kwargs)
+
+    def process_batch(self, batch, **kwargs):
+        """
+        Override point of subclasses, processing a batch of records.
+
+        Return:
+          list((identifier, record))
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} must implement process_batch()"
+        )
+
+
+class Batched(BatchTransform):
+    """
+    Process batches with a bulk node, each batch being one of its windows, so
+    that set-based nodes run their queries once by batch.
+
+    Options:
+      `node` BulkTransform node
+
+    Return:
+      list((identifier, record))
+    """
+
+    node = Option(None, required=True, positional=True)
+
+    def process_batch(self, batch, **kwargs):
+        return list(self.node.process_window(batch, **kwargs))
+
+
 class CsvDictReader(Configurable):
     """
     Extract lines from a CSV file. The file must be a BytesIO compatible object.
@@ -175,6 +321,24 @@ class ExcludeAttributes(Configurable):
         yield identifier, record
 
 
+class BatchExcludeAttributes(BatchTransform, ExcludeAttributes):
+    """
+    Same as ExcludeAttributes, on batches of records.
+
+    Options:
+      `excluded` list of excluded properties
+
+    Return:
+      list((identifier, record))
+    """
+
+    def process_batch(self, batch, **kwargs):
+        for _, record in batch:
+            for k in self.excluded:
+                record.pop(k, None)
+        return batch
+
+
 class FilterAttributes(Configurable):
     """
     Filter attributes from a record from a attributes whitelist.
@@ -193,6 +357,25 @@ class FilterAttributes(Configurable):
         yield identifier, record
 
 
+class BatchFilterAttributes(BatchTransform, FilterAttributes):
+    """
+    Same as FilterAttributes, on batches of records.
+
+    Options:
+      `included` list of allowed properties
+
+    Return:
+      list((identifier, record))
+    """
+
+    def process_batch(self, batch, **kwargs):
+        included = set(self.included)
+        return [
+            (identifier, {k: v for k, v in record.items() if k in included})
+            for identifier, record in batch
+        ]
+
+
 class FilterByProperties(Configurable):
     """
     Filter attribute from a function.
@@ -266,6 +449,81 @@ class CollectAndSum(Configurable):
         yield identifier, features.aggregate(**aggregates)
 
 
+class BulkCollectAndSum(BulkTransform, CollectAndSum):
+    """
+    Same as CollectAndSum, but aggregates a whole window of records in one
+    grouped query.
+
+    Features can be a QuerySet or an iterable of feature ids.
+
+    Options:
+      `geom` the geometry field from features
+      `sum_fields` fields to Sum()
+      `window_length` number of records aggregated by each query
+
+    Return:
+      list(identifier, record)
+    """
+
+    def process_window(self, window, **kwargs):
+        mapping, args = [], []
+        keys, ids = [], []
+        for key, (identifier, features) in enumerate(window):
+            if isinstance(features, QuerySet):
+                query = features.order_by().values("pk").query
+                sql, params = query.sql_with_params()
+                mapping.append(
+                    f"SELECT {key}, features_{key}.* FROM ({sql}) AS features_{key}"
+                )
+                args.extend(params)
+            else:
+                features = list(features)
+                keys.extend([key] * len(features))
+                ids.extend(features)
+        if ids or not mapping:
+            mapping.append("SELECT * FROM unnest(%s::INT[], %s::INT[])")
+            args.extend([keys, ids])
+
+        sums = ""
+        for field in self.sum_fields.values():
+            sums += ", SUM((feature.properties->>%s)::float)"
+            args.append(field)
+
+        sql_query = f"""
+            WITH mapping(key, id) AS (
+                {" UNION ALL ".join(mapping)}
+            )
+            SELECT
+                mapping.key,
+                ST_AsEWKB(ST_Collect(feature.{Feature._meta.get_field(self.geom).column})),
+                array_agg(DISTINCT feature.id),
+                count(feature.id)
+                {sums}
+            FROM
+                mapping
+                JOIN {Feature._meta.db_table} AS feature ON feature.id = mapping.id
+            GROUP BY
+                mapping.key
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql_query, args)
+            aggregates = {key: values for key, *values in cursor.fetchall()}
+
+        for key, (identifier, features) in enumerate(window):
+            yield identifier, self.get_aggregates(
+                *aggregates.get(key, (None, [], 0) + (None,) * len(self.sum_fields))
+            )
+
+    def get_aggregates(self, geom, ids, point_count, *sums):
+        return {
+            self.geom: GEOSGeometry(memoryview(geom)) if geom else None,
+            "ids": ids,
+            "point_count": point_count,
+            **dict(zip(self.sum_fields.keys(), sums)),
+        }
+
+
 class MapProperties(Configurable):
     """
     Run method on properties. Can be used to run a map() method.
@@ -283,14 +541,34 @@ class MapProperties(Configurable):
         yield identifier, self.map_function(record)
 
 
+class BatchMapProperties(BatchTransform, MapProperties):
+    """
+    Same as MapProperties, on batches of records.
+
+    Options:
+      `map_function` the function that will be executed on record
+
+    Return:
+      list((identifier, record))
+    """
+
+    def process_batch(self, batch, **kwargs):
+        map_function = self.map_function
+        return [(identifier, map_function(record)) for identifier, record in batch]
+
+
 class AttributeToGeometry(Configurable):
     """
     Pop an an attribute and transform to a GEOSGeometry object, that can be
     manipulated as a real geometry.
 
+    The attribute can be any format accepted by GEOSGeometry, or WKB bytes.
+
     Options:
       `attribute` Attribute containing the geometry
       `geom` The destination geom field
+      `validate` only repair invalid geometries, instead of all of them
+      `cache_size` number of validity checks cached by input hash, when validating
 
     Return:
       list(identifier, record)
@@ -298,19 +576,63 @@ class AttributeToGeometry(Configurable):
 
     attribute = Option(str, required=True)
     geom = Option(str, required=True)
+    validate = Option(bool, required=False, default=False)
+    cache_size = Option(int, required=False, default=10000)
+
+    checked = 0
+    repaired = 0
+    _validity = None
+
+    @ContextProcessor
+    def report(self, context, *args, **kwargs):
+        yield
+        if self.validate:
+            logger.info(f"{self.repaired} geometries repaired on {self.checked}")
 
     def __call__(self, identifier, record):
         record[self.geom] = self.get_geosgeometry(record.pop(self.attribute))
         yield identifier, record
 
     def get_geosgeometry(self, attribute):
+        if (
+            isinstance(attribute, (bytes, bytearray))
+            and attribute[:1] in WKB_BYTEORDERS
+        ):
+            attribute = memoryview(attribute)
+
         geom = GEOSGeometry(attribute)
         if geom.geom_type in ["Polygon", "MultiPolygon"]:
-            geom = geom.buffer(0)
+            if self.needs_repair(attribute, geom):
+                geom = geom.buffer(0)
         elif geom.geom_type in ["LineString", "MultiLineString"]:
-            geom = geom.simplify(0)
+            if self.needs_repair(attribute, geom):
+                geom = geom.simplify(0)
         return geom
 
+    def needs_repair(self, attribute, geom):
+        if not self.validate:
+            return True
+
+        if self._validity is None:
+            self._validity = OrderedDict()
+
+        key = hashlib.blake2b(
+            attribute.encode() if isinstance(attribute, str) else attribute
+        ).digest()
+        valid = self._validity.get(key)
+        if valid is None:
+            valid = geom.valid
+            self._validity[key] = valid
+            if len(self._validity) > self.cache_size:
+                self._validity.popitem(last=False)
+
+        self.checked += 1
+        self.repaired += not valid
+        return not valid
+
+
+WKB_BYTEORDERS = (b"\x00", b"\x01")
+
 
 class AttributesToPointGeometry(Configurable):
     """
@@ -342,6 +664,82 @@ class AttributesToPointGeometry(Configurable):
         return identifier, record
 
 
+class BulkAttributesToPointGeometry(BulkTransform, AttributesToPointGeometry):
+    """
+    Same as AttributesToPointGeometry, but by window of records: coordinates are
+    cast at once with numpy and packed into a single EWKB buffer. Each point
+    is still a GEOS geometry of its own, read from its slice of the buffer.
+    Coordinates that can't be cast raise ValueError, as AttributesToPointGeometry
+    does, unless `drop_invalid`.
+
+    Options:
+      `window_length` number of records processed at once
+      `drop_invalid` log and drop records whose coordinates can't be cast
+
+    Return:
+      list(identifier, record)
+    """
+
+    drop_invalid = Option(bool, required=False, default=False)
+
+    def __init__(self, *args, **kwargs):
+        if np is None:
+            raise ImportError("numpy is required by BulkAttributesToPointGeometry")
+        super().__init__(*args, **kwargs)
+
+    def process_window(self, window, **kwargs):
+        coordinates, valid = self.get_coordinates(window)
+
+        dtype = np.dtype(
+            [
+                ("byteorder", "u1"),
+                ("type", "<u4"),
+                ("srid", "<u4"),
+                ("x", "<f8"),
+                ("y", "<f8"),
+            ]
+        )
+        points = np.empty(len(window), dtype=dtype)
+        points["byteorder"] = 1
+        points["type"] = 0x20000001  # Point with SRID
+        points["srid"] = self.srid
+        points["x"] = coordinates[:, 0]
+        points["y"] = coordinates[:, 1]
+        buffer, size = points.tobytes(), dtype.itemsize
+
+        reader = wkb_r().ptr
+        for i, (identifier, record) in enumerate(window):
+            if valid[i]:
+                ewkb = buffer[i * size : (i + 1) * size]  # noqa: E203
+                point = wkb_reader_read(reader, ewkb, size)
+                record[self.geom] = GEOSGeometry(point)
+                yield identifier, record
+
+    def get_coordinates(self, window):
+        values = [(record.pop(self.x), record.pop(self.y)) for _, record in window]
+        valid = np.ones(len(values), dtype=bool)
+
+        try:
+            coordinates = np.array(values, dtype=object).reshape(-1, 2).astype(float)
+        except (TypeError, ValueError):
+            # Look for the faulty rows
+            coordinates = np.zeros((len(values), 2))
+            for i, (x, y) in enumerate(values):
+                try:
+                    coordinates[i] = float(x), float(y)
+                except (TypeError, ValueError) as e:
+                    if not self.drop_invalid:
+                        raise ValueError(
+                            f'Fails to cast ("{x}", "{y}") to float'
+                        ) from e
+                    valid[i] = False
+                    logger.error(
+                        f'{window[i][0]}: Fails to cast ("{x}", "{y}") to float'
+                    )
+
+        return coordinates, valid
+
+
 class GeometryToJson(Configurable):
     """
     Transform a GEOSGeometry object from record to a json object which can be simplified.
@@ -349,7 +747,8 @@ class GeometryToJson(Configurable):
     Options:
       `source` source record attribute.
       `destination` destination attribute where the json will be set.
-      `simplify` simplification factor from 0.0 to 1.0.
+      `simplify` simplification factor from 0.0 to 1.0, 0.0 skips simplification.
+      `precision` number of decimals coordinates are rounded to.
 
     Return:
       list(identifier, record)
@@ -358,14 +757,154 @@ class GeometryToJson(Configurable):
     source = Option(str, required=True, positional=True)
     destination = Option(str, required=True, positional=True)
     simplify = Option(float, required=True, positional=True, default=0.0)
+    precision = Option(int, required=False, default=None)
 
     def __call__(self, identifier, properties, *args, **kwargs):
-        properties[self.destination] = json.loads(
-            properties[self.source].simplify(self.simplify).geojson
-        )
+        geometry = properties[self.source]
+        if self.simplify:
+            geometry = geometry.simplify(self.simplify)
+        properties[self.destination] = geometry_to_geojson(geometry, self.precision)
         return identifier, properties
 
 
+class BatchGeometryToJson(BatchTransform, GeometryToJson):
+    """
+    Same as GeometryToJson, on batches of records.
+
+    Options:
+      `source` source record attribute.
+      `destination` destination attribute where the json will be set.
+      `simplify` simplification factor from 0.0 to 1.0, 0.0 skips simplification.
+      `precision` number of decimals coordinates are rounded to.
+
+    Return:
+      list((identifier, record))
+    """
+
+    def process_batch(self, batch, **kwargs):
+        for _, properties in batch:
+            geometry = properties[self.source]
+            if self.simplify:
+                geometry = geometry.simplify(self.simplify)
+            properties[self.destination] = geometry_to_geojson(geometry, self.precision)
+        return batch
+
+
+WKB_GEOMETRY_TYPES = {
+    1: "Point",
+    2: "LineString",
+    3: "Polygon",
+    4: "MultiPoint",
+    5: "MultiLineString",
+    6: "MultiPolygon",
+    7: "GeometryCollection",
+}
+
+
+def geometry_to_geojson(geometry, precision=None):
+    """
+    Get the GeoJSON geometry dict of a GEOSGeometry. Coordinates are read
+    directly from the WKB representation, without any string serialization.
+
+    Return:
+      dict GeoJSON geometry
+    """
+    if geometry.empty:
+        if geometry.geom_type == "GeometryCollection":
+            return {"type": geometry.geom_type, "geometries": []}
+        return {"type": geometry.geom_type, "coordinates": []}
+
+    wkb = wkb_w(dim=3 if geometry.hasz else 2).write(geometry)
+    return _read_wkb_geojson(wkb, 0, precision)[0]
+
+
+def _read_wkb_geojson(wkb, offset, precision):
+    byteorder = "<" if wkb[offset] else ">"
+    (wkb_type,) = struct.unpack_from(f"{byteorder}I", wkb, offset + 1)
+    geom_type = WKB_GEOMETRY_TYPES[wkb_type & 0xFF]
+    dim = 3 if wkb_type & 0x80000000 else 2
+    offset += 5
+
+    if geom_type == "Point":
+        coordinates, offset = _read_wkb_coordinates(
+            wkb, offset, 1, dim, byteorder, precision
+        )
+        # Empty points are written as NaN coordinates
+        coordinates = coordinates[0] if coordinates[0][0] == coordinates[0][0] else []
+    elif geom_type == "LineString":
+        (count,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+        coordinates, offset = _read_wkb_coordinates(
+            wkb, offset + 4, count, dim, byteorder, precision
+        )
+    elif geom_type == "Polygon":
+        (rings,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+        offset += 4
+        coordinates = []
+        for _ in range(rings):
+            (count,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+            ring, offset = _read_wkb_coordinates(
+                wkb, offset + 4, count, dim, byteorder, precision
+            )
+            coordinates.append(ring)
+    else:
+        (count,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+        offset += 4
+        members = []
+        for _ in range(count):
+            member, offset = _read_wkb_geojson(wkb, offset, precision)
+            members.append(member)
+        if geom_type == "GeometryCollection":
+            return {"type": geom_type, "geometries": members}, offset
+        coordinates = [member["coordinates"] for member in members]
+
+    return {"type": geom_type, "coordinates": coordinates}, offset
+
+
+def _read_wkb_coordinates(wkb, offset, count, dim, byteorder, precision):
+    values = struct.unpack_from(f"{byteorder}{count * dim}d", wkb, offset)
+    if precision is not None:
+        values = [round(value, precision) for value in values]
+    values = iter(values)
+    return list(map(list, zip(*[values] * dim))), offset + count * dim * 8
+
+
+def wkb_coordinate_ranges(wkb, offset=0):
+    """
+    Find where coordinates are stored in a WKB buffer.
+
+    Return:
+      list of (offset, count, dim) of each coordinates sequence
+      int offset of the end of the geometry
+    """
+    byteorder = "<" if wkb[offset] else ">"
+    (wkb_type,) = struct.unpack_from(f"{byteorder}I", wkb, offset + 1)
+    geom_type = WKB_GEOMETRY_TYPES[wkb_type & 0xFF]
+    dim = 3 if wkb_type & 0x80000000 else 2
+    offset += 5
+
+    ranges = []
+    if geom_type == "Point":
+        ranges.append((offset, 1, dim))
+        offset += dim * 8
+    elif geom_type in ("LineString", "Polygon"):
+        rings = 1
+        if geom_type == "Polygon":
+            (rings,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+            offset += 4
+        for _ in range(rings):
+            (count,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+            ranges.append((offset + 4, count, dim))
+            offset += 4 + count * dim * 8
+    else:
+        (count,) = struct.unpack_from(f"{byteorder}I", wkb, offset)
+        offset += 4
+        for _ in range(count):
+            member, offset = wkb_coordinate_ranges(wkb, offset)
+            ranges += member
+
+    return ranges, offset
+
+
 class GeometryToCentroid(Configurable):
     """
     Get a geometry centroid an put it in a record attribute.
@@ -386,6 +925,24 @@ class GeometryToCentroid(Configurable):
         return identifier, properties
 
 
+class BatchGeometryToCentroid(BatchTransform, GeometryToCentroid):
+    """
+    Same as GeometryToCentroid, on batches of records.
+
+    Options:
+      `geom` geom field where the original geometry is.
+      `geom_dest` destination attribute when the centroid will be placed.
+
+    Return:
+      list((identifier, record))
+    """
+
+    def process_batch(self, batch, **kwargs):
+        for _, properties in batch:
+            properties[self.geom_dest] = properties[self.geom].centroid
+        return batch
+
+
 class Geometry3Dto2D(Configurable):
     """
     Ensure a geometry is 2D.
@@ -402,25 +959,176 @@ class Geometry3Dto2D(Configurable):
     geom_dest = Option(str, required=True, positional=True)
 
     def __call__(self, identifier, properties, *args, **kwargs):
-        geom = properties[self.geom]
-        wkt = wkt_w(dim=2).write(geom).decode()
-        properties[self.geom_dest] = GEOSGeometry(wkt, srid=geom.srid)
+        properties[self.geom_dest] = force_2d([properties[self.geom]])[0]
         yield identifier, properties
 
 
+class BatchGeometry3Dto2D(BatchTransform, Geometry3Dto2D):
+    """
+    Same as Geometry3Dto2D, on batches of records, all geometries of a batch
+    being rewritten by a single force_2d() call.
+
+    Options:
+      `geom` geom field where the original geometry is.
+      `geom_dest` destination attribute when the 2D geometry will be placed.
+
+    Return:
+      list((identifier, record))
+    """
+
+    def process_batch(self, batch, **kwargs):
+        geometries = force_2d([properties[self.geom] for _, properties in batch])
+        for (_, properties), geometry in zip(batch, geometries):
+            properties[self.geom_dest] = geometry
+        return batch
+
+
+def force_2d(geometries):
+    """
+    Drop the Z dimension of a list of geometries. Geometries are rewritten
+    through a single binary WKB writer, 2D geometries are only cloned.
+
+    Return:
+      list(geometry)
+    """
+    writer = wkb_w(dim=2)
+    return [
+        GEOSGeometry(writer.write(geom), srid=geom.srid) if geom.hasz else geom.clone()
+        for geom in geometries
+    ]
+
+
 # Helpers
 
 
+class CopyOnWriteRecord(dict):
+    """
+    Shallow copy of a record, sharing its values with the original record.
+
+    Mutable containers (list, dict, set) are deep copied the first time they
+    are read, by item access, iteration of values or items, unpacking,
+    `dict()` or `copy()`, so in place modifications never reach the original
+    record. Geometries are shared and must be replaced rather than modified
+    in place, as all nodes of this package do. In place modifications of the
+    original record are not isolated, so each branch of a pipeline split
+    should get its own copy.
+    """
+
+    __slots__ = ("_shared",)
+
+    MUTABLE_TYPES = (list, dict, set, bytearray)
+
+    def __init__(self, record=()):
+        super().__init__(record)
+        self._shared = {
+            k for k, v in super().items() if isinstance(v, self.MUTABLE_TYPES)
+        }
+        if isinstance(record, CopyOnWriteRecord):
+            # Values owned by the original record are now shared too
+            record._shared |= self._shared
+
+    def _own(self, key):
+        if key in self._shared:
+            self._shared.discard(key)
+            super().__setitem__(key, deepcopy(super().__getitem__(key)))
+
+    def _own_all(self):
+        for key in list(self._shared):
+            self._own(key)
+
+    def __getitem__(self, key):
+        self._own(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        super().__delitem__(key)
+
+    def get(self, key, default=None):
+        self._own(key)
+        return super().get(key, default)
+
+    def pop(self, key, *args):
+        self._own(key)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        key, value = super().popitem()
+        if key in self._shared:
+            self._shared.discard(key)
+            value = deepcopy(value)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        self._own(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        self._shared.difference_update(other)
+        super().update(other)
+
+    def clear(self):
+        self._shared.clear()
+        super().clear()
+
+    def values(self):
+        self._own_all()
+        return super().values()
+
+    def items(self):
+        self._own_all()
+        return super().items()
+
+    def __iter__(self):
+        # Overridden, dict(), ** unpacking and update() read values through
+        # __getitem__ instead of the dict storage
+        return super().__iter__()
+
+    def __or__(self, other):
+        record = CopyOnWriteRecord(self)
+        record.update(other)
+        return record
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def copy(self):
+        return CopyOnWriteRecord(self)
+
+    def __reduce__(self):
+        return CopyOnWriteRecord, (dict(super().items()),)
+
+
 class CopyOnPipelineSplit(Configurable):
     """
     Deep copy identifier and record objects.
 
+    With `copy_on_write`, the record is a CopyOnWriteRecord sharing
+    unmodified values with the original record, much cheaper on large
+    geometries. The other branches must then never modify the original
+    record in place, geometries included (`transform(clone=False)`, setting
+    `srid`): they run in other threads.
+
+    Options:
+      `copy_on_write` copy-on-write copy instead of a deep copy
+
     Return:
       list(identifier, record)
     """
 
+    copy_on_write = Option(bool, required=False, default=False)
+
     def __call__(self, identifier, properties):
-        yield deepcopy(identifier), deepcopy(properties)
+        if self.copy_on_write:
+            yield deepcopy(identifier), CopyOnWriteRecord(properties)
+        else:
+            yield deepcopy(identifier), deepcopy(properties)
 
 
 class DropIdentifier(Configurable):
@@ -473,6 +1181,9 @@ class IsochroneCalculation(Configurable):
       `buckets` Number of isochrone zones
       `vehicle` Kind of used vahicle (car, bike, hike, …)
       `reverse_flow` The orientation of the flow (from point to polygon, or polygon to point)
+      `retries` Number of retries on server errors and timeouts
+      `backoff` Seconds to wait before the first retry, doubled on each retry
+      `timeout` Seconds to wait for the response
 
     Return:
       identifier, record
@@ -484,12 +1195,16 @@ class IsochroneCalculation(Configurable):
     buckets = Option(int, positional=True, default=3)
     vehicle = Option(str, positional=True, default="car")
     reverse_flow = Option(bool, positional=True, default=False)
+    retries = Option(int, required=False, default=3)
+    backoff = Option(float, required=False, default=1.0)
+    timeout = Option(float, required=False, default=None)
 
     http = Service("http")
 
     def __call__(self, identifier, properties, http, *args, **kwargs):
-        point = properties[self.geom]
+        yield from self.get_isochrones(identifier, properties[self.geom], http)
 
+    def get_isochrones(self, identifier, point, http):
         payload = {
             "time_limit": self.time_limit,
             "distance_limit": self.distance_limit,
@@ -500,20 +1215,110 @@ class IsochroneCalculation(Configurable):
         }
 
         isochrone_url = urljoin(settings.GRAPHHOPPER, "isochrone")
-        response = http.get(isochrone_url, params=payload)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = http.get(isochrone_url, params=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning(f"{identifier}: isochrone request failed {e}")
+                continue
+            if response.ok or response.status_code < 500:
+                break
+            logger.warning(
+                f"{identifier}: isochrone request got {response.status_code}"
+            )
+        else:
+            logger.error(f"{identifier}: isochrone request failed {attempt + 1} times")
+            return []
+
+        if not response.ok:
+            logger.error(f"Error in isochrone response {response.content}")
+            return []
 
         try:
             response = response.json()
-            for isochrone in response.get("polygons", []):
-                properties = {
+        except json.JSONDecodeError:
+            logger.error(f"Error decoding isochrone response {response.content}")
+            return []
+
+        return [
+            (
+                identifier,
+                {
                     self.geom: GEOSGeometry(json.dumps(isochrone.get("geometry"))),
                     **isochrone.get("properties", {}),
-                }
+                },
+            )
+            for isochrone in response.get("polygons", [])
+        ]
 
-                yield identifier, properties
 
-        except json.JSONDecodeError:
-            logger.error(f"Error decoding isochrone response {response.content}")
+class ConcurrentIsochroneCalculation(IsochroneCalculation):
+    """
+    Same as IsochroneCalculation, but keeps up to `concurrency` requests in
+    flight in a thread pool. Isochrones of a record are emitted together as
+    soon as its request completes, so the order of records is not preserved.
+
+    A requests.Session `http` service is not thread-safe, each thread of the
+    pool uses its own copy. Failures are logged with the identifier of their
+    record.
+
+    Options:
+      `concurrency` Number of concurrent requests
+
+    Return:
+      identifier, record
+    """
+
+    concurrency = Option(int, required=False, default=8)
+
+    @ContextProcessor
+    def executor(self, context, *args, **kwargs):
+        self._sessions = threading.local()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            yield executor
+
+    @ContextProcessor
+    def pending(self, context, *args, **kwargs):
+        pending = yield {}
+
+        for row in self.get_results(pending, as_completed(pending)):
+            context.send(*row)
+
+    def __call__(
+        self, executor, pending, identifier, properties, http, *args, **kwargs
+    ):
+        future = executor.submit(
+            self.get_thread_isochrones, identifier, properties[self.geom], http
+        )
+        pending[future] = identifier
+
+        if len(pending) >= self.concurrency:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in pending if future.done()]
+
+        yield from self.get_results(pending, done)
+
+    def get_thread_isochrones(self, identifier, point, http):
+        if isinstance(http, requests.Session):
+            if not hasattr(self._sessions, "http"):
+                self._sessions.http = deepcopy(http)
+            http = self._sessions.http
+        return self.get_isochrones(identifier, point, http)
+
+    def get_results(self, pending, futures):
+        """
+        Isochrones of completed `futures`, removed from `pending`, a failed
+        request does not stop the others
+        """
+        for future in futures:
+            identifier = pending.pop(future)
+            try:
+                yield from future.result()
+            except Exception as e:
+                logger.error(f"{identifier}: isochrone calculation failed {e}")
 
 
 class IsochroneSubstraction(Configurable):
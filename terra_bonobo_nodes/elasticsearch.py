@@ -13,12 +13,18 @@ class ESExtract(Configurable):
     """
     Extract records from elasticsearch endpoint
 
+    With a `checkpoint`, documents are paged with search_after, sorted by
+    `sort_field`, a rerun resuming after the last page loaded.
+
     Services:
       `es` ElasticSearch-dsl object
 
     Options:
       `index_name` Index name where to make the query
       `body` ElasticSearch query, default: match_all
+      `checkpoint` Checkpoint shared with loaders
+      `sort_field` keyword field unique by document, sorting pages of a
+        checkpointed extraction
 
     Return:
       identifier, record
@@ -26,11 +32,20 @@ class ESExtract(Configurable):
 
     index_name = Option(str, required=False, positional=True)
     body = Option(dict, positional=True, default={"query": {"match_all": {}}})
+    checkpoint = Option(None, required=False, default=None)
+    sort_field = Option(str, default="_feature_id")
+    size = 5000
 
     es = Service("es")
 
     def __call__(self, es):
-        page = es.search(index=self.index_name, body=self.body, scroll="2m", size=5000)
+        if self.checkpoint is not None:
+            yield from self.extract_from_checkpoint(es)
+            return
+
+        page = es.search(
+            index=self.index_name, body=self.body, scroll="2m", size=self.size
+        )
 
         sid = page["_scroll_id"]
         scroll_size = page["hits"]["total"]["value"]
@@ -43,6 +58,27 @@ class ESExtract(Configurable):
             sid = page["_scroll_id"]
             scroll_size = len(page["hits"]["hits"])
 
+    def extract_from_checkpoint(self, es):
+        name = type(self).__name__
+        position = self.checkpoint.resume(name)
+        body = {**self.body, "sort": [{self.sort_field: "asc"}]}
+
+        while True:
+            if position is not None:
+                body["search_after"] = position
+            hits = es.search(index=self.index_name, body=body, size=self.size)["hits"][
+                "hits"
+            ]
+            if not hits:
+                break
+
+            position = hits[-1]["sort"]
+            self.checkpoint.extracted(name, [hit["_id"] for hit in hits], position)
+            for hit in hits:
+                yield hit["_id"], hit["_source"]
+
+        self.checkpoint.exhausted(name)
+
 
 class LoadInES(Configurable):
     """
@@ -50,6 +86,8 @@ class LoadInES(Configurable):
 
     Options:
       `index` index name where to push the records
+      `checkpoint` Checkpoint shared with extractors, indexed documents are
+        recorded, documents failing to index are not
 
     Services:
       `es` ElasticSearch-dsl object
@@ -59,17 +97,22 @@ class LoadInES(Configurable):
     """
 
     index = Option(str, required=True, positional=True)
+    checkpoint = Option(None, required=False, default=None)
     length = 1000
 
     es = Service("es")
 
     @ContextProcessor
     def buffer(self, context, *args, es, **kwargs):
+        if self.checkpoint is not None:
+            self.checkpoint.register(type(self).__name__)
         buffer = yield ValueHolder([])
 
         if len(buffer):
             # Final call if there is content in buffer
-            self.__call__(buffer, END, END, es)
+            LoadInES.__call__(self, buffer, END, END, es)
+        if self.checkpoint is not None:
+            self.checkpoint.unregister(type(self).__name__, not context.killed)
 
     def __call__(self, buffer, identifier, properties, es, *args, **kwargs):
         is_final = identifier == END and properties == END
@@ -78,11 +121,23 @@ class LoadInES(Configurable):
             buffer.append(self._get_formated_record(identifier, properties))
 
         if len(buffer) >= self.length or is_final:
-            try:
-                helpers.bulk(es, buffer.get(), stats_only=True)
-            except helpers.BulkIndexError as e:
-                logger.error(f"Indexing error: {e}")
-
+            # Every chunk is sent, whatever the errors of the previous ones
+            _, errors = helpers.bulk(es, buffer.get(), raise_on_error=False)
+            failed = {str(next(iter(error.values()))["_id"]) for error in errors}
+            if errors:
+                logger.error(
+                    f"Indexing error: {len(errors)} documents failed, first {errors[0]}"
+                )
+
+            if self.checkpoint is not None:
+                self.checkpoint.committed(
+                    type(self).__name__,
+                    [
+                        action["_id"]
+                        for action in buffer.get()
+                        if str(action["_id"]) not in failed
+                    ],
+                )
             buffer.set([])
 
         return NOT_MODIFIED
@@ -0,0 +1,526 @@
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from array import array
+from collections import defaultdict
+from functools import partial, wraps
+from types import GeneratorType
+
+from bonobo.config import Configurable
+from bonobo.constants import NOT_MODIFIED
+from django.db import DatabaseError, transaction
+from django.db.backends.utils import CursorWrapper
+from urllib3.connectionpool import HTTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Node currently measured by the running thread
+_state = threading.local()
+
+INSTRUMENTED_METHODS = ("__call__", "process_window")
+
+
+class NodeMetrics:
+    """
+    Measures of a node: calls, latency of each call (including iteration of
+    generated rows), records in and out, DB queries, HTTP requests made and
+    bytes received from HTTP responses, as given by their Content-Length.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.records_in = 0
+        self.records_out = 0
+        self.durations = array("d")
+        self.queries = 0
+        self.http_requests = 0
+        self.bytes = 0
+
+    @property
+    def seconds(self):
+        return sum(self.durations)
+
+    def percentile(self, percent):
+        if not self.durations:
+            return None
+        durations = sorted(self.durations)
+        return durations[min(len(durations) - 1, int(len(durations) * percent / 100))]
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "records_in": self.records_in,
+            "records_out": self.records_out,
+            "seconds": self.seconds,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "queries": self.queries,
+            "http_requests": self.http_requests,
+            "bytes": self.bytes,
+        }
+
+
+class Instrumentation:
+    """
+    Opt-in measures of terra_bonobo_nodes nodes. While entered, `__call__` and
+    `process_window` of every Configurable defined in `modules` are wrapped to
+    record NodeMetrics, exported to `sinks` on exit. Nothing is wrapped out of
+    it, so disabled instrumentation has no overhead.
+
+      with Instrumentation(LoggingSink(), PrometheusSink("etl.prom")):
+          bonobo.run(graph, services=services)
+
+    Options:
+      `sinks` objects whose `export(metrics)` receives the list of NodeMetrics
+      `modules` modules prefixes of instrumented nodes
+      `queries` QueryProfiler profiling SQL statements of nodes, also a sink
+    """
+
+    def __init__(self, *sinks, modules=("terra_bonobo_nodes",), queries=None):
+        self.sinks = sinks + ((queries,) if queries else ())
+        self.modules = tuple(modules)
+        self.queries = queries
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def __enter__(self):
+        for cls in self.get_node_classes():
+            for method in INSTRUMENTED_METHODS:
+                if method in vars(cls):
+                    self.patch(
+                        cls, method, partial(self.wrap, is_call=method == "__call__")
+                    )
+        self.patch(CursorWrapper, "_execute_with_wrappers", _count_queries)
+        if self.queries:
+            self.patch(CursorWrapper, "_execute_with_wrappers", self.queries.install)
+        self.patch(HTTPConnectionPool, "urlopen", _count_http)
+        return self
+
+    def patch(self, cls, name, wrap):
+        original = vars(cls)[name]
+        self._originals.append((cls, name, original))
+        setattr(cls, name, wrap(original))
+
+    def __exit__(self, *exc_info):
+        while self._originals:
+            cls, method, original = self._originals.pop()
+            setattr(cls, method, original)
+        if self.queries:
+            self.queries.uninstall()
+        self.export()
+
+    def get_node_classes(self):
+        classes, subclasses = [], Configurable.__subclasses__()
+        while subclasses:
+            cls = subclasses.pop()
+            subclasses.extend(cls.__subclasses__())
+            if cls.__module__.startswith(self.modules) and cls not in classes:
+                classes.append(cls)
+        return classes
+
+    def get_metrics(self, node):
+        try:
+            return self.metrics[node]
+        except KeyError:
+            with self._lock:
+                name = type(node).__name__
+                names = [metrics.name for metrics in self.metrics.values()]
+                if name in names:
+                    name = f"{name}#{sum(n.split('#')[0] == name for n in names) + 1}"
+                return self.metrics.setdefault(node, NodeMetrics(name))
+
+    def wrap(self, method, is_call):
+        @wraps(method)
+        def instrumented(node, *args, **kwargs):
+            if getattr(_state, "metrics", None) is not None:
+                # Nested call, measured by the outer one
+                return method(node, *args, **kwargs)
+
+            metrics = self.get_metrics(node)
+            if is_call:
+                metrics.calls += 1
+                metrics.records_in += 1
+            with _measure(metrics) as measure:
+                result = method(node, *args, **kwargs)
+
+            if isinstance(result, GeneratorType):
+                return _iterate(measure, result)
+            metrics.durations.append(measure.duration)
+            if result is NOT_MODIFIED or result:
+                metrics.records_out += 1
+            return result
+
+        return instrumented
+
+    def export(self):
+        metrics = list(self.metrics.values())
+        for sink in self.sinks:
+            sink.export(metrics)
+
+
+class _measure:
+    """
+    Attribute time, DB queries and HTTP requests of the running thread to
+    `metrics`.
+    """
+
+    __slots__ = ("metrics", "duration", "previous", "start")
+
+    def __init__(self, metrics, duration=0.0):
+        self.metrics = metrics
+        self.duration = duration
+
+    def __enter__(self):
+        self.previous = getattr(_state, "metrics", None)
+        _state.metrics = self.metrics
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration += time.perf_counter() - self.start
+        _state.metrics = self.previous
+
+
+def _iterate(measure, generator):
+    try:
+        while True:
+            with measure:
+                try:
+                    row = next(generator)
+                except StopIteration:
+                    return
+            measure.metrics.records_out += 1
+            yield row
+    finally:
+        measure.metrics.durations.append(measure.duration)
+
+
+def _count_queries(execute_with_wrappers):
+    @wraps(execute_with_wrappers)
+    def instrumented(*args, **kwargs):
+        metrics = getattr(_state, "metrics", None)
+        if metrics is not None:
+            metrics.queries += 1
+        return execute_with_wrappers(*args, **kwargs)
+
+    return instrumented
+
+
+def fingerprint(sql):
+    """
+    Normalize an SQL statement, replacing literals and parameters by `?` and
+    lists of them by `(...)`, so that statements differing only by their
+    values share a fingerprint.
+    """
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%s|%\(\w+\)s"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"ARRAY\[\s*\?(?:\s*,\s*\?)*\s*\]", re.IGNORECASE), "ARRAY[...]"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+class Statement:
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.slow = 0
+        self.explained = 0
+        self.plans = []
+
+
+class QueryProfiler:
+    """
+    Profile SQL statements issued by nodes, through Django execute wrappers
+    installed on each connection used while instrumented: statements are
+    counted and timed by node and fingerprint, a fingerprint executed at
+    least `n_plus_one` times by a node is reported as a N+1 pattern, and
+    sampled slow SELECT statements are explained. As a sink, it logs its
+    report.
+
+      with Instrumentation(queries=QueryProfiler(slow=0.5, explain=0.1)):
+          bonobo.run(graph, services=services)
+
+    Options:
+      `slow` duration in seconds from which a statement is slow
+      `explain` ratio of slow statements run again with EXPLAIN (ANALYZE, BUFFERS)
+      `explain_limit` maximum statements explained by fingerprint
+      `n_plus_one` executions count from which a statement is a N+1 pattern
+    """
+
+    EXPLAINABLE = re.compile(r"\s*(SELECT|WITH)\b", re.IGNORECASE)
+    WRITING = re.compile(r"\b(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+    def __init__(self, slow=0.1, explain=0, explain_limit=1, n_plus_one=50):
+        self.slow = slow
+        self.explain = explain
+        self.explain_limit = explain_limit
+        self.n_plus_one = n_plus_one
+        self.statements = defaultdict(dict)
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def install(self, execute_with_wrappers):
+        @wraps(execute_with_wrappers)
+        def instrumented(cursor, *args, **kwargs):
+            if self not in cursor.db.execute_wrappers:
+                cursor.db.execute_wrappers.append(self)
+                with self._lock:
+                    self._connections.add(cursor.db)
+            return execute_with_wrappers(cursor, *args, **kwargs)
+
+        return instrumented
+
+    def uninstall(self):
+        with self._lock:
+            for connection in self._connections:
+                if self in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(self)
+            self._connections.clear()
+
+    def __call__(self, execute, sql, params, many, context):
+        metrics = getattr(_state, "metrics", None)
+        if metrics is None:
+            # Out of nodes, or explaining
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        seconds = time.perf_counter() - start
+
+        sql = str(sql)
+        key = fingerprint(sql)
+        statement = self.statements[metrics].get(key)
+        if statement is None:
+            statement = self.statements[metrics].setdefault(key, Statement(sql))
+        statement.count += 1
+        statement.seconds += seconds
+        statement.max_seconds = max(statement.max_seconds, seconds)
+
+        if seconds >= self.slow:
+            statement.slow += 1
+            if (
+                not many
+                and statement.explained < self.explain_limit
+                and random.random() < self.explain
+                and self.EXPLAINABLE.match(sql)
+                and not self.WRITING.search(sql)
+            ):
+                statement.explained += 1
+                plan = self.get_plan(context["connection"], sql, params)
+                if plan:
+                    statement.plans.append(plan)
+        return result
+
+    def get_plan(self, connection, sql, params):
+        previous, _state.metrics = _state.metrics, None
+        try:
+            # In a savepoint, so that a failure does not break the transaction
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                    return "\n".join(row[0] for row in cursor.fetchall())
+        except DatabaseError as e:
+            logger.warning(f"EXPLAIN failed: {e}")
+        finally:
+            _state.metrics = previous
+
+    def get_report(self):
+        """
+        Return:
+          list dict(node, queries, seconds, n_plus_one, slow) by node
+        """
+        report = []
+        for metrics, statements in self.statements.items():
+            statements = sorted(
+                statements.items(), key=lambda item: item[1].seconds, reverse=True
+            )
+            report.append(
+                {
+                    "node": metrics.name,
+                    "calls": metrics.calls,
+                    "queries": sum(s.count for _, s in statements),
+                    "seconds": sum(s.seconds for _, s in statements),
+                    "n_plus_one": [
+                        {"fingerprint": key, "count": s.count, "seconds": s.seconds}
+                        for key, s in statements
+                        if s.count >= self.n_plus_one
+                    ],
+                    "slow": [
+                        {
+                            "fingerprint": key,
+                            "count": s.slow,
+                            "max_seconds": s.max_seconds,
+                            "plans": s.plans,
+                        }
+                        for key, s in statements
+                        if s.slow
+                    ],
+                }
+            )
+        return report
+
+    def export(self, metrics):
+        for node in self.get_report():
+            logger.info(
+                f"{node['node']}: {node['queries']} queries in {node['seconds']:.3f}s"
+                f" for {node['calls']} calls"
+            )
+            for statement in node["n_plus_one"]:
+                logger.warning(
+                    f"{node['node']}: N+1 pattern, {statement['count']} times"
+                    f" in {statement['seconds']:.3f}s: {statement['fingerprint']}"
+                )
+            for statement in node["slow"]:
+                logger.warning(
+                    f"{node['node']}: {statement['count']} slow queries,"
+                    f" up to {statement['max_seconds']:.3f}s:"
+                    f" {statement['fingerprint']}"
+                )
+                for plan in statement["plans"]:
+                    logger.info(f"{node['node']}: {plan}")
+
+
+def _count_http(urlopen):
+    @wraps(urlopen)
+    def instrumented(*args, **kwargs):
+        response = urlopen(*args, **kwargs)
+        metrics = getattr(_state, "metrics", None)
+        if metrics is not None:
+            metrics.http_requests += 1
+            metrics.bytes += int(response.headers.get("Content-Length") or 0)
+        return response
+
+    return instrumented
+
+
+class LoggingSink:
+    """
+    Log one line of measures by node.
+    """
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def export(self, metrics):
+        for node in metrics:
+            values = node.as_dict()
+            latencies = ", ".join(
+                f"{p} {values[p] * 1000:.2f}ms"
+                for p in ("p50", "p90", "p99")
+                if values[p] is not None
+            )
+            logger.log(
+                self.level,
+                f"{node.name}: {node.calls} calls ({latencies}),"
+                f" {node.records_in} records in, {node.records_out} records out,"
+                f" {node.seconds:.3f}s, {node.queries} queries,"
+                f" {node.http_requests} HTTP requests, {node.bytes} bytes",
+            )
+
+
+class PrometheusSink:
+    """
+    Write measures to a file in Prometheus text format, as read by the
+    node_exporter textfile collector.
+
+    Options:
+      `path` file written, replaced at each export
+      `prefix` metrics names prefix
+    """
+
+    COUNTERS = (
+        ("calls", "Node calls"),
+        ("records_in", "Records received by node"),
+        ("records_out", "Records sent by node"),
+        ("queries", "DB queries issued by node"),
+        ("http_requests", "HTTP requests made by node"),
+        ("bytes", "Bytes received from HTTP responses by node"),
+    )
+
+    def __init__(self, path, prefix="bonobo_node"):
+        self.path = path
+        self.prefix = prefix
+
+    def export(self, metrics):
+        lines = []
+        for counter, description in self.COUNTERS:
+            name = f"{self.prefix}_{counter}_total"
+            lines += [f"# HELP {name} {description}.", f"# TYPE {name} counter"]
+            lines += [
+                f'{name}{{node="{node.name}"}} {getattr(node, counter)}'
+                for node in metrics
+            ]
+
+        name = f"{self.prefix}_latency_seconds"
+        lines += [f"# HELP {name} Node calls latency.", f"# TYPE {name} summary"]
+        for node in metrics:
+            for quantile in (50, 90, 99):
+                value = node.percentile(quantile)
+                if value is not None:
+                    lines.append(
+                        f'{name}{{node="{node.name}",quantile="{quantile / 100}"}}'
+                        f" {value}"
+                    )
+            lines.append(f'{name}_sum{{node="{node.name}"}} {node.seconds}')
+            lines.append(f'{name}_count{{node="{node.name}"}} {len(node.durations)}')
+
+        # Written aside then moved, collector never reads a partial file
+        with open(f"{self.path}.tmp", "w") as prom:
+            prom.write("\n".join(lines) + "\n")
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class StatsdSink:
+    """
+    Send measures to a StatsD server over UDP: counters, and latency
+    percentiles as gauges in milliseconds.
+
+    Options:
+      `host` StatsD host
+      `port` StatsD port
+      `prefix` metrics names prefix
+    """
+
+    PACKET_SIZE = 512
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="bonobo_node"):
+        self.address = (host, port)
+        self.prefix = prefix
+
+    def get_lines(self, metrics):
+        for node in metrics:
+            name = f"{self.prefix}.{node.name.replace('#', '_')}"
+            for counter, _ in PrometheusSink.COUNTERS:
+                yield f"{name}.{counter}:{getattr(node, counter)}|c"
+            for quantile in (50, 90, 99):
+                value = node.percentile(quantile)
+                if value is not None:
+                    yield f"{name}.latency.p{quantile}:{value * 1000:.3f}|g"
+
+    def export(self, metrics):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            packet = ""
+            for line in self.get_lines(metrics):
+                if packet and len(packet) + len(line) >= self.PACKET_SIZE:
+                    sock.sendto(packet.encode(), self.address)
+                    packet = ""
+                packet = f"{packet}\n{line}" if packet else line
+            if packet:
+                sock.sendto(packet.encode(), self.address)
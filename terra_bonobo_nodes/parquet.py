@@ -0,0 +1,341 @@
+"""
+GeoParquet files, to exchange records between pipelines: geometries are WKB
+columns described by GeoParquet `geo` metadata, with a `bbox` covering
+column, whose row groups statistics allow to skip row groups out of a bbox.
+"""
+
+import json
+import os
+
+from bonobo.config import Configurable, Option
+from bonobo.config.processors import ContextProcessor
+from bonobo.constants import NOT_MODIFIED
+from bonobo.util.objects import ValueHolder
+from django.contrib.gis.geos import GEOSGeometry
+
+from .arrow import (
+    IDENTIFIER,
+    geometry_columns,
+    geometry_field,
+    records_to_table,
+    require_pyarrow,
+    table_to_records,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+
+try:
+    from pyproj import CRS
+except ImportError:  # pragma: no cover
+    CRS = None
+
+GEOPARQUET_VERSION = "1.1.0"
+
+BBOX = ("xmin", "ymin", "xmax", "ymax")
+
+
+def get_crs(srid):
+    """
+    PROJJSON of a SRID, only its identifier without pyproj
+    """
+    if CRS is not None:
+        return CRS.from_epsg(srid).to_json_dict()
+    return {"id": {"authority": "EPSG", "code": srid}}
+
+
+def get_srid(crs):
+    """
+    SRID of a GeoParquet column crs, OGC:CRS84 when missing
+    """
+    if crs is None:
+        return 4326
+    crs_id = crs.get("id", {}) if isinstance(crs, dict) else {}
+    if crs_id.get("authority") == "EPSG":
+        return int(crs_id["code"])
+    if CRS is not None:
+        epsg = CRS.from_json_dict(crs).to_epsg()
+        if epsg:
+            return epsg
+    return None
+
+
+def bbox_column(geometries):
+    """
+    Covering bbox struct column of a list of geometries
+    """
+    extents = [
+        geometry.extent if isinstance(geometry, GEOSGeometry) else (None,) * 4
+        for geometry in geometries
+    ]
+    return pa.StructArray.from_arrays(
+        (
+            [pa.array(values, pa.float64()) for values in zip(*extents)]
+            if extents
+            else [pa.array([], pa.float64())] * 4
+        ),
+        names=BBOX,
+    )
+
+
+class GeoParquetWriter(Configurable):
+    """
+    Write records to a GeoParquet file, one row group by `row_group_size`
+    records. Records missing columns get nulls. The schema is widened when
+    later records have new columns, or values of a wider type (null to any
+    type, integer to float), the row groups already written being rewritten.
+
+    Options:
+      `path` GeoParquet file path
+      `geom` primary geometry column, covered by the bbox column
+      `row_group_size` records by row group
+      `compression` parquet compression codec
+
+    Return:
+      NOT_MODIFIED
+    """
+
+    path = Option(str, required=True, positional=True)
+    geom = Option(str, positional=True, default="geom")
+    row_group_size = Option(int, default=10000)
+    compression = Option(str, default="zstd")
+
+    @ContextProcessor
+    def buffer(self, context, *args, **kwargs):
+        require_pyarrow()
+        self.writer = None
+        buffer = yield ValueHolder([])
+
+        if len(buffer):
+            self.write(buffer.get())
+        if self.writer is None:
+            # No records, write an empty file
+            self.write([])
+        self.writer.close()
+
+    def __call__(self, buffer, identifier, record, *args, **kwargs):
+        buffer.append((identifier, record))
+
+        if len(buffer) >= self.row_group_size:
+            self.write(buffer.get())
+            buffer.set([])
+        return NOT_MODIFIED
+
+    def write(self, rows):
+        records = [record for _, record in rows]
+        table = records_to_table(records, [identifier for identifier, _ in rows])
+        if self.geom in geometry_columns(table.schema):
+            table = table.append_column(
+                "bbox", bbox_column([record.get(self.geom) for record in records])
+            )
+
+        if self.writer is None:
+            self.open(table.schema)
+        else:
+            schema = self.unify(table.schema)
+            if not schema.equals(self.writer.schema):
+                self.widen(schema)
+        self.writer.write_table(self.conform(table), row_group_size=len(rows) or None)
+
+    def open(self, schema):
+        schema = schema.with_metadata(
+            {b"geo": json.dumps(self.get_metadata(schema)).encode()}
+        )
+        self.writer = pq.ParquetWriter(self.path, schema, compression=self.compression)
+
+    def unify(self, schema):
+        """
+        Return:
+          Schema of the file widened to the `schema` of a new row group
+        """
+        try:
+            return pa.unify_schemas(
+                [self.writer.schema.remove_metadata(), schema],
+                promote_options="permissive",
+            )
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f"Records do not fit {self.path} schema: {e}")
+
+    def widen(self, schema):
+        """
+        Rewrite the row groups already written with a wider `schema`
+        """
+        self.writer.close()
+        written = f"{self.path}.widened"
+        os.replace(self.path, written)
+        self.open(schema)
+        with pq.ParquetFile(written) as parquet_file:
+            for i in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(i)
+                self.writer.write_table(
+                    self.conform(table), row_group_size=table.num_rows or None
+                )
+        os.remove(written)
+
+    def conform(self, table):
+        schema = self.writer.schema
+        return pa.Table.from_arrays(
+            [
+                (
+                    table.column(field.name).cast(field.type)
+                    if field.name in table.column_names
+                    else pa.nulls(table.num_rows, field.type)
+                )
+                for field in schema
+            ],
+            schema=schema,
+        )
+
+    def get_metadata(self, schema):
+        columns = {}
+        for name, srid in geometry_columns(schema).items():
+            columns[name] = {"encoding": "WKB", "geometry_types": []}
+            if srid and srid != 4326:
+                columns[name]["crs"] = get_crs(srid)
+            if name == self.geom:
+                columns[name]["covering"] = {
+                    "bbox": {key: ["bbox", key] for key in BBOX}
+                }
+        return {
+            "version": GEOPARQUET_VERSION,
+            "primary_column": self.geom,
+            "columns": columns,
+        }
+
+
+class GeoParquetReader(Configurable):
+    """
+    Read records from a GeoParquet file, one row group at a time.
+
+    Options:
+      `path` GeoParquet file path
+      `columns` list of columns to read, default all
+      `bbox` (xmin, ymin, xmax, ymax) records must intersect, row groups out of
+        it are skipped using the bbox column statistics
+      `batch_size` records read at once
+
+    Return:
+      str identifier, or None for files without identifiers
+      dict record
+    """
+
+    path = Option(str, required=True, positional=True)
+    columns = Option(list, required=False, default=None)
+    bbox = Option(tuple, required=False, default=None)
+    batch_size = Option(int, default=10000)
+
+    def __call__(self, *args, **kwargs):
+        require_pyarrow()
+        parquet = pq.ParquetFile(self.path)
+        names = parquet.schema_arrow.names
+        geo = json.loads((parquet.schema_arrow.metadata or {}).get(b"geo", b"{}"))
+        geometries = {
+            name: get_srid(column.get("crs"))
+            for name, column in geo.get("columns", {}).items()
+            if column.get("encoding") == "WKB"
+        }
+        primary = geo.get("primary_column")
+        covered = self.bbox is not None and "bbox" in names
+
+        columns = None
+        if self.columns is not None:
+            columns = [
+                name
+                for name in names
+                if name in self.columns
+                or name == IDENTIFIER
+                or (covered and name == "bbox")
+                or (self.bbox is not None and name == primary)
+            ]
+
+        for batch in parquet.iter_batches(
+            batch_size=self.batch_size,
+            row_groups=self.get_row_groups(parquet),
+            columns=columns,
+        ):
+            table = self.with_geometries(pa.Table.from_batches([batch]), geometries)
+            if covered:
+                table = table.filter(self.intersects(table.column("bbox")))
+            for identifier, record in table_to_records(table):
+                record.pop("bbox", None)
+                if self.bbox is not None and not covered:
+                    if not self.intersects_geometry(record.get(primary)):
+                        continue
+                if self.columns is not None and primary not in self.columns:
+                    record.pop(primary, None)
+                yield identifier, record
+
+    def with_geometries(self, table, geometries):
+        return pa.Table.from_arrays(
+            table.columns,
+            schema=pa.schema(
+                [
+                    (
+                        geometry_field(name, geometries[name])
+                        if name in geometries
+                        else table.schema.field(name)
+                    )
+                    for name in table.column_names
+                ]
+            ),
+        )
+
+    def get_row_groups(self, parquet):
+        """
+        Return:
+          list row groups possibly intersecting bbox
+        """
+        metadata = parquet.metadata
+        row_groups = list(range(metadata.num_row_groups))
+        if self.bbox is None or "bbox" not in parquet.schema_arrow.names:
+            return row_groups
+
+        paths = {metadata.schema.column(i).path: i for i in range(metadata.num_columns)}
+        xmin, ymin, xmax, ymax = self.bbox
+        selected = []
+        for row_group in row_groups:
+            statistics = {
+                key: metadata.row_group(row_group)
+                .column(paths[f"bbox.{key}"])
+                .statistics
+                for key in BBOX
+            }
+            if not all(s is not None and s.has_min_max for s in statistics.values()):
+                selected.append(row_group)
+            elif not (
+                statistics["xmin"].min > xmax
+                or statistics["ymin"].min > ymax
+                or statistics["xmax"].max < xmin
+                or statistics["ymax"].max < ymin
+            ):
+                selected.append(row_group)
+        return selected
+
+    def intersects(self, bbox):
+        xmin, ymin, xmax, ymax = self.bbox
+        return pc.fill_null(
+            pc.and_(
+                pc.and_(
+                    pc.less_equal(pc.struct_field(bbox, "xmin"), xmax),
+                    pc.less_equal(pc.struct_field(bbox, "ymin"), ymax),
+                ),
+                pc.and_(
+                    pc.greater_equal(pc.struct_field(bbox, "xmax"), xmin),
+                    pc.greater_equal(pc.struct_field(bbox, "ymax"), ymin),
+                ),
+            ),
+            False,
+        )
+
+    def intersects_geometry(self, geometry):
+        if geometry is None:
+            return False
+        xmin, ymin, xmax, ymax = self.bbox
+        extent = geometry.extent
+        return not (
+            extent[0] > xmax or extent[1] > ymax or extent[2] < xmin or extent[3] < ymin
+        )
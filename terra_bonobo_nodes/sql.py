@@ -1,10 +1,49 @@
+import re
 from decimal import Decimal
 
 from bonobo.config import Configurable, Option
+from bonobo.config.processors import ContextProcessor
 from django.db import connections
 
+from .common import BulkTransform
 
-class SQLExtract(Configurable):
+# psycopg2 placeholder and escaped percent sign
+PLACEHOLDER_PATTERN = re.compile(r"%(%|s)")
+
+
+class PersistentCursor(Configurable):
+    """
+    Base class of nodes keeping one cursor on their `db_alias` database for
+    the node lifetime, instead of opening one by call. The cursor is opened
+    again if the connection was closed.
+    """
+
+    _cursor = None
+
+    @ContextProcessor
+    def persistent_cursor(self, context, *args, **kwargs):
+        yield
+        self.close_cursor()
+
+    def get_cursor(self):
+        connection = connections[self.db_alias]
+        cursor = self._cursor
+        if (
+            cursor is None
+            or cursor.db is not connection
+            or connection.connection is None
+            or cursor.cursor.closed
+        ):
+            cursor = self._cursor = connection.cursor()
+        return cursor
+
+    def close_cursor(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+
+class SQLExtract(PersistentCursor):
     """
     Extract records from an SQL query
 
@@ -12,6 +51,9 @@ class SQLExtract(Configurable):
       `sql_query` SQL query to execute
       `identifier` column containing record identifier
       `db_alias` db alias used for connection
+      `checkpoint` Checkpoint shared with loaders, rows are then ordered by
+        identifier, which must be unique, a rerun resuming after the last
+        rows loaded
 
     Return:
       str record's identifier
@@ -21,32 +63,73 @@ class SQLExtract(Configurable):
     sql_query = Option(str, required=True, positional=True)
     identifier = Option(str, required=True, positional=True)
     db_alias = Option(str, positional=True, default="default")
+    checkpoint = Option(None, required=False, default=None)
+    batch_size = 1000
 
     def __call__(self, *args, **kwargs):
-        with connections[self.db_alias].cursor() as cursor:
-            cursor.execute(self.sql_query)
-            columns = [col[0] for col in cursor.description]
+        if self.checkpoint is not None:
+            yield from self.extract_from_checkpoint()
+            return
+
+        cursor = self.get_cursor()
+        cursor.execute(self.sql_query)
+        columns = [col[0] for col in cursor.description]
 
-            for row in cursor.fetchall():
-                properties = {}
-                for k, v in zip(columns, row):
-                    if isinstance(v, Decimal):
-                        v = float(str(v))
-                    properties[k] = v
-                identifier = properties[self.identifier]
+        for row in cursor.fetchall():
+            properties = self._get_properties(columns, row)
+            identifier = properties[self.identifier]
 
+            yield identifier, properties
+
+    def extract_from_checkpoint(self):
+        name = type(self).__name__
+        position = self.checkpoint.resume(name)
+        identifier = connections[self.db_alias].ops.quote_name(self.identifier)
+        # Query has parameters, its percent signs are escaped
+        sql = f"SELECT * FROM ({self.sql_query.replace('%', '%%')}) AS checkpointed"
+        params = []
+        if position is not None:
+            sql += f" WHERE {identifier} > %s"
+            params.append(position)
+        sql += f" ORDER BY {identifier}"
+
+        cursor = self.get_cursor()
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+
+        # Pages of the single query result
+        for rows in iter(lambda: cursor.fetchmany(self.batch_size), []):
+            rows = [self._get_properties(columns, row) for row in rows]
+            identifiers = [properties[self.identifier] for properties in rows]
+            self.checkpoint.extracted(name, identifiers, identifiers[-1])
+            for identifier, properties in zip(identifiers, rows):
                 yield identifier, properties
 
+        self.checkpoint.exhausted(name)
 
-class AttributeFromSQL(Configurable):
+    def _get_properties(self, columns, row):
+        properties = {}
+        for k, v in zip(columns, row):
+            if isinstance(v, Decimal):
+                v = float(str(v))
+            properties[k] = v
+        return properties
+
+
+class AttributeFromSQL(PersistentCursor):
     """
-    Spread a record attribute from an SQL query
+    Spread a record attribute from an SQL query, its `%s` parameter being
+    the record identifier
 
+    With `prepare`, the query is prepared once by connection on PostgreSQL,
+    then only executed with each identifier, its plan being cached. Prepared
+    statements need a session connection, not a transaction pooled one.
 
     Options:
       `sql_query` SQL query to execute
       `property` property where the data will be inserted
       `db_alias` db alias used for connection
+      `prepare` use a server-side prepared statement
 
     Return:
       str record's identifier
@@ -56,27 +139,128 @@ class AttributeFromSQL(Configurable):
     sql_query = Option(str, required=True, positional=True)
     property = Option(str, required=True, positional=True)
     db_alias = Option(str, positional=True, default="default")
+    prepare = Option(bool, default=False)
+
+    _prepared = None
 
     def __call__(self, identifier, record, *args, **kwargs):
-        with connections[self.db_alias].cursor() as cursor:
+        cursor = self.get_cursor()
+        if self.prepare and cursor.db.vendor == "postgresql":
             cursor.execute(
-                self.sql_query,
-                [
-                    identifier,
-                ],
+                f"EXECUTE {self.prepare_statement(cursor)}(%s)", [identifier]
             )
-            columns = [col[0] for col in cursor.description]
+        else:
+            cursor.execute(self.sql_query, [identifier])
+        record[self.property] = self.get_attribute(
+            [col[0] for col in cursor.description], cursor.fetchall()
+        )
 
-            attr_data = []
+        return identifier, record
 
-            for row in cursor.fetchall():
-                properties = {}
-                for k, v in zip(columns, row):
-                    if isinstance(v, Decimal):
-                        v = float(str(v))
-                    properties[k] = v
-                attr_data.append(properties)
+    def get_attribute(self, columns, rows):
+        attr_data = []
 
-            record[self.property] = attr_data
+        for row in rows:
+            properties = {}
+            for k, v in zip(columns, row):
+                if isinstance(v, Decimal):
+                    v = float(str(v))
+                properties[k] = v
+            attr_data.append(properties)
 
-        return identifier, record
+        return attr_data
+
+    def prepare_statement(self, cursor):
+        """
+        Prepare the query on the cursor connection, if not yet done
+
+        Return:
+          str statement name
+        """
+        name = self.get_statement_name()
+        if self._prepared is not cursor.db.connection:
+            query = PLACEHOLDER_PATTERN.sub(
+                lambda match: "%" if match[1] == "%" else "$1", self.sql_query
+            )
+            cursor.execute(f"PREPARE {name} AS {query}")
+            self._prepared = cursor.db.connection
+        return name
+
+    def get_statement_name(self):
+        return f"{type(self).__name__.lower()}_{id(self):x}"
+
+    def close_cursor(self):
+        if self._cursor is not None and self._prepared is self._cursor.db.connection:
+            self._cursor.execute(f"DEALLOCATE {self.get_statement_name()}")
+        self._prepared = None
+        super().close_cursor()
+
+
+class BulkAttributeFromSQL(BulkTransform, AttributeFromSQL):
+    """
+    Same as AttributeFromSQL, but runs the query for a whole window of
+    records in one lateral join, a single round trip. Identifiers are cast
+    to the type PostgreSQL gives to the `%s` parameter of the query, as they
+    are when the query is run by record.
+
+    Options:
+      `sql_query` SQL query to execute
+      `property` property where the data will be inserted
+      `db_alias` db alias used for connection
+      `window_length` number of records by query
+
+    Return:
+      list(identifier, record)
+    """
+
+    _parameter_type = None
+
+    def process_window(self, window, **kwargs):
+        query = PLACEHOLDER_PATTERN.sub(
+            lambda match: "%%" if match[1] == "%" else "parameters._identifier",
+            self.sql_query,
+        )
+
+        with connections[self.db_alias].cursor() as cursor:
+            sql_query = f"""
+                SELECT parameters._ordinality, attribute.*
+                FROM
+                    unnest(%s::{self.get_parameter_type(cursor)}[])
+                        WITH ORDINALITY AS parameters(_identifier, _ordinality)
+                    CROSS JOIN LATERAL ({query}) AS attribute
+            """
+            cursor.execute(sql_query, [[identifier for identifier, _ in window]])
+            columns = [col[0] for col in cursor.description][1:]
+            rows = {}
+            for ordinality, *row in cursor.fetchall():
+                rows.setdefault(ordinality, []).append(row)
+
+        for ordinality, (identifier, record) in enumerate(window, 1):
+            record[self.property] = self.get_attribute(
+                columns, rows.get(ordinality, [])
+            )
+            yield identifier, record
+
+    def get_parameter_type(self, cursor):
+        """
+        Type of the `%s` parameter, from the query prepared once
+
+        Return:
+          str SQL type name
+        """
+        if self._parameter_type is None:
+            name = f"{self.get_statement_name()}_parameter"
+            query = PLACEHOLDER_PATTERN.sub(
+                lambda match: "%" if match[1] == "%" else "$1", self.sql_query
+            )
+            cursor.execute(f"PREPARE {name} AS {query}")
+            try:
+                cursor.execute(
+                    "SELECT parameter_types[1]::text FROM pg_prepared_statements"
+                    " WHERE name = %s",
+                    [name],
+                )
+                self._parameter_type = cursor.fetchone()[0] or "text"
+            finally:
+                cursor.execute(f"DEALLOCATE {name}")
+        return self._parameter_type
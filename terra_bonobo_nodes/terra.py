@@ -1,71 +1,286 @@
+import hashlib
+import json
 import logging
+import math
+import threading
+import warnings
+from collections import Counter, defaultdict
 from copy import deepcopy
 from json import JSONDecodeError
+from queue import Full, Queue
+from time import sleep
 
 from bonobo.config import Configurable, Option, Service
 from bonobo.config.processors import ContextProcessor
 from bonobo.constants import END, NOT_MODIFIED
 from bonobo.util.objects import ValueHolder
 from django.conf import settings
-from django.contrib.gis.db.models import Union
+from django.contrib.gis.db.models import Extent, Union
 from django.contrib.gis.db.models.functions import (
+    Centroid,
     Distance,
+    GeoHash,
     Intersection,
     MakeValid,
     Transform,
 )
-from django.contrib.gis.geos import GEOSGeometry
-from django.db import connection, transaction
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
+from django.contrib.gis.geos import GeometryCollection, GEOSGeometry, Polygon
+from django.contrib.gis.geos.prototypes.io import wkb_w
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, models, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.utils.version import get_version_tuple
 from geostore.models import Feature, FeatureQuerySet, Layer  # noqa
 from requests.compat import urljoin
 
+from .common import BulkTransform, CopyOnWriteRecord, wkb_coordinate_ranges
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import pyproj
+except ImportError:  # pragma: no cover
+    pyproj = None
+
+try:
+    import shapely
+except ImportError:  # pragma: no cover
+    shapely = None
+
 logger = logging.getLogger(__name__)
 
 GEOS_EMPTY_POINT = GEOSGeometry("POINT EMPTY")
+SUBDIVIDE_MAX_DEPTH = 50
+
+# Index along a Hilbert curve of the centroid of a geometry, on a grid of
+# 2^16 x 2^16 cells over the world in 4326, whatever the PostGIS version.
+# Computed without loop, by prefix scans of the curve states as in
+# rawrunprotected/hilbert_curves, then bits of both halves interleaved.
+# PostgreSQL bitwise operators have the same precedence, all are parenthesized.
+HILBERT_KEY = """(
+    SELECT ((k1 << 1) | k0)
+    FROM
+        ST_Transform(ST_Centroid({geom}), 4326) AS centroid(point),
+        LATERAL (
+            SELECT
+                LEAST(GREATEST(floor((ST_X(point) + 180) * 65536 / 360), 0), 65535)::bigint AS x,
+                LEAST(GREATEST(floor((ST_Y(point) + 90) * 65536 / 180), 0), 65535)::bigint AS y
+        ) AS cell,
+        LATERAL (
+            SELECT
+                (x # y) AS a0,
+                (65535 # (x # y)) AS b0,
+                (65535 # (x | y)) AS c0,
+                (x & (y # 65535)) AS d0
+        ) AS scan0,
+        LATERAL (
+            SELECT
+                (a0 | (b0 >> 1)) AS a1,
+                ((a0 >> 1) # a0) AS b1,
+                (((c0 >> 1) # (b0 & (d0 >> 1))) # c0) AS c1,
+                (((a0 & (c0 >> 1)) # (d0 >> 1)) # d0) AS d1
+        ) AS scan1,
+        LATERAL (
+            SELECT
+                ((a1 & (a1 >> 2)) # (b1 & (b1 >> 2))) AS a2,
+                ((a1 & (b1 >> 2)) # (b1 & ((a1 # b1) >> 2))) AS b2,
+                (c1 # ((a1 & (c1 >> 2)) # (b1 & (d1 >> 2)))) AS c2,
+                (d1 # ((b1 & (c1 >> 2)) # ((a1 # b1) & (d1 >> 2)))) AS d2
+        ) AS scan2,
+        LATERAL (
+            SELECT
+                ((a2 & (a2 >> 4)) # (b2 & (b2 >> 4))) AS a3,
+                ((a2 & (b2 >> 4)) # (b2 & ((a2 # b2) >> 4))) AS b3,
+                (c2 # ((a2 & (c2 >> 4)) # (b2 & (d2 >> 4)))) AS c3,
+                (d2 # ((b2 & (c2 >> 4)) # ((a2 # b2) & (d2 >> 4)))) AS d3
+        ) AS scan3,
+        LATERAL (
+            SELECT
+                (c3 # ((a3 & (c3 >> 8)) # (b3 & (d3 >> 8)))) AS c4,
+                (d3 # ((b3 & (c3 >> 8)) # ((a3 # b3) & (d3 >> 8)))) AS d4
+        ) AS scan4,
+        LATERAL (
+            SELECT
+                (x # y) AS h0,
+                ((d4 # (d4 >> 1)) | (65535 # ((x # y) | (c4 # (c4 >> 1))))) AS h1
+        ) AS halves,
+        LATERAL (
+            SELECT
+                ((h0 | (h0 << 8)) & 16711935) AS e0,
+                ((h1 | (h1 << 8)) & 16711935) AS e1
+        ) AS spread8,
+        LATERAL (
+            SELECT
+                ((e0 | (e0 << 4)) & 252645135) AS f0,
+                ((e1 | (e1 << 4)) & 252645135) AS f1
+        ) AS spread4,
+        LATERAL (
+            SELECT
+                ((f0 | (f0 << 2)) & 858993459) AS g0,
+                ((f1 | (f1 << 2)) & 858993459) AS g1
+        ) AS spread2,
+        LATERAL (
+            SELECT
+                ((g0 | (g0 << 1)) & 1431655765) AS k0,
+                ((g1 | (g1 << 1)) & 1431655765) AS k1
+        ) AS spread1
+)"""
+
+# Space-filling curve keys of the centroid of a geometry, close keys being
+# close in space
+SPATIAL_ORDERS = {
+    "geohash": "ST_GeoHash(ST_Transform(ST_Centroid({geom}), 4326))",
+    "hilbert": HILBERT_KEY,
+}
+
+# Center of the bounding box of a geometry, read from its header
+BBOX_CENTER = "(ST_{axis}Min(%(expressions)s) + ST_{axis}Max(%(expressions)s)) / 2"
+
+
+def postgis_versions():
+    """
+    Return:
+      tuple PostGIS version, tuple GEOS version of the database
+    """
+    geos = connection.ops.postgis_geos_version().split("-")[0]
+    return tuple(connection.ops.spatial_version), get_version_tuple(geos)
 
 
 class LayerClusters(Configurable):
     """
     Extract cluster from layers
 
+    Clusters are computed with one of the following strategies:
+      `grid` snap geometries to a grid of `distance` size
+      `dbscan` ST_ClusterDBSCAN with `distance` as maximum distance
+      `kmeans` ST_ClusterKMeans with `clusters_count` clusters
+
+    With `aggregate`, features of each cluster are aggregated in the same
+    query, the same way CollectAndSum does.
+
+    With `spatial_order`, clusters are sorted along a space-filling curve,
+    geohash or hilbert, of their centroid, so that following nodes query
+    neighbouring features one after the other.
 
     Options:
       `input_layers` list of input layers
       `metric_projection_srid` used projection
       `distance` minimal distance between each cluster
+      `strategy` clustering strategy, grid, dbscan or kmeans
+      `clusters_count` number of clusters of the kmeans strategy
+      `aggregate` return the aggregates of the cluster instead of the QuerySet
+      `geom` key of the collected geometry when aggregating
+      `sum_fields` properties to sum when aggregating
+      `chunk_size` number of clusters fetched at once from the database
+      `spatial_order` order of clusters, geohash or hilbert, default none
 
     Return:
       Point cluster point object
-      QuerySet QuerySet of all features included in the cluster
+      QuerySet QuerySet of all features included in the cluster, or dict of
+        aggregates
     """
 
+    CLUSTER_STRATEGIES = {
+        "grid": "ST_AsText(ST_SnapToGrid(ST_Transform(geom, %(srid)s), %(distance)s))",
+        "dbscan": (
+            "(ST_ClusterDBSCAN(ST_Transform(geom, %(srid)s), "
+            "eps := %(distance)s, minpoints := 1) OVER ())::text"
+        ),
+        "kmeans": (
+            "(ST_ClusterKMeans(ST_Transform(geom, %(srid)s), %(clusters_count)s) "
+            "OVER ())::text"
+        ),
+    }
+
     input_layers = Option(list, positional=True, required=True)
     metric_projection_srid = Option(int, positional=True, required=True)
     distance = Option(int, positional=True, required=True)
+    strategy = Option(str, default="grid")
+    clusters_count = Option(int, required=False)
+    aggregate = Option(bool, default=False)
+    geom = Option(str, default="geom")
+    sum_fields = Option(dict, default={})
+    chunk_size = Option(int, default=1000)
+    spatial_order = Option(str, required=False, default=None)
 
     def __call__(self, *args, **kwargs):
-        args = [
-            self.metric_projection_srid,
-            self.distance,
-            [input_layer.pk for input_layer in self.input_layers],
-        ]
+        if self.strategy not in self.CLUSTER_STRATEGIES:
+            raise ValueError(
+                f"Strategy {self.strategy} must be in {list(self.CLUSTER_STRATEGIES)}"
+            )
+        if self.spatial_order and self.spatial_order not in SPATIAL_ORDERS:
+            raise ValueError(
+                f"Spatial order {self.spatial_order} must be in {list(SPATIAL_ORDERS)}"
+            )
+        if self.strategy == "kmeans" and not self.clusters_count:
+            raise ValueError("kmeans strategy requires clusters_count option")
+
+        args = {
+            "srid": self.metric_projection_srid,
+            "distance": self.distance,
+            "clusters_count": self.clusters_count,
+            "layers": [input_layer.pk for input_layer in self.input_layers],
+        }
 
-        with connection.cursor() as cursor:
+        if self.aggregate:
+            sums = ""
+            for i, field in enumerate(self.sum_fields.values()):
+                args[f"field_{i}"] = field
+                sums += f", SUM((properties->>%(field_{i})s)::float)"
+            select = (
+                "ST_AsEWKB(ST_Collect(geom)), array_agg(DISTINCT id), count(id)" + sums
+            )
+        else:
+            select = "array_agg(id) AS ids"
+
+        order = ""
+        if self.spatial_order:
+            order = "ORDER BY " + SPATIAL_ORDERS[self.spatial_order].format(
+                geom="ST_Collect(geom)"
+            )
+
+        with connection.chunked_cursor() as cursor:
             sql_query = f"""
+                WITH clustered AS (
+                    SELECT
+                        id,
+                        geom,
+                        properties,
+                        {self.CLUSTER_STRATEGIES[self.strategy]} AS cluster_id
+                    FROM
+                        {Feature._meta.db_table}
+                    WHERE
+                        layer_id = ANY(%(layers)s::INT[])
+                )
                 SELECT
-                    array_agg(id) AS ids,
-                    ST_AsText(ST_SnapToGrid(ST_Transform(geom, %s), %s)) AS cluster_id
+                    cluster_id,
+                    {select}
                 FROM
-                    {Feature._meta.db_table}
-                WHERE
-                    layer_id = ANY(%s::INT[])
+                    clustered
                 GROUP BY
                     cluster_id
+                {order}
             """
 
             cursor.execute(sql_query, args)
-            for features, cluster in cursor.fetchall():
-                yield cluster, Feature.objects.filter(pk__in=features)
+            for rows in iter(lambda: cursor.fetchmany(self.chunk_size), []):
+                for cluster, *values in rows:
+                    if self.aggregate:
+                        yield cluster, self._get_aggregates(*values)
+                    else:
+                        yield cluster, Feature.objects.filter(pk__in=values[0])
+
+    def _get_aggregates(self, geom, ids, point_count, *sums):
+        return {
+            self.geom: GEOSGeometry(memoryview(geom)),
+            "ids": ids,
+            "point_count": point_count,
+            **dict(zip(self.sum_fields.keys(), sums)),
+        }
 
 
 class SubdivideGeom(Configurable):
@@ -76,6 +291,9 @@ class SubdivideGeom(Configurable):
     Options:
       `max_vertices` numbe maximal of vertices of the new geometry
       `geom` geom field where is located the geometry
+      `local` subdivide in process with GEOS instead of using the database
+      `copy_on_write` parts are CopyOnWriteRecord copies of the record,
+        sharing unmodified values, instead of deep copies
 
     Return:
       identifier identifier of the new record
@@ -84,8 +302,15 @@ class SubdivideGeom(Configurable):
 
     max_vertices = Option(int, positional=True, default=256)
     geom = Option(str, positional=True, default="geom")
+    local = Option(bool, default=False)
+    copy_on_write = Option(bool, required=False, default=False)
 
     def __call__(self, identifier, properties, *args, **kwargs):
+        if self.local:
+            parts = subdivide(properties[self.geom], self.max_vertices)
+            yield from self._get_parts(identifier, properties, parts)
+            return
+
         args = [
             properties[self.geom].ewkt,
             self.max_vertices,
@@ -96,42 +321,196 @@ class SubdivideGeom(Configurable):
                 "SELECT ST_Subdivide(ST_Buffer(ST_GeomFromText(%s), 0), %s) AS geom"
             )
             cursor.execute(sql_query, args)
-            id = 0
-            for (geom,) in cursor.fetchall():
-                properties = deepcopy(properties)
-                properties[self.geom] = GEOSGeometry(geom)
-                yield f"{identifier}-{id}", properties
-                id += 1
+            parts = [GEOSGeometry(geom) for (geom,) in cursor.fetchall()]
+
+        yield from self._get_parts(identifier, properties, parts)
+
+    def _get_parts(self, identifier, properties, parts):
+        for id, geom in enumerate(parts):
+            if self.copy_on_write:
+                part = CopyOnWriteRecord(properties)
+            else:
+                part = deepcopy(properties)
+            part[self.geom] = geom
+            yield f"{identifier}-{id}", part
+
+
+class BulkSubdivideGeom(BulkTransform, SubdivideGeom):
+    """
+    Same as SubdivideGeom, but by window of records: geometries of a window are
+    sent as an EWKB array and subdivided by a single query.
+
+    Options:
+      `window_length` number of records processed at once
+
+    Return:
+      identifier identifier of the new record
+      record properties of the record
+    """
+
+    def process_window(self, window, **kwargs):
+        if self.local:
+            for identifier, properties in window:
+                yield from SubdivideGeom.__call__(self, identifier, properties)
+            return
+
+        args = [
+            [bytes(properties[self.geom].ewkb) for _, properties in window],
+            self.max_vertices,
+        ]
+
+        parts = defaultdict(list)
+        with connection.cursor() as cursor:
+            sql_query = """
+                SELECT
+                    input.ordinality,
+                    ST_AsEWKB(part.geom)
+                FROM
+                    unnest(%s::bytea[]) WITH ORDINALITY AS input(wkb, ordinality),
+                    LATERAL ST_Subdivide(
+                        ST_Buffer(ST_GeomFromEWKB(input.wkb), 0), %s
+                    ) AS part(geom)
+            """
+            cursor.execute(sql_query, args)
+            for ordinality, wkb in cursor.fetchall():
+                parts[ordinality - 1].append(GEOSGeometry(memoryview(wkb)))
+
+        for i, (identifier, properties) in enumerate(window):
+            yield from self._get_parts(identifier, properties, parts[i])
+
+
+def subdivide(geometry, max_vertices, depth=0):
+    """
+    Subdivide a geometry in process, the same way ST_Subdivide does: split
+    recursively the bounding box in halves until parts have at most
+    `max_vertices` vertices. Polygons are buffered by 0 first.
+
+    Return:
+      list(geometry)
+    """
+    if depth == 0 and geometry.dims == 2:
+        geometry = geometry.buffer(0)
+
+    parts = []
+    for member in _flatten(geometry, geometry.dims):
+        xmin, ymin, xmax, ymax = member.extent
+        width, height = xmax - xmin, ymax - ymin
+        if (
+            member.num_coords <= max_vertices
+            or depth >= SUBDIVIDE_MAX_DEPTH
+            or (width == 0 and height == 0)
+        ):
+            parts.append(member)
+            continue
+
+        if width > height:
+            boxes = [
+                (xmin, ymin, xmin + width / 2, ymax),
+                (xmin + width / 2, ymin, xmax, ymax),
+            ]
+        else:
+            boxes = [
+                (xmin, ymin, xmax, ymin + height / 2),
+                (xmin, ymin + height / 2, xmax, ymax),
+            ]
+        for box in boxes:
+            clipped = member.intersection(Polygon.from_bbox(box))
+            clipped.srid = geometry.srid
+            parts += subdivide(clipped, max_vertices, depth + 1)
+    return parts
+
+
+def _flatten(geometry, dims):
+    """
+    Yield simple geometries of `dims` dimension from a geometry or a collection.
+    """
+    if geometry.empty:
+        return
+    if isinstance(geometry, GeometryCollection):
+        for member in geometry:
+            yield from _flatten(member, dims)
+    elif geometry.dims == dims:
+        yield geometry
 
 
 class LoadFeatureInLayer(Configurable):
     """
     Load feature data in input layer
 
+    With `incremental`, only new or changed features are written, comparing
+    the content hash of the geometry and properties with the stored features.
+    With `delete_missing` too, features of the layer that were not loaded are
+    deleted at the end, unless the load was killed or a node of the graph
+    got an error.
+
     Options:
       `geom` geom field where is located the geometry
       `layer` layer where to insert the geometry and its attributes
       `window_length` size of bulk import
+      `incremental` only write changes
+      `delete_missing` delete features of the layer that were not loaded, in
+        incremental mode
+      `diff` property where to put the change (inserted, updated or deleted)
+        of each changed feature emitted, in incremental mode
+      `checkpoint` Checkpoint shared with extractors, committed windows are
+        recorded. A resumed load does not delete missing features.
 
     Services:
       `service_layer` Layer where to insert geometries, used if layer argument is empty
 
     Return:
-      NOT_MODIFIED
+      NOT_MODIFIED, or changed features if `diff`
     """
 
     geom = Option(str, positional=True, default="geom")
     layer = Option(None, required=False, positional=True)
     window_length = Option(int, default=100)
     layer_name = Option(str, required=False)
+    incremental = Option(bool, default=False)
+    delete_missing = Option(bool, required=False, default=False)
+    diff = Option(str, required=False, default=None)
+    checkpoint = Option(None, required=False, default=None)
 
     @ContextProcessor
     def buffer(self, context, *args, **kwargs):
+        self.seen, self.counts = set(), Counter()
+        resumed = None
+        if self.checkpoint is not None:
+            resumed = self.checkpoint.register(type(self).__name__)
         buffer = yield ValueHolder([])
 
         if len(buffer):
             # Final call if there is content in buffer
-            self.__call__(buffer, END, END)
+            rows = LoadFeatureInLayer.__call__(self, buffer, END, END)
+            if self.diff:
+                for row in rows:
+                    context.send(*row)
+
+        if self.incremental and self.seen and self.delete_missing:
+            if resumed:
+                logger.warning(
+                    f"{self.write_layer.name}: resumed load, missing features are kept"
+                )
+            elif self.failed(context):
+                logger.warning(
+                    f"{self.write_layer.name}: incomplete load, "
+                    "missing features are kept"
+                )
+            else:
+                for row in self.delete_missing_features():
+                    if self.diff:
+                        context.send(*row)
+        if self.incremental and self.seen:
+            logger.info(
+                f"{self.write_layer.name}: "
+                + ", ".join(
+                    f"{self.counts[change]} {change}"
+                    for change in ("inserted", "updated", "unchanged", "deleted")
+                )
+            )
+
+        if self.checkpoint is not None:
+            self.checkpoint.unregister(type(self).__name__, not context.killed)
 
     def __call__(self, buffer, identifier, record, *args, **kwargs):
         if self.layer_name:
@@ -152,16 +531,105 @@ class LoadFeatureInLayer(Configurable):
             )
 
         if len(buffer) >= self.window_length or is_final:
-            with transaction.atomic(savepoint=False):
-                Feature.objects.filter(
-                    layer=self.write_layer, identifier__in=[i for i, r in buffer]
-                ).delete()
-                Feature.objects.bulk_create(
-                    [self._get_feature_object(*feature) for feature in buffer]
+            if self.incremental:
+                rows = self.write_changes(buffer.get())
+            else:
+                rows = []
+                with transaction.atomic(savepoint=False):
+                    Feature.objects.filter(
+                        layer=self.write_layer, identifier__in=[i for i, r in buffer]
+                    ).delete()
+                    Feature.objects.bulk_create(
+                        [self._get_feature_object(*feature) for feature in buffer]
+                    )
+            if self.checkpoint is not None:
+                self.checkpoint.committed(
+                    type(self).__name__, [identifier for identifier, _ in buffer]
                 )
             buffer.set([])
+            if self.diff:
+                return (row for row in rows)
             return NOT_MODIFIED
 
+    @staticmethod
+    def failed(context):
+        """
+        Whether the load was killed, or a node of the graph got an error
+        """
+        contexts = context.parent.nodes if context.parent else [context]
+        return any(
+            node.killed or node.defunct or node.statistics.get("err")
+            for node in contexts
+        )
+
+    def write_changes(self, window):
+        srid = Feature._meta.get_field("geom").srid
+        features = {}
+        for identifier, record in window:
+            # Compared with and stored as the identifiers of the database
+            identifier = str(identifier)
+            feature = self._get_feature_object(identifier, record)
+            if feature.geom.srid != srid:
+                feature.geom = feature.geom.clone()
+                if feature.geom.srid:
+                    feature.geom.transform(srid)
+                else:
+                    feature.geom.srid = srid
+            features[identifier] = feature, record
+        self.seen.update(features)
+
+        stored = {
+            identifier: feature_hash(geom, properties)
+            for identifier, geom, properties in Feature.objects.filter(
+                layer=self.write_layer, identifier__in=features
+            ).values_list("identifier", "geom", "properties")
+        }
+
+        changes = []
+        for identifier, (feature, record) in features.items():
+            if identifier not in stored:
+                changes.append(("inserted", feature, record))
+            elif stored[identifier] != feature_hash(feature.geom, feature.properties):
+                changes.append(("updated", feature, record))
+            else:
+                self.counts["unchanged"] += 1
+
+        with transaction.atomic(savepoint=False):
+            Feature.objects.filter(
+                layer=self.write_layer,
+                identifier__in=[
+                    feature.identifier
+                    for change, feature, record in changes
+                    if change == "updated"
+                ],
+            ).delete()
+            Feature.objects.bulk_create([feature for _, feature, _ in changes])
+
+        rows = []
+        for change, feature, record in changes:
+            self.counts[change] += 1
+            if self.diff:
+                rows.append((feature.identifier, {**record, self.diff: change}))
+        return rows
+
+    def delete_missing_features(self):
+        missing = list(
+            set(
+                Feature.objects.filter(layer=self.write_layer).values_list(
+                    "identifier", flat=True
+                )
+            )
+            - self.seen
+        )
+        for i in range(0, len(missing), self.window_length):
+            identifiers = missing[i : i + self.window_length]  # noqa: E203
+            Feature.objects.filter(
+                layer=self.write_layer, identifier__in=identifiers
+            ).delete()
+            self.counts["deleted"] += len(identifiers)
+            for identifier in identifiers:
+                yield identifier, {self.diff: "deleted"}
+
     def _get_feature_object(self, identifier, record):
         properties = record.copy()
         geometry = properties.pop(self.geom, GEOS_EMPTY_POINT)
@@ -174,14 +642,42 @@ class LoadFeatureInLayer(Configurable):
         )
 
 
+def feature_hash(geometry, properties):
+    """
+    Content hash of a feature, from its geometry and its properties as stored
+    in the database
+    """
+    content = hashlib.blake2b(bytes(geometry.ewkb) if geometry else b"")
+    try:
+        dump = json.dumps(properties, sort_keys=True, cls=DjangoJSONEncoder)
+    except TypeError:
+        # Keys of mixed types are not sortable, they are strings once stored
+        dump = json.dumps(
+            json.loads(json.dumps(properties, cls=DjangoJSONEncoder)), sort_keys=True
+        )
+    content.update(dump.encode())
+    return content.digest()
+
+
 class ExtractFeatures(Configurable):
     """
     Extract features from a queryset
 
+    With a `checkpoint`, features are extracted ordered by `id_field` and
+    primary key, by keyset pages, a rerun resuming after the last page
+    loaded.
+
+    With `spatial_order`, features are extracted along a space-filling curve
+    of their centroid, geohash or hilbert, or ordered by a precomputed
+    field, so that following nodes query neighbouring features one after
+    the other.
+
     Options:
       `queryset` Feature QuerySet containing geometries and attributes
       `id_field` field containing the identifier
       `extra_properties` dict of extra attributes extracted from the feature
+      `checkpoint` Checkpoint shared with loaders
+      `spatial_order` geohash, hilbert or field ordering features
 
     Return:
       str identifier of the record using id_field
@@ -191,24 +687,258 @@ class ExtractFeatures(Configurable):
     queryset = Option(None, required=True, positional=True)
     id_field = Option(str, required=True, positional=True, default="identifier")
     extra_properties = Option(dict, required=True, positional=True, default={})
+    checkpoint = Option(None, required=False, default=None)
+    spatial_order = Option(str, required=False, default=None)
     batch_size = 1000
 
     def __call__(self, *args, **kwargs):
+        if self.checkpoint is not None:
+            yield from self.extract_from_checkpoint()
+            return
 
-        count = self.queryset.count()
+        queryset = self.get_queryset()
+        count = queryset.count()
 
         for start in range(0, count, self.batch_size):
             end = min(start + self.batch_size, count)
-            features = self.queryset[start:end]
+            features = queryset[start:end]
             for feature in features:
-                properties = {
-                    **feature.properties,
-                    **{
-                        attribute: getattr(feature, field)
-                        for attribute, field in self.extra_properties.items()
-                    },
-                }
-                yield getattr(feature, self.id_field), properties
+                yield getattr(feature, self.id_field), self._get_record(feature)
+
+    def get_queryset(self):
+        """
+        Return:
+          QuerySet in `spatial_order` order, the queryset itself without
+        """
+        if not self.spatial_order:
+            return self.queryset
+        if self.spatial_order == "geohash":
+            order = GeoHash(Transform(Centroid("geom"), 4326))
+        elif self.spatial_order == "hilbert":
+            order = models.Func(
+                "geom",
+                template=HILBERT_KEY.format(geom="%(expressions)s"),
+                output_field=models.BigIntegerField(),
+            )
+        else:
+            # Precomputed ordering field
+            return self.queryset.order_by(self.spatial_order, "pk")
+        # Ordered by the key expression, without selecting it
+        return self.queryset.order_by(order, "pk")
+
+    def extract_from_checkpoint(self):
+        if self.spatial_order:
+            raise ValueError("Checkpointed extraction is ordered by id_field")
+        name = type(self).__name__
+        position = self.checkpoint.resume(name)
+        queryset = self.queryset.order_by(self.id_field, "pk")
+
+        while True:
+            page = queryset
+            if position is not None:
+                identifier, pk = position
+                page = page.filter(
+                    models.Q(**{f"{self.id_field}__gt": identifier})
+                    | models.Q(**{self.id_field: identifier, "pk__gt": pk})
+                )
+            features = list(page[: self.batch_size])
+            if not features:
+                break
+
+            rows = [
+                (getattr(feature, self.id_field), self._get_record(feature))
+                for feature in features
+            ]
+            position = [rows[-1][0], features[-1].pk]
+            self.checkpoint.extracted(name, [row[0] for row in rows], position)
+            yield from rows
+
+        self.checkpoint.exhausted(name)
+
+    def _get_record(self, feature):
+        return {
+            **feature.properties,
+            **{
+                attribute: getattr(feature, field)
+                for attribute, field in self.extra_properties.items()
+            },
+        }
+
+
+class PartitionedExtractFeatures(ExtractFeatures):
+    """
+    Extract features from a queryset split in partitions, read concurrently
+    by one thread each over its own database connection, so that a single
+    pipeline keeps the database busy on large layers.
+
+    Partitions are ranges of primary keys, or tiles of a grid over the
+    queryset extent holding the features whose bounding box center is in
+    them, and a last partition holding the features without geometry or with
+    an empty one. Each partition is read in primary key order, by keyset pages.
+    Pages are sent as soon as read, or partition after partition when
+    `ordered`, following partitions being read ahead.
+
+    Options:
+      `queryset` Feature QuerySet containing geometries and attributes
+      `id_field` field containing the identifier
+      `extra_properties` dict of extra attributes extracted from the feature
+      `partitions` number of partitions, tiles of a grid of at least as many
+      `partition_by` id or tile
+      `ordered` send partitions one after the other
+
+    Return:
+      str identifier of the record using id_field
+      dict record
+    """
+
+    partitions = Option(int, default=4)
+    partition_by = Option(str, default="id")
+    ordered = Option(bool, default=False)
+    # Pages read ahead by partition
+    read_ahead = 2
+
+    def __call__(self, *args, **kwargs):
+        if self.partition_by not in ("id", "tile"):
+            raise ValueError(f"Unknown partition_by {self.partition_by}")
+        if self.checkpoint is not None or self.spatial_order:
+            raise ValueError("Partitions are extracted in primary key order")
+
+        partitions = self.get_partitions()
+        if self.ordered:
+            queues = [Queue(maxsize=self.read_ahead) for _ in partitions]
+        else:
+            merged = Queue(maxsize=self.read_ahead * len(partitions))
+            queues = [merged for _ in partitions]
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self.read_partition, args=(partition, queue, stop), daemon=True
+            )
+            for partition, queue in zip(partitions, queues)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            if self.ordered:
+                for queue in queues:
+                    yield from self.merge(queue, 1)
+            elif queues:
+                yield from self.merge(queues[0], len(queues))
+        finally:
+            # Also when the pipeline stops reading
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def get_partitions(self):
+        """
+        Return:
+          list of querysets partitioning the queryset
+        """
+        queryset = self.queryset.order_by()
+        if self.partition_by == "id":
+            bounds = queryset.aggregate(low=models.Min("pk"), high=models.Max("pk"))
+            if bounds["low"] is None:
+                return []
+            step = (bounds["high"] - bounds["low"]) // self.partitions + 1
+            return [
+                queryset.filter(pk__gte=low, pk__lt=low + step)
+                for low in range(bounds["low"], bounds["high"] + 1, step)
+            ]
+
+        # Features out of any tile
+        empty = queryset.annotate(
+            _empty=models.Func(
+                "geom", function="ST_IsEmpty", output_field=models.BooleanField()
+            )
+        ).filter(models.Q(geom__isnull=True) | models.Q(_empty=True))
+        extent = queryset.aggregate(extent=Extent("geom"))["extent"]
+        if extent is None:
+            return [empty]
+        xmin, ymin, xmax, ymax = extent
+        columns = math.ceil(math.sqrt(self.partitions))
+        rows = math.ceil(self.partitions / columns)
+        # Inner bounds of the grid, outer tiles are open
+        xs = [xmin + (xmax - xmin) * i / columns for i in range(columns + 1)]
+        ys = [ymin + (ymax - ymin) * j / rows for j in range(rows + 1)]
+        queryset = queryset.annotate(
+            _center_x=models.Func(
+                "geom",
+                template=BBOX_CENTER.format(axis="X"),
+                output_field=models.FloatField(),
+            ),
+            _center_y=models.Func(
+                "geom",
+                template=BBOX_CENTER.format(axis="Y"),
+                output_field=models.FloatField(),
+            ),
+        )
+        srid = queryset.model._meta.get_field("geom").srid
+        partitions = []
+        for j in range(rows):
+            for i in range(columns):
+                tile = Polygon.from_bbox((xs[i], ys[j], xs[i + 1], ys[j + 1]))
+                tile.srid = srid
+                # Bounding boxes overlap the tile of their center, using the index
+                bounds = {"geom__bboverlaps": tile}
+                if i > 0:
+                    bounds["_center_x__gte"] = xs[i]
+                if i < columns - 1:
+                    bounds["_center_x__lt"] = xs[i + 1]
+                if j > 0:
+                    bounds["_center_y__gte"] = ys[j]
+                if j < rows - 1:
+                    bounds["_center_y__lt"] = ys[j + 1]
+                partitions.append(queryset.filter(**bounds))
+        return partitions + [empty]
+
+    def read_partition(self, partition, queue, stop):
+        """
+        Send pages of records of a partition to the queue, then None, or the
+        exception raised
+        """
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        try:
+            partition = partition.order_by("pk")
+            last = None
+            while True:
+                page = partition if last is None else partition.filter(pk__gt=last)
+                features = list(page[: self.batch_size])
+                if not features:
+                    break
+                last = features[-1].pk
+                rows = [
+                    (getattr(feature, self.id_field), self._get_record(feature))
+                    for feature in features
+                ]
+                if not put(rows):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            # Connections of this thread
+            connections.close_all()
+
+    def merge(self, queue, partitions):
+        while partitions:
+            rows = queue.get()
+            if rows is None:
+                partitions -= 1
+            elif isinstance(rows, Exception):
+                raise rows
+            else:
+                yield from rows
 
 
 class BooleanIntersect(Configurable):
@@ -250,6 +980,8 @@ class IntersectionPercentByArea(Configurable):
       `layer` Layer to intersect
       `property` property where to put the resulted intersection
       `geom` geometry attribute in record
+      `metric_projection_srid` projection used to compute areas, default is
+        the projection of the geometries
 
     Return:
       str identifier of the record
@@ -259,9 +991,17 @@ class IntersectionPercentByArea(Configurable):
     layer = Option(str, required=True, positional=True)
     property = Option(str, required=True, positional=True)
     geom = Option(str, positional=True, default="geom")
+    metric_projection_srid = Option(int, required=False, default=None)
+
+    _layer = None
+
+    def get_layer(self):
+        if self._layer is None:
+            self._layer = Layer.objects.get(name=self.layer)
+        return self._layer
 
     def __call__(self, identifier, record, *args, **kwargs):
-        layer = Layer.objects.get(name=self.layer)
+        layer = self.get_layer()
         try:
             zone = (
                 layer.features.filter(geom__intersects=record[self.geom])
@@ -271,7 +1011,12 @@ class IntersectionPercentByArea(Configurable):
                 .aggregate(zone=Union("intersection"))["zone"]
             )
 
-            record[self.property] = zone and zone.area / record[self.geom].area or 0.0
+            geom = record[self.geom]
+            if zone and self.metric_projection_srid:
+                zone = zone.transform(self.metric_projection_srid, clone=True)
+                geom = geom.transform(self.metric_projection_srid, clone=True)
+
+            record[self.property] = zone and zone.area / geom.area or 0.0
 
         except Exception as e:
             logger.error(f"identifier {identifier} got error {e}")
@@ -279,6 +1024,44 @@ class IntersectionPercentByArea(Configurable):
         yield identifier, record
 
 
+class BulkIntersectionPercentByArea(BulkTransform, IntersectionPercentByArea):
+    """
+    Same as IntersectionPercentByArea, but intersects a whole window of records
+    in one query.
+    """
+
+    def process_window(self, window, **kwargs):
+        # Areas as IntersectionPercentByArea computes them, the zone in the
+        # features projection and the geometry in its own projection
+        area = "ST_Area({})"
+        if self.metric_projection_srid:
+            area = f"ST_Area(ST_Transform({{}}, {self.metric_projection_srid:d}))"
+        select = (
+            f"ARRAY[CASE WHEN NOT ST_IsEmpty(zone.geom) "
+            f"THEN {area.format('zone.geom')} END, {area.format('input.source')}]"
+        )
+
+        try:
+            with transaction.atomic():
+                areas = intersection_zones(self.get_layer(), window, self.geom, select)
+        except Exception as e:
+            logger.error(f"window got error {e}, intersecting record by record")
+            for identifier, record in window:
+                yield from IntersectionPercentByArea.__call__(self, identifier, record)
+            return
+
+        for i, (identifier, record) in enumerate(window):
+            if i in areas:
+                zone_area, area = areas[i]
+                try:
+                    record[self.property] = (
+                        zone_area is not None and zone_area / area or 0.0
+                    )
+                except Exception as e:
+                    logger.error(f"identifier {identifier} got error {e}")
+            yield identifier, record
+
+
 class ClosestFeatures(Configurable):
     """
     Get closes features of the geometry in a layer
@@ -447,34 +1230,209 @@ class AccessibilityRatioByTime(Configurable):
             return identifier, properties
 
 
+class BulkAccessibilityRatioByTime(BulkTransform, AccessibilityRatioByTime):
+    """
+    Same as AccessibilityRatioByTime, but transit times of a whole window are
+    compared with time limits at once with numpy. Missing times are NaN.
+
+    Options:
+      `stats` property where to set the minimal and median time of each mode
+
+    Return:
+      str identifier of the record
+      dict record updated
+    """
+
+    stats = Option(str, required=False, default=None)
+
+    def process_window(self, window, **kwargs):
+        if np is None:
+            raise ImportError("numpy is required by BulkAccessibilityRatioByTime")
+
+        n_modes = len(self.time_limits)
+        records, times = [], []
+        for identifier, properties in window:
+            transit_times = properties.pop(self.times)
+            if not isinstance(transit_times, np.ndarray):
+                transit_times = transit_times or []
+            if len(transit_times):
+                records.append((properties, len(transit_times)))
+                times.append(np.array(transit_times, dtype=float)[:, :n_modes])
+
+        if records:
+            times = np.concatenate(times)
+            lengths = np.array([length for _, length in records])
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+            with np.errstate(invalid="ignore"):
+                access = (times <= np.array(self.time_limits, dtype=float)).any(axis=1)
+            ratios = np.add.reduceat(access, offsets) / lengths
+
+            for i, (properties, _) in enumerate(records):
+                properties[self.property] = float(ratios[i])
+                if self.stats:
+                    properties[self.stats] = self.get_stats(
+                        times[offsets[i] : offsets[i] + lengths[i]]  # noqa: E203
+                    )
+
+        yield from window
+
+    def get_stats(self, times):
+        stats = {}
+        with warnings.catch_warnings():
+            # All-NaN modes have NaN statistics
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for name, function in (("min", np.nanmin), ("median", np.nanmedian)):
+                stats[name] = [
+                    None if np.isnan(value) else float(value)
+                    for value in function(times, axis=0)
+                ]
+        return stats
+
+
 class SimplifyGeom(Configurable):
     """
     Simplify a geometry
 
+    Several simplified geometries can be computed at once, for example one by
+    zoom level, with `tolerances`.
 
     Options:
       `tolerance` tolerance of simplification
       `geom_in` property of input geometry
       `geom_out` property of output geometry
+      `tolerances` dict of tolerance by property of output geometry
+      `preserve_topology` avoid invalid simplified geometries
 
     Return:
       str identifier of the record
       dict record updated
     """
 
-    tolerance = Option(int, positional=True, required=True)
+    tolerance = Option(float, positional=True, required=False, default=None)
     geom_in = Option(str, positional=True, default="geom")
     geom_out = Option(str, positional=True, default="geom")
+    tolerances = Option(dict, required=False, default={})
+    preserve_topology = Option(bool, required=False, default=False)
+
+    def get_tolerances(self):
+        tolerances = dict(self.tolerances)
+        if self.tolerance is not None:
+            tolerances[self.geom_out] = self.tolerance
+        if not tolerances:
+            raise ValueError("Missing tolerance or tolerances parameter")
+        return tolerances
 
     def __call__(self, identifier, record, *args, **kwargs):
-        record[self.geom_out] = record[self.geom_in].simplify(self.tolerance)
+        geometry = record[self.geom_in]
+        for geom_out, tolerance in self.get_tolerances().items():
+            record[geom_out] = geometry.simplify(
+                tolerance, preserve_topology=self.preserve_topology
+            )
         return identifier, record
 
 
+class CoverageSimplifyGeom(BulkTransform, SimplifyGeom):
+    """
+    Simplify polygons of a whole window together, keeping edges shared by
+    adjacent polygons coincident. The window should contain the whole layer.
+    Other geometries are simplified as SimplifyGeom does.
+
+    Polygons are simplified by the database with PostGIS 3.4 and GEOS 3.12,
+    in process with shapely 2.1 otherwise, checked on the first window.
+
+    Options:
+      `window_length` number of geometries simplified together
+      `local` simplify in process with shapely instead of using the database
+    """
+
+    window_length = Option(int, default=100000)
+    local = Option(bool, default=False)
+
+    _use_postgis = None
+
+    def use_postgis(self):
+        if self._use_postgis is not None:
+            return self._use_postgis
+        message = "CoverageSimplifyGeom requires shapely 2.1"
+        if not self.local:
+            postgis, geos = postgis_versions()
+            if postgis[:2] >= (3, 4) and geos[:2] >= (3, 12):
+                self._use_postgis = True
+                return True
+            message += (
+                " or PostGIS 3.4 with GEOS 3.12, database"
+                f" has PostGIS {'.'.join(map(str, postgis))}"
+                f" with GEOS {'.'.join(map(str, geos))}"
+            )
+        if not hasattr(shapely, "coverage_simplify"):
+            raise RuntimeError(message)
+        self._use_postgis = False
+        return False
+
+    def process_window(self, window, **kwargs):
+        use_postgis = self.use_postgis()
+        tolerances = self.get_tolerances()
+        polygons = []
+        for identifier, record in window:
+            geometry = record[self.geom_in]
+            if geometry.geom_type in ("Polygon", "MultiPolygon"):
+                polygons.append(bytes(geometry.ewkb))
+            else:
+                polygons.append(None)
+                SimplifyGeom.__call__(self, identifier, record)
+
+        if use_postgis:
+            simplified = self.simplify_postgis(tolerances, polygons)
+        else:
+            simplified = self.simplify_local(tolerances, polygons)
+        for i, geometries in simplified:
+            record = window[i][1]
+            for geom_out, wkb in zip(tolerances, geometries):
+                record[geom_out] = GEOSGeometry(memoryview(wkb))
+
+        yield from window
+
+    def simplify_postgis(self, tolerances, polygons):
+        simplified = ", ".join(
+            "ST_AsEWKB(ST_CoverageSimplify(geom, %s) OVER ())" for _ in tolerances
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT
+                    input.ordinality,
+                    {simplified}
+                FROM
+                    unnest(%s::bytea[]) WITH ORDINALITY AS input(wkb, ordinality),
+                    ST_GeomFromEWKB(input.wkb) AS geom
+                WHERE
+                    input.wkb IS NOT NULL
+                """,
+                [*tolerances.values(), polygons],
+            )
+            return [(ordinality - 1, wkbs) for ordinality, *wkbs in cursor.fetchall()]
+
+    def simplify_local(self, tolerances, polygons):
+        indexes = [i for i, wkb in enumerate(polygons) if wkb is not None]
+        if not indexes:
+            return []
+        geometries = shapely.from_wkb([polygons[i] for i in indexes])
+        simplified = []
+        for tolerance in tolerances.values():
+            # The simplified geometries lose their srid
+            coverage = shapely.coverage_simplify(geometries, tolerance)
+            coverage = shapely.set_srid(coverage, shapely.get_srid(geometries))
+            simplified.append(shapely.to_wkb(coverage, include_srid=True))
+        return zip(indexes, zip(*simplified))
+
+
 class TransformGeom(Configurable):
     """
     Transform geometry
 
+    Coordinate transformations are built once by source projection.
+
     Options:
       `ct` destination projection
       `geom_in` property of input geometry
@@ -489,17 +1447,119 @@ class TransformGeom(Configurable):
     geom_in = Option(str, positional=True, default="geom")
     geom_out = Option(str, positional=True, default="geom")
 
+    _transforms = None
+
+    def get_transform(self, srid):
+        if self._transforms is None:
+            self._transforms = {}
+        if srid not in self._transforms:
+            self._transforms[srid] = CoordTransform(
+                SpatialReference(srid), SpatialReference(self.ct)
+            )
+        return self._transforms[srid]
+
     def __call__(self, identifier, record, *args, **kwargs):
-        record[self.geom_out] = record[self.geom_in].transform(self.ct, clone=True)
+        geometry = record[self.geom_in]
+        if geometry.srid:
+            record[self.geom_out] = geometry.transform(
+                self.get_transform(geometry.srid), clone=True
+            )
+        else:
+            record[self.geom_out] = geometry.transform(self.ct, clone=True)
         return identifier, record
 
 
+class BulkTransformGeom(BulkTransform, TransformGeom):
+    """
+    Same as TransformGeom, but coordinates of a whole window are transformed
+    at once with pyproj, directly in the WKB buffers of the geometries. The
+    destination projection must have a srid, set on output geometries.
+    """
+
+    def process_window(self, window, **kwargs):
+        if pyproj is None:
+            raise ImportError("pyproj is required by BulkTransformGeom")
+
+        target = self.get_target().srid
+        wkbs, coordinates = {}, defaultdict(list)
+        for i, (identifier, record) in enumerate(window):
+            geometry = record[self.geom_in]
+            if not geometry.srid or geometry.empty:
+                TransformGeom.__call__(self, identifier, record)
+                continue
+            if geometry.srid == target:
+                # Already in the destination projection, as GEOS does
+                record[self.geom_out] = geometry.clone()
+                continue
+            wkb = bytearray(wkb_w(dim=3 if geometry.hasz else 2).write(geometry))
+            wkbs[i] = wkb
+            dtype = np.dtype("<f8" if wkb[0] else ">f8")
+            for offset, count, dim in wkb_coordinate_ranges(wkb)[0]:
+                # Views on the coordinates of the WKB buffer
+                coordinates[geometry.srid].append(
+                    np.ndarray((count, dim), dtype=dtype, buffer=wkb, offset=offset)
+                )
+
+        for srid, arrays in coordinates.items():
+            xy = np.concatenate([array[:, :2] for array in arrays])
+            x, y = self.get_transformer(srid).transform(xy[:, 0], xy[:, 1])
+            start = 0
+            for array in arrays:
+                array[:, 0] = x[start : start + len(array)]  # noqa: E203
+                array[:, 1] = y[start : start + len(array)]  # noqa: E203
+                start += len(array)
+
+        for i, (identifier, record) in enumerate(window):
+            if i in wkbs:
+                record[self.geom_out] = GEOSGeometry(memoryview(wkbs[i]))
+                record[self.geom_out].srid = target
+            yield identifier, record
+
+    _target = None
+    _transformers = None
+
+    def get_target(self):
+        """
+        Return:
+          SpatialReference of the destination projection
+        """
+        if self._target is None:
+            target = SpatialReference(self.ct)
+            if target.srid is None:
+                raise ValueError(
+                    f"Destination projection {self.ct} has no srid to set on"
+                    " geometries, use TransformGeom"
+                )
+            self._target = target
+        return self._target
+
+    def get_transformer(self, srid):
+        if self._transformers is None:
+            self._transformers = {}
+        if srid not in self._transformers:
+            # From the definition, a srid may not be known by pyproj
+            self._transformers[srid] = pyproj.Transformer.from_crs(
+                srid, self.get_target().wkt, always_xy=True
+            )
+        return self._transformers[srid]
+
+
 class CleanOlderThan(Configurable):
     """
     Clean features of layer older than input date
 
+    With `chunk_size`, features are deleted by chunks of `chunk_size`
+    features, each one committed in its own transaction. When features only
+    have related objects deleted in cascade, without relations of their own,
+    and no delete signal receiver, chunks are deleted by raw DELETE queries,
+    related objects in the same queries. Otherwise chunks are deleted by
+    Django.
+
     Options:
       `time` date threshold
+      `layer_name` name of the layer to clean
+      `chunk_size` number of features deleted by each query
+      `pause` seconds to wait between each chunk
 
     Return:
       str identifier of the record
@@ -508,13 +1568,104 @@ class CleanOlderThan(Configurable):
 
     time = Option(None, required=True, positional=True)
     layer_name = Option(str, required=True)
+    chunk_size = Option(int, required=False, default=None)
+    pause = Option(float, required=False, default=0)
 
     @ContextProcessor
     def context(self, context, *args, **kwargs):
+        delete_chunk = self.get_delete_chunk() if self.chunk_size else None
         yield context
-        Feature.objects.filter(layer__name=self.layer_name).filter(
-            updated_at__lt=self.time
-        ).delete()
+        if self.chunk_size:
+            deleted = self.delete_chunks(delete_chunk)
+        else:
+            _, deleted = (
+                Feature.objects.filter(layer__name=self.layer_name)
+                .filter(updated_at__lt=self.time)
+                .delete()
+            )
+            deleted = deleted.get(Feature._meta.label, 0)
+        logger.info(f"{deleted} features deleted from layer {self.layer_name}")
+
+    def get_cascades(self):
+        """
+        Return:
+          dict conditions by table of related objects deleted in cascade, None
+          when raw queries would not delete like Django
+        """
+        related_models = [r.related_model for r in Feature._meta.related_objects]
+        for model in [Feature, *related_models]:
+            if pre_delete.has_listeners(model) or post_delete.has_listeners(model):
+                return None
+        cascades = defaultdict(list)
+        for related in Feature._meta.related_objects:
+            if (
+                related.on_delete is not models.CASCADE
+                or related.related_model._meta.related_objects
+            ):
+                return None
+            cascades[related.related_model._meta.db_table].append(
+                f"{related.field.column} IN (SELECT id FROM chunk)"
+            )
+        return cascades
+
+    def get_delete_chunk(self):
+        """
+        Return:
+          function deleting a chunk, returning the count of features deleted
+        """
+        cascades = self.get_cascades()
+        if cascades is None:
+            logger.info(
+                "Features have relations or delete signals handled by Django,"
+                f" deleting chunks of {self.layer_name} with Django"
+            )
+            features = Feature.objects.filter(
+                layer__name=self.layer_name, updated_at__lt=self.time
+            )
+
+            def delete_chunk():
+                chunk = list(features.values_list("pk", flat=True)[: self.chunk_size])
+                _, deleted = Feature.objects.filter(pk__in=chunk).delete()
+                return deleted.get(Feature._meta.label, 0)
+
+            return delete_chunk
+
+        queries = [f"""chunk AS (
+                SELECT id
+                FROM {Feature._meta.db_table}
+                WHERE
+                    layer_id = (SELECT id FROM {Layer._meta.db_table} WHERE name = %s)
+                    AND updated_at < %s
+                LIMIT %s
+            )"""]
+        queries += [
+            f"cascade_{i} AS (DELETE FROM {table} WHERE {' OR '.join(conditions)})"
+            for i, (table, conditions) in enumerate(cascades.items())
+        ]
+        sql_query = f"""
+            WITH {", ".join(queries)}
+            DELETE FROM {Feature._meta.db_table}
+            WHERE id IN (SELECT id FROM chunk)
+        """
+
+        def delete_chunk():
+            with connection.cursor() as cursor:
+                cursor.execute(sql_query, [self.layer_name, self.time, self.chunk_size])
+                return cursor.rowcount
+
+        return delete_chunk
+
+    def delete_chunks(self, delete_chunk):
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                count = delete_chunk()
+            deleted += count
+            logger.debug(f"{deleted} features deleted from {self.layer_name}")
+            if count < self.chunk_size:
+                return deleted
+            if self.pause:
+                sleep(self.pause)
 
     def __call__(self, context, identifier, properties, *args, **kwargs):
         return NOT_MODIFIED
@@ -538,8 +1689,15 @@ class IntersectionGeom(Configurable):
     geom = Option(str, positional=True, default="geom")
     geom_dest = Option(str, positional=True, default="geom")
 
+    _layer = None
+
+    def get_layer(self):
+        if self._layer is None:
+            self._layer = Layer.objects.get(name=self.layer)
+        return self._layer
+
     def __call__(self, identifier, record, *args, **kwargs):
-        layer = Layer.objects.get(name=self.layer)
+        layer = self.get_layer()
         try:
             zone = (
                 layer.features.filter(geom__intersects=record[self.geom])
@@ -555,3 +1713,96 @@ class IntersectionGeom(Configurable):
             logger.error(f"identifier {identifier} got error {e}")
 
         yield identifier, record
+
+
+class BulkIntersectionGeom(BulkTransform, IntersectionGeom):
+    """
+    Same as IntersectionGeom, but intersects a whole window of records in one
+    query.
+    """
+
+    def process_window(self, window, **kwargs):
+        try:
+            with transaction.atomic():
+                zones = intersection_zones(
+                    self.get_layer(), window, self.geom, "ST_AsEWKB(zone.geom)"
+                )
+        except Exception as e:
+            logger.error(f"window got error {e}, intersecting record by record")
+            for identifier, record in window:
+                yield from IntersectionGeom.__call__(self, identifier, record)
+            return
+
+        for i, (identifier, record) in enumerate(window):
+            if i in zones:
+                zone = zones[i]
+                record[self.geom_dest] = zone and GEOSGeometry(memoryview(zone))
+            yield identifier, record
+
+
+def intersection_zones(layer, window, geom, select):
+    """
+    Union of the intersections of each geometry of the window with the
+    features of the layer, computed in one query.
+
+    `select` is the SQL expression returned for each geometry, from the
+    `input.geom` geometry in the features projection, `input.source` the same
+    geometry in its own projection, and its `zone.geom` intersection, NULL
+    when there is no intersection.
+
+    Records without geometry are logged and missing from the returned dict,
+    indexed by position in the window.
+    """
+    geometries = []
+    for identifier, record in window:
+        if record.get(geom) is None:
+            logger.error(f"identifier {identifier} got error no geometry {geom}")
+            geometries.append(None)
+        else:
+            geometry = record[geom]
+            if not geometry.srid:
+                geometry = geometry.clone()
+                geometry.srid = Feature._meta.get_field("geom").srid
+            geometries.append(bytes(geometry.ewkb))
+
+    sql_query = f"""
+        WITH input AS (
+            SELECT
+                input.ordinality,
+                ST_Transform(ST_GeomFromEWKB(input.wkb), %(srid)s) AS geom,
+                ST_GeomFromEWKB(input.wkb) AS source
+            FROM
+                unnest(%(geometries)s::bytea[]) WITH ORDINALITY AS input(wkb, ordinality)
+            WHERE
+                input.wkb IS NOT NULL
+        ),
+        zone AS (
+            SELECT
+                input.ordinality,
+                ST_Union(ST_MakeValid(ST_Intersection(feature.geom, input.geom))) AS geom
+            FROM
+                input
+                JOIN {Feature._meta.db_table} AS feature
+                    ON feature.layer_id = %(layer)s
+                    AND ST_Intersects(feature.geom, input.geom)
+            GROUP BY
+                input.ordinality
+        )
+        SELECT
+            input.ordinality,
+            {select}
+        FROM
+            input
+            LEFT JOIN zone ON zone.ordinality = input.ordinality
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql_query,
+            {
+                "srid": Feature._meta.get_field("geom").srid,
+                "geometries": geometries,
+                "layer": layer.pk,
+            },
+        )
+        return {ordinality - 1: value for ordinality, value in cursor.fetchall()}
@@ -0,0 +1,122 @@
+"""
+Throughput benchmarks of terra_bonobo_nodes.
+
+Each benchmark is a function registered with `@benchmark`, returning a tuple
+(run, records) or (run, records, setup): `run` is a callable processing
+`records` records once, `setup` is called before each run, out of measures.
+
+Benchmarks needing a database are skipped unless run with `--db`, it then
+creates a test database on the PostGIS configured by POSTGRES_* environment
+variables, as tests do.
+
+Usage:
+  python -m test_terra_bonobo_nodes.benchmarks [-o results.json] [name ...]
+"""
+
+import shutil
+import time
+import tracemalloc
+from contextlib import ExitStack
+from types import GeneratorType
+
+from bonobo.util.testing import BufferingNodeExecutionContext
+
+BENCHMARKS = {}
+
+DATABASE = {"ready": False}
+
+_cleanup = ExitStack()
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def require_database():
+    if not DATABASE["ready"]:
+        raise SkipBenchmark("needs a database, run with --db")
+
+
+def require_command(command):
+    if shutil.which(command) is None:
+        raise SkipBenchmark(f"needs {command} command")
+
+
+def enter(context_manager):
+    """
+    Enter a context manager, like a stand-in server, for the duration of the
+    running benchmark.
+    """
+    return _cleanup.enter_context(context_manager)
+
+
+def run_node(node, rows, services=None):
+    """
+    Run a node in an execution context, writing all `rows`, so that context
+    processors run as in a graph.
+
+    Return:
+      list output rows
+    """
+    with BufferingNodeExecutionContext(node, services=services) as context:
+        for row in rows:
+            # Input queue is bounded, rows are written one by one
+            context.write_sync(row)
+    return context.get_buffer()
+
+
+def call_node(node, rows, *args):
+    """
+    Call a node on each row, consuming generated rows.
+    """
+    for row in rows:
+        result = node(*row, *args)
+        if isinstance(result, GeneratorType):
+            for _ in result:
+                pass
+
+
+def measure(name, repeat=3):
+    """
+    Run a registered benchmark `repeat` times and keep the best time, then run
+    it once more under tracemalloc to get the peak memory.
+
+    Return:
+      dict measures
+    """
+    with _cleanup:
+        try:
+            run, records, *setup = BENCHMARKS[name]()
+        except SkipBenchmark as e:
+            return {"skipped": str(e)}
+        setup = setup[0] if setup else None
+
+        seconds = []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        "records": records,
+        "seconds": best,
+        "records_per_second": records / best if best else None,
+        "peak_memory": peak_memory,
+    }
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_terra_bonobo_nodes.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from test_terra_bonobo_nodes.benchmarks import (  # noqa: E402,F401
+    BENCHMARKS,
+    DATABASE,
+    bench_archive,
+    bench_arrow,
+    bench_common,
+    bench_elasticsearch,
+    bench_osm,
+    bench_parquet,
+    bench_shapefile,
+    bench_sql,
+    bench_terra,
+    measure,
+)
+
+parser = argparse.ArgumentParser(description="Run terra_bonobo_nodes benchmarks")
+parser.add_argument("names", nargs="*", help="benchmarks to run, default: all")
+parser.add_argument("-o", "--output", help="JSON file where results are written")
+parser.add_argument("-r", "--repeat", type=int, default=3)
+parser.add_argument(
+    "-c", "--compare", help="JSON file of previous results to compare with"
+)
+parser.add_argument(
+    "--db", action="store_true", help="create a test database to run DB benchmarks"
+)
+args = parser.parse_args()
+
+previous = {}
+if args.compare:
+    with open(args.compare) as compare:
+        previous = json.load(compare)["benchmarks"]
+
+if args.db:
+    setup_test_environment()
+    database_name = connection.creation.create_test_db(verbosity=0)
+    DATABASE["ready"] = True
+
+results = {}
+try:
+    for name in args.names or sorted(BENCHMARKS):
+        results[name] = measure(name, repeat=args.repeat)
+        if "skipped" in results[name]:
+            print(f"{name:50} skipped, {results[name]['skipped']}")
+            continue
+        line = (
+            f"{name:50} {results[name]['records_per_second']:>14.1f} rec/s"
+            f" {results[name]['peak_memory'] / 2 ** 20:>10.1f} MiB"
+        )
+        if previous.get(name, {}).get("records_per_second"):
+            ratio = (
+                results[name]["records_per_second"]
+                / previous[name]["records_per_second"]
+            )
+            line += f" {ratio:>8.2f}x"
+        print(line)
+finally:
+    if args.db:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+        teardown_test_environment()
+
+if args.output:
+    commit = subprocess.run(
+        ["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, encoding="utf8"
+    ).stdout.strip()
+    with open(args.output, "w") as output:
+        json.dump(
+            {
+                "commit": commit or None,
+                "date": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "benchmarks": results,
+            },
+            output,
+            indent=2,
+        )
@@ -0,0 +1,24 @@
+from terra_bonobo_nodes import archive
+
+from . import benchmark, call_node
+from .data import csv_content, geojson_content, zip_content
+
+
+@benchmark
+def zipreader(records=100):
+    node = archive.ZipReader()
+    content = zip_content(
+        {
+            f"{name}_{i}.{name}": data
+            for i in range(records // 2)
+            for name, data in (
+                ("csv", csv_content(1000)),
+                ("geojson", geojson_content(1000)),
+            )
+        }
+    )
+
+    def run():
+        call_node(node, [(content,)])
+
+    return run, records
@@ -0,0 +1,80 @@
+from terra_bonobo_nodes import arrow, common
+
+from . import benchmark
+from .data import csv_content, geojson_content, point_features
+
+# Outputs are kept until the end of runs, so that peak memory compares
+# records and tables representations. Arrow buffers are allocated out of
+# tracemalloc sight, their size is pyarrow.total_allocated_bytes()
+
+
+@benchmark
+def geojsonreader_retained(records=20000):
+    node = common.GeojsonReader("geom")
+    content = geojson_content(records)
+
+    def run():
+        rows = list(node(content))
+        assert len(rows) == records
+
+    return run, records
+
+
+@benchmark
+def arrowgeojsonreader(records=20000):
+    node = arrow.ArrowGeojsonReader("geom")
+    content = geojson_content(records)
+
+    def run():
+        tables = list(node(content))
+        assert sum(table.num_rows for table in tables) == records
+
+    return run, records
+
+
+@benchmark
+def csvdictreader_retained(records=50000):
+    node = common.CsvDictReader()
+    content = csv_content(records).encode()
+
+    def run():
+        rows = list(node(content))
+        assert len(rows) == records
+
+    return run, records
+
+
+@benchmark
+def arrowcsvdictreader(records=50000):
+    node = arrow.ArrowCsvDictReader()
+    content = csv_content(records).encode()
+
+    def run():
+        tables = list(node(content))
+        assert sum(table.num_rows for table in tables) == records
+
+    return run, records
+
+
+@benchmark
+def toarrow(records=20000):
+    node = arrow.ToArrow()
+    batch = list(enumerate(common.GeojsonReader("geom")(geojson_content(records))))
+
+    def run():
+        node(batch)
+
+    return run, records
+
+
+@benchmark
+def arrowexcludeattributes(records=50000):
+    node = arrow.ArrowExcludeAttributes(["name", "kind"])
+    table = arrow.records_to_table(
+        [feature["properties"] for feature in point_features(records)]
+    )
+
+    def run():
+        node(table)
+
+    return run, records
@@ -0,0 +1,473 @@
+import json
+import logging
+
+import requests
+from django.contrib.gis.geos import GEOSGeometry, Point
+from django.contrib.gis.geos.prototypes.io import wkt_w
+from django.test import override_settings
+from geostore.models import Feature, Layer
+
+from terra_bonobo_nodes import common, instrumentation
+
+from .. import standins
+from . import benchmark, call_node, enter, require_database, run_node
+from .data import (
+    coordinate_records,
+    csv_content,
+    geojson_content,
+    large_multipolygon,
+    point_features,
+)
+
+
+@benchmark
+def geometry3dto2d(records=200):
+    node = common.Geometry3Dto2D("geom", "geom_2d")
+    geom = large_multipolygon(z=True)
+
+    def run():
+        for i in range(records):
+            for _ in node(i, {"geom": geom}):
+                pass
+
+    return run, records
+
+
+@benchmark
+def batchgeometry3dto2d(records=200):
+    node = common.BatchGeometry3Dto2D("geom", "geom_2d")
+    geom = large_multipolygon(z=True)
+
+    def run():
+        node([(i, {"geom": geom}) for i in range(records)])
+
+    return run, records
+
+
+@benchmark
+def geometry3dto2d_wkt(records=200):
+    """Former WKT round trip of Geometry3Dto2D, as reference."""
+    geom = large_multipolygon(z=True)
+
+    def run():
+        for _ in range(records):
+            GEOSGeometry(wkt_w(dim=2).write(geom).decode(), srid=geom.srid)
+
+    return run, records
+
+
+@benchmark
+def force_2d(records=200):
+    geometries = [large_multipolygon(z=True)] * records
+
+    def run():
+        common.force_2d(geometries)
+
+    return run, records
+
+
+@benchmark
+def geometrytojson(records=200):
+    node = common.GeometryToJson("geom", "json")
+    geom = large_multipolygon()
+
+    def run():
+        for i in range(records):
+            node(i, {"geom": geom})
+
+    return run, records
+
+
+@benchmark
+def geometrytojson_geojson(records=200):
+    """Former GeoJSON string round trip of GeometryToJson, as reference."""
+    geom = large_multipolygon()
+
+    def run():
+        for _ in range(records):
+            json.loads(geom.simplify(0.0).geojson)
+
+    return run, records
+
+
+@benchmark
+def attributestopointgeometry(records=20000):
+    node = common.AttributesToPointGeometry(x="x", y="y", geom="geom")
+
+    def run():
+        for identifier, record in coordinate_records(records):
+            node(identifier, record)
+
+    return run, records
+
+
+@benchmark
+def bulkattributestopointgeometry(records=20000):
+    node = common.BulkAttributesToPointGeometry(x="x", y="y", geom="geom")
+
+    def run():
+        list(node.process_window(coordinate_records(records)))
+
+    return run, records
+
+
+@benchmark
+def attributetogeometry(records=100):
+    node = common.AttributeToGeometry(attribute="wkb", geom="geom")
+    wkb = bytes(large_multipolygon().wkb)
+
+    def run():
+        for i in range(records):
+            for _ in node(i, {"wkb": wkb}):
+                pass
+
+    return run, records
+
+
+@benchmark
+def attributetogeometry_validate(records=100):
+    node = common.AttributeToGeometry(attribute="wkb", geom="geom", validate=True)
+    wkb = bytes(large_multipolygon().wkb)
+
+    def run():
+        for i in range(records):
+            for _ in node(i, {"wkb": wkb}):
+                pass
+
+    return run, records
+
+
+def _split_record():
+    return {
+        "geom": large_multipolygon(),
+        "centroids": [large_multipolygon(parts=1, vertices=10).centroid] * 10,
+        "tags": {"name": "feature", "kind": "coastline"},
+        "area": 1.5,
+    }
+
+
+@benchmark
+def copyonpipelinesplit_copy_on_write(records=200):
+    node = common.CopyOnPipelineSplit(copy_on_write=True)
+    record = _split_record()
+
+    def run():
+        for i in range(records):
+            for _, copy in node(i, record):
+                copy["geom"] = None
+
+    return run, records
+
+
+@benchmark
+def copyonpipelinesplit(records=200):
+    node = common.CopyOnPipelineSplit()
+    record = _split_record()
+
+    def run():
+        for i in range(records):
+            for _, copy in node(i, record):
+                copy["geom"] = None
+
+    return run, records
+
+
+@benchmark
+def csvdictreader(records=20000):
+    node = common.CsvDictReader()
+    content = csv_content(records).encode()
+
+    def run():
+        call_node(node, [(content,)])
+
+    return run, records
+
+
+@benchmark
+def geojsonreader(records=5000):
+    node = common.GeojsonReader("geom")
+    content = geojson_content(records)
+
+    def run():
+        call_node(node, [(content,)])
+
+    return run, records
+
+
+def _feature_rows(records):
+    return [
+        (feature["properties"]["id"], {**feature["properties"], "times": [3, 1, 2]})
+        for feature in point_features(records)
+    ]
+
+
+@benchmark
+def identifierfromproperty(records=50000):
+    node = common.IdentifierFromProperty("id")
+    rows = [(record,) for _, record in _feature_rows(records)]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def generateidentifier(records=50000):
+    node = common.GenerateIdentifier()
+    rows = [(record,) for _, record in _feature_rows(records)]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def excludeattributes(records=50000):
+    node = common.ExcludeAttributes(["name", "kind"])
+    rows = []
+
+    def setup():
+        rows[:] = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records, setup
+
+
+@benchmark
+def excludeattributes_instrumented(records=50000):
+    node = common.ExcludeAttributes(["name", "kind"])
+    rows = []
+    enter(instrumentation.Instrumentation())
+
+    def setup():
+        rows[:] = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records, setup
+
+
+def _transforms_graph(records, nodes):
+    rows = []
+
+    def setup():
+        rows[:] = _feature_rows(records)
+
+    def run():
+        output = rows
+        for node in nodes:
+            output = run_node(node, output)
+
+    return run, records, setup
+
+
+@benchmark
+def transforms_graph(records=20000):
+    return _transforms_graph(
+        records,
+        [
+            common.ExcludeAttributes(["name"]),
+            common.FilterAttributes(["id", "value", "times"]),
+            common.MapProperties(lambda record: {**record, "count": 1}),
+        ],
+    )
+
+
+@benchmark
+def batchtransforms_graph(records=20000):
+    """Same transforms as transforms_graph, between Batch and Unbatch."""
+    return _transforms_graph(
+        records,
+        [
+            common.Batch(size=1000),
+            common.BatchExcludeAttributes(["name"]),
+            common.BatchFilterAttributes(["id", "value", "times"]),
+            common.BatchMapProperties(lambda record: {**record, "count": 1}),
+            common.Unbatch(),
+        ],
+    )
+
+
+@benchmark
+def filterattributes(records=50000):
+    node = common.FilterAttributes(["id", "value"])
+    rows = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def filterbyproperties(records=50000):
+    node = common.FilterByProperties(lambda identifier, record: record["value"] > 50)
+    rows = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def minarrayattribute(records=50000):
+    node = common.MinArrayAttribute("times")
+    rows = []
+
+    def setup():
+        rows[:] = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records, setup
+
+
+@benchmark
+def mapproperties(records=50000):
+    node = common.MapProperties(lambda record: {**record, "mapped": True})
+    rows = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def geometrytocentroid(records=200):
+    node = common.GeometryToCentroid("geom", "centroid")
+    geom = large_multipolygon()
+    rows = [(i, {"geom": geom}) for i in range(records)]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def dropidentifier(records=50000):
+    node = common.DropIdentifier()
+    rows = _feature_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def djangolog(records=5000):
+    node = common.DjangoLog(log_level=logging.DEBUG)
+    rows = [(i, {"geom": Point(i, i, srid=4326)}) for i in range(records)]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+def _clusters(name, records, size=10):
+    """
+    Ids of `records` clusters of `size` features
+    """
+    require_database()
+    layer = Layer.objects.create(name=name)
+    features = Feature.objects.bulk_create(
+        Feature(layer=layer, geom=Point(i, i, srid=4326), properties={"value": i})
+        for i in range(records * size)
+    )
+    return [
+        [feature.pk for feature in features[i * size : (i + 1) * size]]  # noqa: E203
+        for i in range(records)
+    ]
+
+
+@benchmark
+def collectandsum(records=100):
+    node = common.CollectAndSum("geom", {"total": "value"})
+    rows = [
+        (i, Feature.objects.filter(pk__in=ids))
+        for i, ids in enumerate(_clusters("bench_collectandsum", records))
+    ]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def bulkcollectandsum(records=100):
+    node = common.BulkCollectAndSum("geom", {"total": "value"})
+    rows = [
+        (i, Feature.objects.filter(pk__in=ids))
+        for i, ids in enumerate(_clusters("bench_bulkcollectandsum", records))
+    ]
+
+    def run():
+        list(node.process_window(rows))
+
+    return run, records
+
+
+@benchmark
+def isochronecalculation(records=50):
+    server = enter(standins.graphhopper(latency=0.005))
+    enter(override_settings(GRAPHHOPPER=server.url))
+    node = common.IsochroneCalculation()
+    session = requests.Session()
+    rows = [(i, {"geom": Point(i % 180, 45)}) for i in range(records)]
+
+    def run():
+        call_node(node, rows, session)
+
+    return run, records
+
+
+@benchmark
+def concurrentisochronecalculation(records=50):
+    server = enter(standins.graphhopper(latency=0.005))
+    enter(override_settings(GRAPHHOPPER=server.url))
+    node = common.ConcurrentIsochroneCalculation(concurrency=8)
+    rows = [(i, {"geom": Point(i % 180, 45)}) for i in range(records)]
+
+    def run():
+        run_node(node, rows, services={"http": requests.Session()})
+
+    return run, records
+
+
+@benchmark
+def isochronesubstraction(records=100):
+    node = common.IsochroneSubstraction()
+    rows = [
+        (i, {"geom": Point(0, 0, srid=4326).buffer(1 + i % 3, quadsegs=32)})
+        for i in range(records)
+    ]
+
+    def run():
+        run_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def uniononproperty(records=300):
+    node = common.UnionOnProperty("geom", "level")
+    rows = [
+        (i, {"level": i % 3, "geom": Point(i % 30, i // 30).buffer(1, quadsegs=8)})
+        for i in range(records)
+    ]
+
+    def run():
+        run_node(node, rows)
+
+    return run, records
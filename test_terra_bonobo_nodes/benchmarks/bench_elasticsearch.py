@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from elasticsearch import Elasticsearch
+
+from terra_bonobo_nodes import checkpoint, elasticsearch
+
+from .. import standins
+from . import benchmark, enter, run_node
+from .data import point_features
+
+
+@benchmark
+def esextract(records=20000):
+    server = enter(
+        standins.elasticsearch(f["properties"] for f in point_features(records))
+    )
+    node = elasticsearch.ESExtract("index")
+    es = Elasticsearch(server.url)
+
+    def run():
+        for _ in node(es):
+            pass
+
+    return run, records
+
+
+@benchmark
+def loadines(records=20000):
+    server = enter(standins.elasticsearch())
+    node = elasticsearch.LoadInES("index")
+    rows = [
+        (f["properties"]["id"], {**f["properties"], "geom": f["geometry"]})
+        for f in point_features(records)
+    ]
+
+    def run():
+        run_node(node, rows, services={"es": Elasticsearch(server.url)})
+
+    return run, records
+
+
+def _esextract_loadines(records, with_checkpoint):
+    server = enter(
+        standins.elasticsearch(f["properties"] for f in point_features(records))
+    )
+    path = os.path.join(enter(tempfile.TemporaryDirectory()), "checkpoint.json")
+    es = Elasticsearch(server.url)
+
+    def run():
+        state = checkpoint.Checkpoint(path) if with_checkpoint else None
+        rows = elasticsearch.ESExtract("index", checkpoint=state)(es)
+        run_node(elasticsearch.LoadInES("index", checkpoint=state), rows, {"es": es})
+
+    return run, records
+
+
+@benchmark
+def esextract_loadines(records=20000):
+    return _esextract_loadines(records, False)
+
+
+@benchmark
+def esextract_loadines_checkpoint(records=20000):
+    # Same round trips, search_after pages instead of scrolls
+    return _esextract_loadines(records, True)
+
+
+@benchmark
+def esgeometryfield(records=1):
+    server = enter(standins.elasticsearch())
+    node = elasticsearch.ESGeometryField("index", "geom")
+    es = Elasticsearch(server.url)
+
+    def setup():
+        server.indices.clear()
+
+    def run():
+        node(es)
+
+    return run, records, setup
+
+
+@benchmark
+def esoptimizeindexing(records=1):
+    server = enter(standins.elasticsearch())
+    node = elasticsearch.ESOptimizeIndexing("index")
+    es = Elasticsearch(server.url)
+
+    def run():
+        node(es)
+
+    return run, records
@@ -0,0 +1,49 @@
+import requests
+
+from terra_bonobo_nodes import osm
+
+from .. import standins
+from . import benchmark, call_node, enter, require_command
+from .data import osm_xml
+
+
+@benchmark
+def overpassextract(records=10000):
+    server = enter(standins.overpass(osm_xml(records)))
+    node = osm.OverpassExtract("node[amenity=school];out;", overpass_url=server.url)
+    session = requests.Session()
+
+    def run():
+        for _ in node(session):
+            pass
+
+    return run, records
+
+
+@benchmark
+def osmxmltogeojson(records=10000):
+    require_command("ogr2ogr")
+    node = osm.OsmXMLtoGeojson(osm.OsmXMLtoGeojson.Geometry.POINTS)
+    content = osm_xml(records).encode()
+
+    def run():
+        call_node(node, [(content,)])
+
+    return run, records
+
+
+@benchmark
+def ogr2ogrgeojson2geojson(records=50000):
+    node = osm.Ogr2ogrGeojson2Geojson()
+    rows = []
+
+    def setup():
+        rows[:] = [
+            ({"osm_id": i, "other_tags": f'"amenity"=>"school","ref"=>"{i}"'},)
+            for i in range(records)
+        ]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records, setup
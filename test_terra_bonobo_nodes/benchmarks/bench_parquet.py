@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+from terra_bonobo_nodes import common, parquet
+
+from . import benchmark, call_node, enter, run_node
+from .data import geojson_content
+
+# Compare with geojsonreader: a GeoParquet file is the exchange format of
+# records between pipelines
+
+
+def _rows(records, sort=False):
+    rows = list(enumerate(common.GeojsonReader("geom")(geojson_content(records))))
+    if sort:
+        # Spatially sorted rows, so that row groups cover distinct areas
+        rows.sort(key=lambda row: row[1]["geom"].coords)
+    return rows
+
+
+def _write(rows, **options):
+    directory = enter(tempfile.TemporaryDirectory())
+    path = os.path.join(directory, "records.parquet")
+    run_node(parquet.GeoParquetWriter(path, **options), rows)
+    return path
+
+
+@benchmark
+def geoparquetwriter(records=20000):
+    rows = _rows(records)
+    path = os.path.join(enter(tempfile.TemporaryDirectory()), "records.parquet")
+    node = parquet.GeoParquetWriter(path)
+
+    def run():
+        run_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def geoparquetreader(records=20000):
+    node = parquet.GeoParquetReader(_write(_rows(records)))
+
+    def run():
+        call_node(node, [()])
+
+    return run, records
+
+
+@benchmark
+def geoparquetreader_columns(records=20000):
+    node = parquet.GeoParquetReader(_write(_rows(records)), columns=["value"])
+
+    def run():
+        call_node(node, [()])
+
+    return run, records
+
+
+@benchmark
+def geoparquetreader_bbox(records=20000):
+    # A tenth of the longitudes, out of 20 row groups of sorted rows
+    path = _write(_rows(records, sort=True), row_group_size=records // 20)
+    node = parquet.GeoParquetReader(path, bbox=(-180, -90, -144, 90))
+
+    def run():
+        call_node(node, [()])
+
+    return run, records
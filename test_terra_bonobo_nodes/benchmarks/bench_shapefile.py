@@ -0,0 +1,16 @@
+from terra_bonobo_nodes import shapefile
+
+from . import benchmark, call_node, require_command
+from .data import zipped_shapefile
+
+
+@benchmark
+def zipshapefiletogeojson(records=10000):
+    require_command("ogr2ogr")
+    node = shapefile.ZipShapefileToGeojson()
+    content = zipped_shapefile(records)
+
+    def run():
+        call_node(node, [(content,)])
+
+    return run, records
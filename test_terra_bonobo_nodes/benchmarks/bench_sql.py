@@ -0,0 +1,67 @@
+from terra_bonobo_nodes import sql
+
+from . import benchmark, call_node, require_database, run_node
+
+
+@benchmark
+def sqlextract(records=100000):
+    require_database()
+    node = sql.SQLExtract(
+        f"SELECT i AS id, i * 0.5 AS value, md5(i::text) AS name "
+        f"FROM generate_series(1, {records}) AS i",
+        "id",
+    )
+
+    def run():
+        for _ in node():
+            pass
+
+    return run, records
+
+
+@benchmark
+def attributefromsql(records=1000):
+    require_database()
+    node = sql.AttributeFromSQL(
+        "SELECT i AS id, %s::int * i AS value FROM generate_series(1, 5) AS i",
+        "values",
+    )
+    rows = [(i, {}) for i in range(records)]
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def attributefromsql_prepared(records=1000):
+    require_database()
+    node = sql.AttributeFromSQL(
+        "SELECT i AS id, %s::int * i AS value FROM generate_series(1, 5) AS i",
+        "values",
+        prepare=True,
+    )
+    rows = [(i, {}) for i in range(records)]
+
+    def run():
+        run_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def bulkattributefromsql(records=1000):
+    # One round trip by window instead of one by record
+    require_database()
+    node = sql.BulkAttributeFromSQL(
+        "SELECT i AS id, %s::int * i AS value FROM generate_series(1, 5) AS i",
+        "values",
+        window_length=100,
+    )
+    rows = [(i, {}) for i in range(records)]
+
+    def run():
+        run_node(node, rows)
+
+    return run, records
@@ -0,0 +1,552 @@
+import random
+
+import requests
+from django.contrib.gis.geos import Point, Polygon
+from django.test import override_settings
+from django.utils import timezone
+
+from terra_bonobo_nodes import terra
+
+from .. import standins
+from . import (
+    SkipBenchmark,
+    benchmark,
+    call_node,
+    enter,
+    require_database,
+    run_node,
+)
+from .data import large_multipolygon
+
+
+@benchmark
+def subdividegeom_local(records=20):
+    node = terra.SubdivideGeom(max_vertices=256, local=True)
+    geom = large_multipolygon()
+
+    def run():
+        for i in range(records):
+            for _ in node(i, {"geom": geom}):
+                pass
+
+    return run, records
+
+
+@benchmark
+def coveragesimplifygeom_local(records=500):
+    node = terra.CoverageSimplifyGeom(0.01, geom_out="simplified", local=True)
+    try:
+        node.use_postgis()
+    except RuntimeError as e:
+        raise SkipBenchmark(str(e))
+    rows = [
+        (i, {"geom": Point(i % 100, i // 100, srid=4326).buffer(0.5, quadsegs=64)})
+        for i in range(records)
+    ]
+
+    def run():
+        list(node.process_window(rows))
+
+    return run, records
+
+
+@benchmark
+def transformgeom(records=200):
+    node = terra.TransformGeom("2154")
+    geom = large_multipolygon(parts=5, vertices=200)
+
+    def run():
+        for i in range(records):
+            node(i, {"geom": geom})
+
+    return run, records
+
+
+@benchmark
+def transformgeom_uncached(records=200):
+    """Former transformation by SRID of TransformGeom, as reference."""
+    geom = large_multipolygon(parts=5, vertices=200)
+
+    def run():
+        for _ in range(records):
+            geom.transform("2154", clone=True)
+
+    return run, records
+
+
+@benchmark
+def bulktransformgeom(records=200):
+    node = terra.BulkTransformGeom("2154")
+    geom = large_multipolygon(parts=5, vertices=200)
+
+    def run():
+        list(node.process_window([(i, {"geom": geom}) for i in range(records)]))
+
+    return run, records
+
+
+def _layer(name, records, size=0.5, shuffle=False):
+    """
+    Layer of `records` square polygons on a grid, having a `value` property,
+    inserted in random order with `shuffle`.
+    """
+    require_database()
+    layer = terra.Layer.objects.create(name=name)
+    values = list(range(records))
+    if shuffle:
+        random.Random(0).shuffle(values)
+    terra.Feature.objects.bulk_create(
+        terra.Feature(
+            layer=layer,
+            identifier=str(i),
+            geom=Polygon.from_bbox(
+                (i % 100, i // 100, i % 100 + size, i // 100 + size)
+            ),
+            properties={"value": i},
+        )
+        for i in values
+    )
+    return layer
+
+
+def _grid_rows(records, size=0.75):
+    return [
+        (
+            i,
+            {
+                "geom": Polygon.from_bbox(
+                    (i % 100, i // 100, i % 100 + size, i // 100 + size)
+                )
+            },
+        )
+        for i in range(records)
+    ]
+
+
+@benchmark
+def layerclusters(records=10000):
+    layer = _layer("bench_layerclusters", records)
+    node = terra.LayerClusters([layer], 4326, 5)
+
+    def run():
+        for _ in node():
+            pass
+
+    return run, records
+
+
+@benchmark
+def layerclusters_aggregate(records=10000):
+    layer = _layer("bench_layerclusters_aggregate", records)
+    node = terra.LayerClusters(
+        [layer], 4326, 5, aggregate=True, sum_fields={"total": "value"}
+    )
+
+    def run():
+        for _ in node():
+            pass
+
+    return run, records
+
+
+@benchmark
+def subdividegeom(records=20):
+    require_database()
+    node = terra.SubdivideGeom(max_vertices=256)
+    geom = large_multipolygon()
+
+    def run():
+        for i in range(records):
+            for _ in node(i, {"geom": geom}):
+                pass
+
+    return run, records
+
+
+@benchmark
+def bulksubdividegeom(records=20):
+    require_database()
+    node = terra.BulkSubdivideGeom(max_vertices=256)
+    geom = large_multipolygon()
+
+    def run():
+        list(node.process_window([(i, {"geom": geom}) for i in range(records)]))
+
+    return run, records
+
+
+def _load_rows(records, changed=1.0):
+    return [
+        (
+            str(i),
+            {
+                "geom": Point(i % 360 - 180, i % 170 - 85, srid=4326),
+                "value": i if i < records * changed else -i,
+            },
+        )
+        for i in range(records)
+    ]
+
+
+@benchmark
+def loadfeatureinlayer(records=10000):
+    require_database()
+    layer = terra.Layer.objects.create(name="bench_loadfeatureinlayer")
+    node = terra.LoadFeatureInLayer(layer=layer, window_length=1000)
+    rows = _load_rows(records)
+
+    def run():
+        run_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def loadfeatureinlayer_incremental(records=10000):
+    """Incremental load where 1% of features changed."""
+    require_database()
+    layer = terra.Layer.objects.create(name="bench_loadfeatureinlayer_incremental")
+    node = terra.LoadFeatureInLayer(layer=layer, window_length=1000, incremental=True)
+    run_node(node, _load_rows(records))
+    rows, changed = [], [1.0, 0.99]
+
+    def setup():
+        # Alternate loads of 1% changed features
+        changed.reverse()
+        rows[:] = _load_rows(records, changed=changed[0])
+
+    def run():
+        run_node(node, rows)
+
+    return run, records, setup
+
+
+@benchmark
+def extractfeatures(records=10000):
+    layer = _layer("bench_extractfeatures", records)
+    node = terra.ExtractFeatures(layer.features.all())
+
+    def run():
+        for _ in node():
+            pass
+
+    return run, records
+
+
+@benchmark
+def partitionedextractfeatures(records=10000):
+    layer = _layer("bench_partitionedextractfeatures", records)
+    node = terra.PartitionedExtractFeatures(layer.features.all())
+
+    def run():
+        for _ in node():
+            pass
+
+    return run, records
+
+
+@benchmark
+def partitionedextractfeatures_tile(records=10000):
+    layer = _layer("bench_partitionedextractfeatures_tile", records)
+    node = terra.PartitionedExtractFeatures(layer.features.all(), partition_by="tile")
+
+    def run():
+        for _ in node():
+            pass
+
+    return run, records
+
+
+@benchmark
+def booleanintersect(records=500):
+    _layer("bench_booleanintersect", records)
+    node = terra.BooleanIntersect("bench_booleanintersect", "intersects")
+    rows = _grid_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def intersectionpercentbyarea(records=500):
+    _layer("bench_intersectionpercentbyarea", records)
+    node = terra.IntersectionPercentByArea("bench_intersectionpercentbyarea", "percent")
+    rows = _grid_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def bulkintersectionpercentbyarea(records=500):
+    _layer("bench_bulkintersectionpercentbyarea", records)
+    node = terra.BulkIntersectionPercentByArea(
+        "bench_bulkintersectionpercentbyarea", "percent"
+    )
+    rows = _grid_rows(records)
+
+    def run():
+        list(node.process_window(rows))
+
+    return run, records
+
+
+@benchmark
+def intersectiongeom(records=500):
+    _layer("bench_intersectiongeom", records)
+    node = terra.IntersectionGeom("bench_intersectiongeom", geom_dest="zone")
+    rows = _grid_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+@benchmark
+def bulkintersectiongeom(records=500):
+    _layer("bench_bulkintersectiongeom", records)
+    node = terra.BulkIntersectionGeom("bench_bulkintersectiongeom", geom_dest="zone")
+    rows = _grid_rows(records)
+
+    def run():
+        list(node.process_window(rows))
+
+    return run, records
+
+
+@benchmark
+def closestfeatures(records=500):
+    _layer("bench_closestfeatures", records)
+    node = terra.ClosestFeatures("bench_closestfeatures", limit=3)
+    rows = _grid_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records
+
+
+def _transit_rows(records, points=5):
+    return [
+        (
+            i,
+            {
+                "geom": Point(i % 180, 45, srid=4326),
+                "points": [Point(i % 180 + p / 10, 45) for p in range(points)],
+            },
+        )
+        for i in range(records)
+    ]
+
+
+@benchmark
+def transittimeonetomany(records=20):
+    server = enter(standins.graphhopper())
+    enter(override_settings(GRAPHHOPPER=server.url))
+    node = terra.TransitTimeOneToMany(["car", "foot"])
+    session = requests.Session()
+    rows = []
+
+    def setup():
+        rows[:] = _transit_rows(records)
+
+    def run():
+        call_node(node, rows, session)
+
+    return run, records, setup
+
+
+@benchmark
+def transittimeonetoone(records=100):
+    server = enter(standins.graphhopper())
+    enter(override_settings(GRAPHHOPPER=server.url))
+    node = terra.TransitTimeOneToOne()
+    session = requests.Session()
+    rows = []
+
+    def setup():
+        rows[:] = _transit_rows(records, points=1)
+
+    def run():
+        call_node(node, rows, session)
+
+    return run, records, setup
+
+
+def _times_rows(records, points=100, modes=3):
+    return [
+        (
+            i,
+            {
+                "times": [
+                    [
+                        None if (i + p + m) % 7 == 0 else (i + p * m) % 60
+                        for m in range(modes)
+                    ]
+                    for p in range(points)
+                ]
+            },
+        )
+        for i in range(records)
+    ]
+
+
+@benchmark
+def accessibilityratiobytime(records=1000):
+    node = terra.AccessibilityRatioByTime([10, 20, 30], "ratio")
+    rows = []
+
+    def setup():
+        rows[:] = _times_rows(records)
+
+    def run():
+        call_node(node, rows)
+
+    return run, records, setup
+
+
+@benchmark
+def bulkaccessibilityratiobytime(records=1000):
+    node = terra.BulkAccessibilityRatioByTime([10, 20, 30], "ratio")
+    rows = []
+
+    def setup():
+        rows[:] = _times_rows(records)
+
+    def run():
+        list(node.process_window(rows))
+
+    return run, records, setup
+
+
+@benchmark
+def simplifygeom(records=100):
+    node = terra.SimplifyGeom(0.01, geom_out="simplified")
+    geom = large_multipolygon()
+
+    def run():
+        for i in range(records):
+            node(i, {"geom": geom})
+
+    return run, records
+
+
+@benchmark
+def simplifygeom_tolerances(records=100):
+    node = terra.SimplifyGeom(
+        tolerances={"z8": 0.1, "z10": 0.05, "z12": 0.01, "z14": 0.001}
+    )
+    geom = large_multipolygon()
+
+    def run():
+        for i in range(records):
+            node(i, {"geom": geom})
+
+    return run, records
+
+
+@benchmark
+def coveragesimplifygeom(records=500):
+    require_database()
+    node = terra.CoverageSimplifyGeom(0.01, geom_out="simplified")
+    try:
+        if not node.use_postgis():
+            raise SkipBenchmark("PostGIS too old, see coveragesimplifygeom_local")
+    except RuntimeError as e:
+        raise SkipBenchmark(str(e))
+    rows = [
+        (i, {"geom": Point(i % 100, i // 100).buffer(0.5, quadsegs=64)})
+        for i in range(records)
+    ]
+
+    def run():
+        list(node.process_window(rows))
+
+    return run, records
+
+
+@benchmark
+def cleanolderthan(records=10000):
+    require_database()
+    layer = terra.Layer.objects.create(name="bench_cleanolderthan")
+    node = terra.CleanOlderThan(timezone.now(), layer_name=layer.name)
+
+    def setup():
+        _load_features(layer, records)
+        node.time = timezone.now()
+
+    def run():
+        run_node(node, [("identifier", {})])
+
+    return run, records, setup
+
+
+@benchmark
+def cleanolderthan_chunks(records=10000):
+    require_database()
+    layer = terra.Layer.objects.create(name="bench_cleanolderthan_chunks")
+    node = terra.CleanOlderThan(timezone.now(), layer_name=layer.name, chunk_size=1000)
+
+    def setup():
+        _load_features(layer, records)
+        node.time = timezone.now()
+
+    def run():
+        run_node(node, [("identifier", {})])
+
+    return run, records, setup
+
+
+def _load_features(layer, records):
+    terra.Feature.objects.bulk_create(
+        terra.Feature(layer=layer, identifier=str(i), geom=Point(i, i, srid=4326))
+        for i in range(records)
+    )
+
+
+def _extracted_intersections(name, records, node, spatial_order=None):
+    """
+    Features of a shuffled layer extracted, in `spatial_order`, then
+    intersected by `node` with a grid layer.
+    """
+    _layer(name, records)
+    source = _layer(f"{name}_source", records, size=0.75, shuffle=True)
+    extract = terra.ExtractFeatures(
+        source.features.all(),
+        extra_properties={"geom": "geom"},
+        spatial_order=spatial_order,
+    )
+
+    def run():
+        call_node(node, list(extract()))
+
+    return run, records
+
+
+@benchmark
+def extracted_intersectionpercentbyarea(records=2000):
+    node = terra.IntersectionPercentByArea("bench_extracted_percent", "percent")
+    return _extracted_intersections("bench_extracted_percent", records, node)
+
+
+@benchmark
+def extracted_intersectionpercentbyarea_sorted(records=2000):
+    node = terra.IntersectionPercentByArea("bench_sorted_percent", "percent")
+    return _extracted_intersections("bench_sorted_percent", records, node, "hilbert")
+
+
+@benchmark
+def extracted_closestfeatures(records=2000):
+    node = terra.ClosestFeatures("bench_extracted_closest", limit=3)
+    return _extracted_intersections("bench_extracted_closest", records, node)
+
+
+@benchmark
+def extracted_closestfeatures_sorted(records=2000):
+    node = terra.ClosestFeatures("bench_sorted_closest", limit=3)
+    return _extracted_intersections("bench_sorted_closest", records, node, "geohash")
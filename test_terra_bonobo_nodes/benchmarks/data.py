@@ -0,0 +1,137 @@
+"""
+Synthetic data generators used by benchmarks.
+"""
+
+import csv
+import io
+import json
+import math
+import os
+import subprocess
+import tempfile
+import zipfile
+
+from django.contrib.gis.geos import MultiPolygon, Polygon
+
+
+def large_multipolygon(parts=20, vertices=1000, z=False, srid=4326):
+    """
+    MultiPolygon of `parts` disjoint star-shaped polygons having `vertices`
+    vertices each.
+    """
+    polygons = []
+    for part in range(parts):
+        ring = []
+        for i in range(vertices):
+            angle = 2 * math.pi * i / vertices
+            radius = 0.4 + 0.05 * math.sin(angle * 17)
+            point = (part + radius * math.cos(angle), radius * math.sin(angle))
+            ring.append(point + (i * 0.5,) if z else point)
+        ring.append(ring[0])
+        polygons.append(Polygon(ring))
+    return MultiPolygon(polygons, srid=srid)
+
+
+def coordinate_records(count=10000):
+    """
+    CSV like records having x and y string attributes.
+    """
+    return [
+        (i, {"x": str(i % 360 - 180 + 0.5), "y": str(i % 170 - 85 + 0.25)})
+        for i in range(count)
+    ]
+
+
+def point_features(count=10000):
+    """
+    GeoJSON point features having a few properties.
+    """
+    return [
+        {
+            "type": "Feature",
+            "properties": {
+                "id": i,
+                "name": f"feature {i}",
+                "kind": ("school", "shop", "park")[i % 3],
+                "value": i % 100,
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [i % 360 - 180 + 0.5, i % 170 - 85 + 0.25],
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def csv_content(count=10000, delimiter=","):
+    """
+    CSV content of point features, coordinates in x and y columns.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=delimiter)
+    writer.writerow(["id", "name", "kind", "value", "x", "y"])
+    for feature in point_features(count):
+        writer.writerow(
+            [*feature["properties"].values(), *feature["geometry"]["coordinates"]]
+        )
+    return output.getvalue()
+
+
+def geojson_content(count=10000):
+    """
+    GeoJSON FeatureCollection of point features.
+    """
+    return json.dumps({"type": "FeatureCollection", "features": point_features(count)})
+
+
+def zip_content(files):
+    """
+    Zip archive of `files`, a dict of content by file name.
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return output.getvalue()
+
+
+def zipped_shapefile(count=10000):
+    """
+    Zipped ESRI Shapefile of point features, written by ogr2ogr.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "points.geojson")
+        with open(source, "w") as output:
+            output.write(geojson_content(count))
+        subprocess.run(
+            ["ogr2ogr", "-f", "ESRI Shapefile", os.path.join(directory, "points.shp")]
+            + [source],
+            check=True,
+        )
+        os.unlink(source)
+        return zip_content(
+            {
+                name: open(os.path.join(directory, name), "rb").read()
+                for name in os.listdir(directory)
+            }
+        )
+
+
+def osm_xml(count=10000):
+    """
+    OSM XML of tagged nodes, and of ways made of 10 nodes each.
+    """
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    for i in range(count):
+        lon, lat = i % 360 - 180 + 0.5, i % 170 - 85 + 0.25
+        lines.append(f'<node id="{i + 1}" lat="{lat}" lon="{lon}" version="1">')
+        lines.append(f'<tag k="name" v="node {i}"/><tag k="amenity" v="school"/>')
+        lines.append("</node>")
+    for i in range(count // 10):
+        lines.append(f'<way id="{i + 1}" version="1">')
+        lines += [f'<nd ref="{i * 10 + n + 1}"/>' for n in range(10)]
+        lines.append(f'<tag k="highway" v="residential"/><tag k="ref" v="{i}"/>')
+        lines.append("</way>")
+    lines.append("</osm>")
+    return "\n".join(lines)
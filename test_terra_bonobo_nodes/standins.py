@@ -0,0 +1,263 @@
+"""
+Local stand-ins of the HTTP services used by nodes (Graphhopper, Overpass and
+Elasticsearch), and of a StatsD server, for tests and benchmarks.
+
+Each stand-in is a context manager serving on a local port, yielding the
+server whose url is in `server.url` and requests count in `server.requests`.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import BaseRequestHandler, ThreadingUDPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.requests += 1
+            self.fail = self.server.requests <= self.server.failures
+
+    @property
+    def params(self):
+        return {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send(self, body, status=200, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in self.server.headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serve(handler, failures=0, latency=0, headers={}, **attributes):
+    """
+    Serve `handler` on a local port, the first `failures` requests answering
+    503, each request taking `latency` seconds.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.failures = failures
+    server.latency = latency
+    server.headers = headers
+    server.url = f"http://127.0.0.1:{server.server_port}/"
+    for name, value in attributes.items():
+        setattr(server, name, value)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def isochrone_body(lat, lon, buckets=3):
+    return {
+        "polygons": [
+            {
+                "type": "Feature",
+                "properties": {"bucket": bucket},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [
+                            [lon - size, lat - size],
+                            [lon + size, lat - size],
+                            [lon + size, lat + size],
+                            [lon - size, lat + size],
+                            [lon - size, lat - size],
+                        ]
+                    ],
+                },
+            }
+            for bucket, size in enumerate(
+                (bucket + 1) / buckets for bucket in range(buckets)
+            )
+        ]
+    }
+
+
+class GraphhopperHandler(StandinHandler):
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.fail:
+            return self.send({"message": "Service unavailable"}, status=503)
+
+        path = urlparse(self.path).path
+        if path.endswith("/isochrone"):
+            lat, lon = map(float, self.params["point"].split(","))
+            self.send(isochrone_body(lat, lon, int(self.params["buckets"])))
+        elif path.endswith("/route"):
+            points = parse_qs(urlparse(self.path).query)["point"]
+            (lat1, lon1), (lat2, lon2) = (map(float, p.split(",")) for p in points)
+            distance = ((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2) ** 0.5 * 100000
+            self.send({"paths": [{"distance": distance, "time": distance * 36}]})
+        else:
+            self.send({"message": "Not found"}, status=404)
+
+
+def graphhopper(failures=0, latency=0):
+    """
+    Graphhopper stand-in, serving isochrone and route API.
+    """
+    return serve(GraphhopperHandler, failures, latency)
+
+
+class OverpassHandler(StandinHandler):
+    def do_POST(self):
+        self.read_body()
+        time.sleep(self.server.latency)
+        if self.fail:
+            return self.send(b"Service unavailable", status=503)
+        self.send(self.server.content.encode(), content_type="application/osm3s+xml")
+
+
+def overpass(content, failures=0, latency=0):
+    """
+    Overpass stand-in, answering `content` OSM XML to any query.
+    """
+    return serve(OverpassHandler, failures, latency, content=content)
+
+
+class ElasticsearchHandler(StandinHandler):
+    def do_HEAD(self):
+        index = urlparse(self.path).path.strip("/")
+        self.send({}, status=200 if index in self.server.indices else 404)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/":
+            return self.send(
+                {
+                    "version": {"number": "7.17.0", "build_flavor": "default"},
+                    "tagline": "You Know, for Search",
+                }
+            )
+        self.do_POST()
+
+    def do_PUT(self):
+        self.read_body()
+        index = urlparse(self.path).path.strip("/").split("/")[0]
+        if not index.startswith("_"):
+            self.server.indices.add(index)
+        self.send({"acknowledged": True})
+
+    def do_POST(self):
+        body = self.read_body()
+        time.sleep(self.server.latency)
+        if self.fail:
+            return self.send({"error": "Service unavailable"}, status=503)
+
+        path = urlparse(self.path).path
+        if path.endswith("/_bulk"):
+            actions = [json.loads(line) for line in body.splitlines()[::2]]
+            with self.server.lock:
+                self.server.indexed += len(actions)
+            items = [
+                {
+                    action: (
+                        {
+                            "_id": meta.get("_id"),
+                            "status": 400,
+                            "error": {"type": "mapper_parsing_exception"},
+                        }
+                        if meta.get("_id") in self.server.rejected
+                        else {"_id": meta.get("_id"), "status": 201}
+                    )
+                }
+                for action, meta in (next(iter(a.items())) for a in actions)
+            ]
+            errors = any(
+                item[action]["status"] >= 300 for item in items for action in item
+            )
+            self.send({"took": 1, "errors": errors, "items": items})
+        elif path.endswith("/_search/scroll"):
+            offset = int(json.loads(body)["scroll_id"]) if body else 0
+            self.send(self.search_page(offset, self.server.page_size))
+        elif path.endswith("/_search"):
+            self.server.page_size = int(self.params.get("size", 10))
+            # Documents are sorted by position
+            search_after = json.loads(body).get("search_after") if body else None
+            offset = search_after[0] + 1 if search_after else 0
+            self.send(self.search_page(offset, self.server.page_size))
+        else:
+            self.send({"acknowledged": True})
+
+    def search_page(self, offset, size):
+        documents = self.server.documents
+        return {
+            "_scroll_id": str(offset + size),
+            "hits": {
+                "total": {"value": len(documents), "relation": "eq"},
+                "hits": [
+                    {"_id": str(i), "_source": source, "sort": [i]}
+                    for i, source in enumerate(
+                        documents[offset : offset + size], offset  # noqa: E203
+                    )
+                ],
+            },
+        }
+
+
+def elasticsearch(documents=(), failures=0, latency=0, rejected=()):
+    """
+    Elasticsearch stand-in, searching in `documents` list and counting
+    documents indexed by bulk queries in `server.indexed`, documents whose
+    identifier is in `rejected` failing to index.
+    """
+    return serve(
+        ElasticsearchHandler,
+        failures,
+        latency,
+        headers={"X-Elastic-Product": "Elasticsearch"},
+        documents=list(documents),
+        indexed=0,
+        indices=set(),
+        rejected=set(rejected),
+        page_size=10,
+    )
+
+
+class StatsdHandler(BaseRequestHandler):
+    def handle(self):
+        data, _ = self.request
+        with self.server.lock:
+            self.server.lines += data.decode().splitlines()
+
+
+@contextmanager
+def statsd():
+    """
+    StatsD stand-in, receiving metrics lines in `server.lines`, its address is
+    in `server.server_address`.
+    """
+    server = ThreadingUDPServer(("127.0.0.1", 0), StatsdHandler)
+    server.lock = threading.Lock()
+    server.lines = []
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
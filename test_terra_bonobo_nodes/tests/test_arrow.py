@@ -0,0 +1,212 @@
+import json
+import unittest
+from unittest import mock
+
+import django.test
+from bonobo.util.testing import BufferingNodeExecutionContext
+from django.contrib.gis.db.models.functions import Centroid
+from django.contrib.gis.geos import Point, Polygon
+from elasticsearch import Elasticsearch
+from geostore.models import Feature, Layer
+
+from terra_bonobo_nodes import arrow, common
+from test_terra_bonobo_nodes.standins import elasticsearch
+
+
+class Test_TestArrow_Conversions(unittest.TestCase):
+    def setUp(self):
+        self.batch = [
+            ("id1", {"a": 1, "name": "one", "geom": Point(1, 2, srid=2154)}),
+            ("id2", {"b": [1, 2], "geom": None}),
+        ]
+
+    def test_toarrow(self):
+        table = arrow.ToArrow()(self.batch)
+
+        self.assertEqual(["_identifier", "a", "name", "b", "geom"], table.column_names)
+        self.assertEqual({"geom": 2154}, arrow.geometry_columns(table.schema))
+        self.assertEqual(["id1", "id2"], table.column("_identifier").to_pylist())
+
+    def test_fromarrow(self):
+        rows = list(arrow.FromArrow()(arrow.ToArrow()(self.batch)))
+
+        self.assertEqual(
+            [
+                (
+                    "id1",
+                    {
+                        "a": 1,
+                        "name": "one",
+                        "b": None,
+                        "geom": self.batch[0][1]["geom"],
+                    },
+                ),
+                ("id2", {"a": None, "name": None, "b": [1, 2], "geom": None}),
+            ],
+            rows,
+        )
+        self.assertEqual(2154, rows[0][1]["geom"].srid)
+
+    def test_properties_table_mixed_types(self):
+        table = arrow.properties_table(
+            [{"a": 1, "b": "x"}, {"a": "y", "b": "z", "c": 2**70}, {"a": None}]
+        )
+
+        self.assertEqual(
+            [
+                {"a": "1", "b": "x", "c": None},
+                {"a": '"y"', "b": "z", "c": str(2**70)},
+                {"a": None, "b": None, "c": None},
+            ],
+            table.to_pylist(),
+        )
+
+    def test_checkpoint(self):
+        with self.assertRaisesRegex(ValueError, "checkpoint"):
+            arrow.ArrowExtractFeatures(Feature.objects.all(), checkpoint=mock.Mock())
+        with self.assertRaisesRegex(ValueError, "checkpoint"):
+            arrow.ArrowSQLExtract("SELECT 1 AS id", "id", checkpoint=mock.Mock())
+
+    def test_arrowexcludeattributes(self):
+        table = arrow.ArrowExcludeAttributes(["a", "missing"])(
+            arrow.ToArrow()(self.batch)
+        )
+        self.assertEqual(["_identifier", "name", "b", "geom"], table.column_names)
+
+    def test_arrowfilterattributes(self):
+        table = arrow.ArrowFilterAttributes(["a", "geom"])(arrow.ToArrow()(self.batch))
+        self.assertEqual(["_identifier", "a", "geom"], table.column_names)
+
+    def test_arrowcsvdictreader(self):
+        content = 'id;name\n1;foo\n2;"b;ar"\n3;\n'
+        tables = list(arrow.ArrowCsvDictReader(delimiter=";", block_size=16)(content))
+
+        self.assertGreater(len(tables), 1)
+        self.assertEqual(
+            list(common.CsvDictReader(delimiter=";")(content)),
+            [row for table in tables for row in table.to_pylist()],
+        )
+
+    def test_arrowgeojsonreader(self):
+        content = json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "properties": {"id": i},
+                        "geometry": {"type": "Point", "coordinates": [i, i]},
+                    }
+                    for i in range(3)
+                ],
+            }
+        )
+        tables = list(arrow.ArrowGeojsonReader("geom", batch_size=2)(content))
+
+        self.assertEqual([2, 1], [table.num_rows for table in tables])
+        self.assertEqual(
+            list(common.GeojsonReader("geom")(content)),
+            [record for table in tables for _, record in arrow.table_to_records(table)],
+        )
+
+    def test_arrowloadines(self):
+        table = arrow.ToArrow()(self.batch)
+        with elasticsearch() as server:
+            with BufferingNodeExecutionContext(
+                arrow.ArrowLoadInES("index"), services={"es": Elasticsearch(server.url)}
+            ) as context:
+                context.write_sync(table)
+
+        self.assertEqual(2, server.indexed)
+
+
+class Test_TestArrow_Database(django.test.TestCase):
+    def setUp(self):
+        self.layer = Layer.objects.create(name="arrow")
+        self.geom = Polygon(((0, 0), (0, 1), (1, 1), (0, 0)), srid=4326)
+        for i in range(3):
+            Feature.objects.create(
+                layer=self.layer,
+                identifier=f"id{i}",
+                geom=self.geom,
+                properties={"value": i},
+            )
+
+    def test_arrowextractfeatures(self):
+        node = arrow.ArrowExtractFeatures(
+            Feature.objects.filter(layer=self.layer).order_by("identifier"),
+            extra_properties={"geom": "geom", "layer": "layer_id"},
+        )
+        node.batch_size = 2
+        tables = list(node())
+
+        self.assertEqual([2, 1], [table.num_rows for table in tables])
+        rows = [row for table in tables for row in arrow.table_to_records(table)]
+        self.assertEqual(
+            [
+                (f"id{i}", {"value": i, "geom": self.geom, "layer": self.layer.pk})
+                for i in range(3)
+            ],
+            rows,
+        )
+
+    def test_arrowextractfeatures_lookups(self):
+        node = arrow.ArrowExtractFeatures(
+            Feature.objects.filter(layer=self.layer)
+            .annotate(center=Centroid("geom"))
+            .order_by("identifier"),
+            extra_properties={
+                "pk": "pk",
+                "layer_name": "layer__name",
+                "center": "center",
+            },
+        )
+        rows = [row for table in node() for row in arrow.table_to_records(table)]
+
+        self.assertEqual(
+            list(
+                Feature.objects.filter(layer=self.layer)
+                .order_by("identifier")
+                .values_list("pk", flat=True)
+            ),
+            [record["pk"] for _, record in rows],
+        )
+        self.assertEqual({"arrow"}, {record["layer_name"] for _, record in rows})
+        self.assertEqual(self.geom.centroid, rows[0][1]["center"])
+        self.assertEqual(4326, rows[0][1]["center"].srid)
+
+    def test_arrowsqlextract(self):
+        node = arrow.ArrowSQLExtract(
+            "SELECT identifier, geom, ST_AsBinary(geom) AS wkb"
+            " FROM geostore_feature ORDER BY identifier",
+            "identifier",
+            geom=["geom", "wkb"],
+        )
+        (table,) = list(node())
+
+        self.assertEqual(
+            {"geom": 4326, "wkb": None}, arrow.geometry_columns(table.schema)
+        )
+        identifier, record = arrow.table_to_records(table)[0]
+        self.assertEqual("id0", identifier)
+        self.assertEqual(self.geom, record["geom"])
+        self.assertEqual(self.geom.coords, record["wkb"].coords)
+
+    def test_arrowloadfeatureinlayer(self):
+        layer = Layer.objects.create(name="arrow_load")
+        table = arrow.ToArrow()(
+            [(f"id{i}", {"value": i, "geom": self.geom}) for i in range(3)]
+        )
+        with BufferingNodeExecutionContext(
+            arrow.ArrowLoadFeatureInLayer(layer=layer, window_length=2)
+        ) as context:
+            context.write_sync(table)
+
+        self.assertEqual(
+            [("id0", {"value": 0}), ("id1", {"value": 1}), ("id2", {"value": 2})],
+            list(
+                layer.features.order_by("identifier").values_list(
+                    "identifier", "properties"
+                )
+            ),
+        )
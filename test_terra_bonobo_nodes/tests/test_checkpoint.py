@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import unittest
+
+import django.test
+from bonobo.util.testing import BufferingNodeExecutionContext
+from django.contrib.gis.geos import Point
+from elasticsearch import Elasticsearch
+from geostore.models import Feature, Layer
+
+from terra_bonobo_nodes import checkpoint, elasticsearch, sql, terra
+from test_terra_bonobo_nodes.standins import elasticsearch as elasticsearch_standin
+
+
+class CheckpointTestMixin:
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "checkpoint.json")
+
+    def read(self):
+        with open(self.path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+
+class Test_TestCheckpoint_Checkpoint(CheckpointTestMixin, unittest.TestCase):
+    def test_checkpoint_committed(self):
+        state = checkpoint.Checkpoint(self.path, interval=0)
+        self.assertIsNone(state.resume("Extract"))
+        self.assertIsNone(state.register("Load"))
+        state.extracted("Extract", ["a", "b"], 2)
+        state.extracted("Extract", ["c", "d"], 4)
+        state.extracted("Extract", ["e"], 5)
+
+        # Page of "b" may not be loaded yet
+        state.committed("Load", ["a", "b"])
+        self.assertNotIn("Extract", self.read()["extractors"])
+        state.committed("Load", ["c"])
+        self.assertEqual(self.read()["extractors"], {"Extract": 2})
+        self.assertEqual(
+            self.read()["loaders"],
+            {"Load": {"windows": 2, "records": 3, "identifier": "c"}},
+        )
+
+    def test_checkpoint_loaders(self):
+        state = checkpoint.Checkpoint(self.path, interval=0)
+        state.resume("Extract")
+        state.register("Load")
+        state.register("OtherLoad")
+        for page in range(3):
+            state.extracted("Extract", [page], page)
+
+        state.committed("Load", [2])
+        self.assertNotIn("Extract", self.read()["extractors"])
+        state.committed("OtherLoad", [1])
+        self.assertEqual(self.read()["extractors"], {"Extract": 0})
+        state.unregister("OtherLoad")
+        self.assertEqual(state.extractors, {"Extract": 1})
+
+    def test_checkpoint_resume(self):
+        state = checkpoint.Checkpoint(self.path, interval=0)
+        state.resume("Extract")
+        state.register("Load")
+        state.extracted("Extract", ["a"], 1)
+        state.extracted("Extract", ["b"], 2)
+        state.unregister("Load")
+
+        # Extractor failed, all extracted records went through the pipeline
+        state = checkpoint.Checkpoint(self.path)
+        self.assertEqual(state.resume("Extract"), 2)
+        self.assertEqual(state.register("Load"), {"windows": 0, "records": 0})
+        state.exhausted("Extract")
+        state.unregister("Load")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_checkpoint_killed(self):
+        state = checkpoint.Checkpoint(self.path, interval=0)
+        state.resume("Extract")
+        state.register("Load")
+        state.extracted("Extract", ["a"], 1)
+        state.extracted("Extract", ["b"], 2)
+        state.exhausted("Extract")
+        state.unregister("Load", complete=False)
+
+        self.assertEqual(self.read(), {"extractors": {}, "loaders": {}})
+
+
+class Test_TestCheckpoint_Elasticsearch(CheckpointTestMixin, unittest.TestCase):
+    def run_pipeline(self, server, count=None):
+        state = checkpoint.Checkpoint(self.path, interval=0)
+        extract = elasticsearch.ESExtract("source", checkpoint=state)
+        extract.size = 10
+        load = elasticsearch.LoadInES("index", checkpoint=state)
+        load.length = 5
+        es = Elasticsearch(server.url)
+
+        with BufferingNodeExecutionContext(load, services={"es": es}) as context:
+            for i, row in enumerate(extract(es)):
+                if i == count:
+                    context.kill()
+                    break
+                context.write_sync(row)
+
+    def test_esextract_resume(self):
+        documents = [{"value": i} for i in range(25)]
+        with elasticsearch_standin(documents) as server:
+            self.run_pipeline(server, 17)
+            # Buffered records are flushed
+            self.assertEqual(server.indexed, 17)
+            self.assertEqual(self.read()["extractors"], {"ESExtract": [9]})
+            self.assertEqual(
+                self.read()["loaders"]["LoadInES"],
+                {"windows": 4, "records": 17, "identifier": "16"},
+            )
+
+            self.run_pipeline(server)
+            # Second page is loaded again
+            self.assertEqual(server.indexed, 32)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class Test_TestCheckpoint_Database(CheckpointTestMixin, django.test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.layer = Layer.objects.create(name="checkpoint")
+        for i in range(25):
+            Feature.objects.create(
+                layer=self.layer,
+                identifier=f"id{i:02}",
+                geom=Point(i, i, srid=4326),
+                properties={"value": i},
+            )
+
+    def run_pipeline(self, extract, layer, count=None):
+        with BufferingNodeExecutionContext(
+            terra.LoadFeatureInLayer(
+                layer=layer, window_length=5, checkpoint=extract.checkpoint
+            )
+        ) as context:
+            for i, row in enumerate(extract()):
+                if i == count:
+                    context.kill()
+                    break
+                context.write_sync(row)
+
+    def test_extractfeatures_resume(self):
+        layer = Layer.objects.create(name="checkpoint_load")
+        extract = terra.ExtractFeatures(
+            Feature.objects.filter(layer=self.layer),
+            extra_properties={"geom": "geom"},
+            checkpoint=checkpoint.Checkpoint(self.path, interval=0),
+        )
+        extract.batch_size = 10
+        self.run_pipeline(extract, layer, 17)
+        self.assertEqual(layer.features.count(), 17)
+        identifier, pk = self.read()["extractors"]["ExtractFeatures"]
+        self.assertEqual(identifier, "id09")
+
+        extract.checkpoint = checkpoint.Checkpoint(self.path, interval=0)
+        self.run_pipeline(extract, layer)
+        self.assertEqual(layer.features.count(), 25)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_sqlextract_resume(self):
+        layer = Layer.objects.create(name="checkpoint_load")
+        extract = sql.SQLExtract(
+            "SELECT f.identifier, f.geom, f.properties->>'value' AS value"
+            " FROM geostore_feature f JOIN geostore_layer l ON l.id = f.layer_id"
+            " WHERE l.name = 'checkpoint' AND f.properties->>'value' LIKE '%'",
+            "identifier",
+            checkpoint=checkpoint.Checkpoint(self.path, interval=0),
+        )
+        extract.batch_size = 10
+        self.run_pipeline(extract, layer, 17)
+        self.assertEqual(self.read()["extractors"], {"SQLExtract": "id09"})
+
+        extract.checkpoint = checkpoint.Checkpoint(self.path, interval=0)
+        rows = list(extract())
+        self.assertEqual(rows[0][0], "id10")
+        self.assertEqual(len(rows), 15)
@@ -1,7 +1,10 @@
 import csv
 import json
+import threading
 import unittest
+from copy import deepcopy
 from io import BytesIO, StringIO
+from time import sleep
 from unittest import mock
 
 import requests
@@ -11,6 +14,68 @@ from django.test import override_settings
 from geostore.models import Feature, Layer
 
 from terra_bonobo_nodes import common
+from test_terra_bonobo_nodes.standins import graphhopper
+
+
+class Test_TestCommon_Batch(unittest.TestCase):
+    def test_batch_unbatch(self):
+        records = [(i, {"value": i}) for i in range(5)]
+
+        with BufferingNodeExecutionContext(common.Batch(size=2)) as context:
+            context.write_sync(*records)
+        batches = [batch for batch, in context.get_buffer()]
+
+        self.assertEqual([2, 2, 1], [len(batch) for batch in batches])
+
+        with BufferingNodeExecutionContext(common.Unbatch()) as context:
+            context.write_sync(*[(batch,) for batch in batches])
+
+        self.assertEqual(records, context.get_buffer())
+
+    def test_batch_transforms(self):
+        def records():
+            return [
+                (i, {"a": i, "b": i, "geom": common.Point(i, i, i, srid=4326)})
+                for i in range(3)
+            ]
+
+        nodes = [
+            (common.ExcludeAttributes, common.BatchExcludeAttributes, (["a"],)),
+            (common.FilterAttributes, common.BatchFilterAttributes, (["a"],)),
+            (
+                common.MapProperties,
+                common.BatchMapProperties,
+                (lambda record: {**record, "c": record["a"] * 2},),
+            ),
+            (common.GeometryToCentroid, common.BatchGeometryToCentroid, ("geom", "c")),
+            (common.Geometry3Dto2D, common.BatchGeometry3Dto2D, ("geom", "geom2d")),
+            (common.GeometryToJson, common.BatchGeometryToJson, ("geom", "json")),
+        ]
+        for node, batch_node, args in nodes:
+            with self.subTest(node=node.__name__):
+                expected = []
+                for row in records():
+                    result = node(*args)(*row)
+                    expected.extend([result] if isinstance(result, tuple) else result)
+
+                with BufferingNodeExecutionContext(batch_node(*args)) as context:
+                    context.write_sync(records())
+
+                self.assertEqual([(expected,)], context.get_buffer())
+
+    def test_batched(self):
+        batch = [
+            ("id1", {"x": "1.5", "y": "2"}),
+            ("id2", {"x": "3", "y": "4"}),
+        ]
+        node = common.Batched(
+            common.BulkAttributesToPointGeometry(x="x", y="y", geom="geom")
+        )
+
+        result = node(batch)
+
+        self.assertEqual(["id1", "id2"], [identifier for identifier, _ in result])
+        self.assertEqual((3, 4), result[1][1]["geom"].coords)
 
 
 class Test_TestCommon_CsvDictReader(unittest.TestCase):
@@ -256,6 +321,40 @@ class Test_TestCommon_CollectAndSum(unittest.TestCase):
         self.assertIn(geom, features_result)
         self.assertIsInstance(features_result, dict)
 
+    def test_bulkcollectandsum(self):
+        layer = Layer.objects.create(name="layerbulkcollectandsum")
+        features = [
+            Feature.objects.create(
+                geom=common.Point(i, 4), layer=layer, properties={"value": i}
+            )
+            for i in range(3)
+        ]
+
+        collectandsum = common.BulkCollectAndSum(
+            geom="geom", sum_fields={"total": "value"}
+        )
+        result = list(
+            collectandsum.process_window(
+                [
+                    (
+                        "queryset",
+                        layer.features.filter(pk__in=[f.pk for f in features]),
+                    ),
+                    ("ids", [features[0].pk, features[2].pk]),
+                    ("empty", []),
+                ]
+            )
+        )
+
+        self.assertEqual(["queryset", "ids", "empty"], [r[0] for r in result])
+        self.assertEqual(3, result[0][1]["point_count"])
+        self.assertEqual(3, result[0][1]["total"])
+        self.assertEqual(3, len(result[0][1]["geom"]))
+        self.assertCountEqual([features[0].pk, features[2].pk], result[1][1]["ids"])
+        self.assertEqual(2, result[1][1]["total"])
+        self.assertEqual(0, result[2][1]["point_count"])
+        self.assertIsNone(result[2][1]["geom"])
+
 
 class Test_TestCommon_MapProperties(unittest.TestCase):
     def setUp(self):
@@ -332,6 +431,33 @@ class Test_TestCommon_AttributeToGeometry(unittest.TestCase):
         self.assertEqual(self.identifier, result[0])
         self.assertEqual(2, len(result))
 
+    def test_attributetogeometry_validate(self):
+        attribute_to_geometry = common.AttributeToGeometry(
+            attribute=self.attribute_1, geom=self.geom, validate=True
+        )
+        bowtie = "POLYGON ((0 0, 1 1, 1 0, 0 1, 0 0))"
+
+        valid = attribute_to_geometry.get_geosgeometry(self.record[self.attribute_1])
+        invalid = attribute_to_geometry.get_geosgeometry(bowtie)
+        cached = attribute_to_geometry.get_geosgeometry(bowtie)
+
+        self.assertEqual(GEOSGeometry(self.record[self.attribute_1]), valid)
+        self.assertTrue(invalid.valid)
+        self.assertTrue(cached.valid)
+        self.assertEqual(3, attribute_to_geometry.checked)
+        self.assertEqual(2, attribute_to_geometry.repaired)
+        self.assertEqual(2, len(attribute_to_geometry._validity))
+
+    def test_attributetogeometry_wkb(self):
+        attribute_to_geometry = common.AttributeToGeometry(
+            attribute=self.attribute_2, geom=self.geom
+        )
+        geometry = GEOSGeometry(self.record[self.attribute_2])
+
+        result = attribute_to_geometry.get_geosgeometry(bytes(geometry.wkb))
+
+        self.assertEqual(geometry.wkt, result.wkt)
+
     def test_attributetogeometry_linestring(self):
         attribute_to_geometry = common.AttributeToGeometry(
             attribute=self.attribute_2, geom=self.geom
@@ -383,6 +509,50 @@ class Test_TestCommon_AttributesToGeometry(unittest.TestCase):
         with self.assertRaises(ValueError):
             next(attributestopointgeometry(self.identifier, record))
 
+    def test_bulkattributestopointgeometry(self):
+        records = [
+            ("id1", {"Key_1": "1.5", "Key_2": "2", "a": 1}),
+            ("id2", {"Key_1": "attribute_1", "Key_2": "2", "a": 2}),
+            ("id3", {"Key_1": 3, "Key_2": None, "a": 3}),
+            ("id4", {"Key_1": "4", "Key_2": 5.5, "a": 4}),
+        ]
+
+        with self.assertLogs(common.logger) as cm:
+            with BufferingNodeExecutionContext(
+                common.BulkAttributesToPointGeometry(
+                    x=self.x,
+                    y=self.y,
+                    geom=self.geom,
+                    srid=2154,
+                    window_length=3,
+                    drop_invalid=True,
+                )
+            ) as context:
+                context.write_sync(*records)
+
+        result = context.get_buffer()
+
+        self.assertEqual(2, len(cm.records))
+        self.assertEqual(["id1", "id4"], [identifier for identifier, _ in result])
+        self.assertEqual(
+            {"a": 1, self.geom: common.Point(1.5, 2, srid=2154)}, result[0][1]
+        )
+        self.assertEqual((4, 5.5), result[1][1][self.geom].coords)
+        self.assertEqual(2154, result[1][1][self.geom].srid)
+
+    def test_bulkattributestopointgeometry_invalid(self):
+        node = common.BulkAttributesToPointGeometry(x=self.x, y=self.y, geom=self.geom)
+        window = [
+            ("id1", {"Key_1": "1", "Key_2": "2"}),
+            ("id2", {"Key_1": "a", "Key_2": "2"}),
+        ]
+        with self.assertRaises(ValueError):
+            list(node.process_window(window))
+
+        with mock.patch.object(common, "np", None):
+            with self.assertRaises(ImportError):
+                common.BulkAttributesToPointGeometry(x=self.x, y=self.y, geom=self.geom)
+
 
 class Test_TestCommon_GeometryToJson(unittest.TestCase):
     def test_geometrytojson(self):
@@ -404,6 +574,49 @@ class Test_TestCommon_GeometryToJson(unittest.TestCase):
             record.get(destination).get("type"), record.get(source).geom_type
         )
 
+    def test_geometrytojson_precision(self):
+        geometrytojson = common.GeometryToJson("geom", "json", precision=2)
+
+        _, record = geometrytojson("id", {"geom": common.Point(1 / 3, 2 / 3)})
+
+        self.assertEqual({"type": "Point", "coordinates": [0.33, 0.67]}, record["json"])
+
+    def test_geometry_to_geojson(self):
+        geometries = [
+            "POINT (1 2)",
+            "LINESTRING Z (0 0 1, 1 1 2, 2 0 3)",
+            "POLYGON ((0 0, 0 1, 1 1, 0 0), (0.1 0.1, 0.1 0.2, 0.2 0.2, 0.1 0.1))",
+            "MULTIPOINT ((1 2), (3 4))",
+            "MULTILINESTRING ((0 0, 1 1), (2 2, 3 3))",
+            "MULTIPOLYGON (((0 0, 0 1, 1 1, 0 0)), ((2 2, 2 3, 3 3, 2 2)))",
+        ]
+
+        for wkt in geometries:
+            geometry = GEOSGeometry(wkt, srid=4326)
+            self.assertEqual(
+                json.loads(geometry.json), common.geometry_to_geojson(geometry)
+            )
+        self.assertEqual(
+            {"type": "Point", "coordinates": []},
+            common.geometry_to_geojson(GEOSGeometry("POINT EMPTY")),
+        )
+
+    def test_geometry_to_geojson_collection(self):
+        geometry = GEOSGeometry(
+            "GEOMETRYCOLLECTION (POINT (1 2), LINESTRING (0 0, 1 1))"
+        )
+
+        self.assertEqual(
+            {
+                "type": "GeometryCollection",
+                "geometries": [
+                    {"type": "Point", "coordinates": [1, 2]},
+                    {"type": "LineString", "coordinates": [[0, 0], [1, 1]]},
+                ],
+            },
+            common.geometry_to_geojson(geometry),
+        )
+
 
 class Test_TestCommon_GeometryToCentroid(unittest.TestCase):
     def test_geometrytocentroid(self):
@@ -439,6 +652,25 @@ class Test_TestCommon_Geometry3Dto2D(unittest.TestCase):
         self.assertEqual(3, len(result_geom_3d.coords))
         self.assertEqual(2, len(result_geom_2d.coords))
 
+    def test_force_2d(self):
+        geometries = [
+            common.Polygon(
+                ((0.1, 0.1, 1), (0.1, 1.3, 2), (1.7, 1.3, 3), (0.1, 0.1, 1)), srid=2154
+            ),
+            common.Point(1 / 3, 2 / 3, srid=4326),
+        ]
+
+        result = common.force_2d(geometries)
+
+        self.assertEqual(2, len(result))
+        self.assertEqual([False, False], [geom.hasz for geom in result])
+        self.assertEqual([2154, 4326], [geom.srid for geom in result])
+        self.assertEqual(
+            ((0.1, 0.1), (0.1, 1.3), (1.7, 1.3), (0.1, 0.1)), result[0].coords[0]
+        )
+        self.assertEqual(geometries[1], result[1])
+        self.assertIsNot(geometries[1], result[1])
+
 
 class Test_TestCommon_CopyOnPipelineSplit(unittest.TestCase):
     def test_copyonpipelinesplit(self):
@@ -453,6 +685,88 @@ class Test_TestCommon_CopyOnPipelineSplit(unittest.TestCase):
         self.assertEqual(2, len(result))
         self.assertEqual(properties, result[1])
 
+    def test_copyonpipelinesplit_deep(self):
+        properties = {"geom": common.Point(1, 1, 1), "tags": ["a"]}
+        copyonpipelinesplit = common.CopyOnPipelineSplit()
+        result = next(copyonpipelinesplit("id", properties))
+
+        self.assertNotIsInstance(result[1], common.CopyOnWriteRecord)
+        self.assertEqual(properties, result[1])
+        self.assertIsNot(properties["geom"], result[1]["geom"])
+        self.assertIsNot(properties["tags"], dict.__getitem__(result[1], "tags"))
+
+    def test_copyonpipelinesplit_copy_on_write(self):
+        properties = {"geom": common.Point(1, 1, 1)}
+        copyonpipelinesplit = common.CopyOnPipelineSplit(copy_on_write=True)
+        result = next(copyonpipelinesplit("id", properties))
+
+        self.assertIsInstance(result[1], common.CopyOnWriteRecord)
+        self.assertEqual(properties, result[1])
+        # Geometries are shared
+        self.assertIs(properties["geom"], result[1]["geom"])
+
+
+class Test_TestCommon_CopyOnWriteRecord(unittest.TestCase):
+    def setUp(self):
+        self.geom = common.Point(1, 1)
+        self.original = {"geom": self.geom, "list": [1, [2]], "name": "a"}
+
+    def test_shared_values(self):
+        record = common.CopyOnWriteRecord(self.original)
+
+        self.assertEqual(self.original, record)
+        self.assertIs(self.geom, record["geom"])
+        self.assertEqual({"list"}, record._shared)
+
+    def test_write(self):
+        record = common.CopyOnWriteRecord(self.original)
+
+        record["geom"] = common.Point(2, 2)
+        record["list"][1].append(3)
+        record.pop("name")
+        record.update(other=1)
+
+        self.assertEqual(
+            {"geom": self.geom, "list": [1, [2]], "name": "a"}, self.original
+        )
+        self.assertEqual(
+            {"geom": common.Point(2, 2), "list": [1, [2, 3]], "other": 1}, record
+        )
+
+    def test_iteration(self):
+        record = common.CopyOnWriteRecord(self.original)
+
+        for key, value in record.items():
+            if isinstance(value, list):
+                value.append(4)
+
+        self.assertEqual([1, [2]], self.original["list"])
+        self.assertEqual([1, [2], 4], record["list"])
+
+    def test_copy(self):
+        record = common.CopyOnWriteRecord(self.original)
+        record["list"].append(5)
+        copy = record.copy()
+
+        record["list"].append(6)
+        copy["list"].append(7)
+
+        self.assertEqual([1, [2], 5, 6], record["list"])
+        self.assertEqual([1, [2], 5, 7], copy["list"])
+        self.assertEqual(record["list"][:3], deepcopy(copy)["list"][:3])
+
+    def test_unpacking(self):
+        for unpack in (dict, lambda r: {**r}, lambda r: {} | r, lambda r: r | {}):
+            record = common.CopyOnWriteRecord(self.original)
+            unpack(record)["list"][1].append(8)
+            self.assertEqual([1, [2]], self.original["list"])
+
+        record = common.CopyOnWriteRecord(self.original)
+        self.assertEqual(
+            json.dumps(self.original, default=str), json.dumps(record, default=str)
+        )
+        self.assertEqual(set(), record._shared)
+
 
 class Test_TestCommon_DropIdentifier(unittest.TestCase):
     def test_dropidentifier(self):
@@ -552,6 +866,85 @@ class Test_TestCommon_IsochroneCalculation(unittest.TestCase):
             except StopIteration:
                 pass
 
+    def test_isochronecalculation_retries(self):
+        with graphhopper(failures=2) as server, override_settings(
+            GRAPHHOPPER=server.url
+        ):
+            isochronecalculation = common.IsochroneCalculation(backoff=0)
+            result = list(
+                isochronecalculation("id", {"geom": common.Point(4, 6)}, requests)
+            )
+
+        self.assertEqual(3, server.requests)
+        self.assertEqual(3, len(result))
+
+    def test_isochronecalculation_retries_exhausted(self):
+        with graphhopper(failures=2) as server, override_settings(
+            GRAPHHOPPER=server.url
+        ):
+            isochronecalculation = common.IsochroneCalculation(retries=1, backoff=0)
+            with self.assertLogs(level="ERROR"):
+                result = list(
+                    isochronecalculation("id", {"geom": common.Point(4, 6)}, requests)
+                )
+
+        self.assertEqual([], result)
+
+    def test_concurrentisochronecalculation(self):
+        with graphhopper(failures=1, latency=0.01) as server, override_settings(
+            GRAPHHOPPER=server.url
+        ):
+            with BufferingNodeExecutionContext(
+                common.ConcurrentIsochroneCalculation(concurrency=4, backoff=0),
+                services={"http": requests.Session()},
+            ) as context:
+                for i in range(10):
+                    context.write_sync((i, {"geom": common.Point(i, 45)}))
+            result = context.get_buffer()
+
+        self.assertEqual(30, len(result))
+        # Isochrones of a record are emitted together
+        identifiers = [identifier for identifier, _ in result]
+        self.assertEqual(list(range(10)), sorted(set(identifiers)))
+        for i in range(10):
+            start = identifiers.index(i)
+            self.assertEqual([i] * 3, identifiers[start : start + 3])  # noqa: E203
+            self.assertAlmostEqual(i, result[start][1]["geom"].centroid.x)
+
+    def test_concurrentisochronecalculation_errors(self):
+        session = requests.Session()
+        sessions = {}
+
+        def get_isochrones(identifier, point, http):
+            self.assertIsNot(session, http)
+            self.assertIs(http, sessions.setdefault(threading.get_ident(), http))
+            sleep(0.01 * (identifier % 3))
+            if identifier in (2, 7):
+                raise ValueError("failure")
+            return [(identifier, {"geom": point})]
+
+        node = common.ConcurrentIsochroneCalculation(concurrency=4)
+        with mock.patch.object(
+            node, "get_isochrones", side_effect=get_isochrones
+        ), self.assertLogs(common.logger, level="ERROR") as logs:
+            with BufferingNodeExecutionContext(
+                node, services={"http": session}
+            ) as context:
+                for i in range(10):
+                    context.write_sync((i, {"geom": common.Point(i, 45)}))
+
+        self.assertEqual(
+            [0, 1, 3, 4, 5, 6, 8, 9], sorted(i for i, _ in context.get_buffer())
+        )
+        self.assertEqual(
+            [
+                "2: isochrone calculation failed failure",
+                "7: isochrone calculation failed failure",
+            ],
+            sorted(log.split(":", 2)[-1] for log in logs.output),
+        )
+        self.assertEqual(len(sessions), len(set(map(id, sessions.values()))))
+
 
 class Test_TestCommon_UnionOnProperty(unittest.TestCase):
     def test_uniononproperty(self):
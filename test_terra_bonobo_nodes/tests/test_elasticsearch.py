@@ -6,6 +6,7 @@ from bonobo.constants import NOT_MODIFIED
 from bonobo.util.testing import BufferingNodeExecutionContext
 
 from terra_bonobo_nodes import elasticsearch as elasticsearch_terra
+from test_terra_bonobo_nodes.standins import elasticsearch as elasticsearch_standin
 
 
 class Test_ES_Extract(unittest.TestCase):
@@ -50,7 +51,7 @@ class Test_ES_Extract(unittest.TestCase):
         properties_2 = {"layer": "b"}
         id_test2 = "2"
 
-        with mock.patch("elasticsearch.helpers.bulk") as mock_es:
+        with mock.patch("elasticsearch.helpers.bulk", return_value=(2, [])) as mock_es:
             es = elasticsearch.Elasticsearch()
             with BufferingNodeExecutionContext(
                 elasticsearch_terra.LoadInES(index=index), services={"es": es}
@@ -71,8 +72,9 @@ class Test_ES_Extract(unittest.TestCase):
         with mock.patch(
             "elasticsearch.helpers.bulk",
         ) as mock_bulk:
-            mock_bulk.side_effect = elasticsearch.helpers.BulkIndexError(
-                "Simulated error"
+            mock_bulk.return_value = (
+                1,
+                [{"index": {"_id": "2", "status": 400, "error": "Simulated error"}}],
             )
             es = elasticsearch.Elasticsearch()
             with self.assertLogs(elasticsearch_terra.logger):
@@ -81,6 +83,23 @@ class Test_ES_Extract(unittest.TestCase):
                 ) as context:
                     context.write_sync((id_test, properties), (id_test2, properties_2))
 
+    def test_loadines_checkpoint_errors(self):
+        checkpoint = mock.Mock()
+        with elasticsearch_standin(rejected={"3"}) as server:
+            with self.assertLogs(elasticsearch_terra.logger, level="ERROR"):
+                with BufferingNodeExecutionContext(
+                    elasticsearch_terra.LoadInES("index", checkpoint=checkpoint),
+                    services={"es": elasticsearch.Elasticsearch(server.url)},
+                ) as context:
+                    for i in range(600):
+                        context.write_sync((str(i), {"value": i}))
+
+        # Chunks after the failing one are indexed too
+        self.assertEqual(600, server.indexed)
+        (name, committed), _ = checkpoint.committed.call_args
+        self.assertEqual("LoadInES", name)
+        self.assertEqual([str(i) for i in range(600) if i != 3], committed)
+
     def test_esgeometryfield(self):
         index = "index"
         geom_field = "geom_field"
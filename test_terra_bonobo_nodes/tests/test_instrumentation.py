@@ -0,0 +1,194 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+from bonobo.constants import NOT_MODIFIED
+from bonobo.util.testing import BufferingNodeExecutionContext
+from django.contrib.gis.geos import Point
+from django.test import override_settings
+
+from terra_bonobo_nodes import common, instrumentation, sql, terra
+from test_terra_bonobo_nodes.standins import graphhopper, statsd
+
+
+class Test_TestInstrumentation_Instrumentation(unittest.TestCase):
+    def test_instrumentation_disabled(self):
+        call = common.ExcludeAttributes.__call__
+        with instrumentation.Instrumentation() as instrumented:
+            self.assertIsNot(common.ExcludeAttributes.__call__, call)
+        self.assertIs(common.ExcludeAttributes.__call__, call)
+
+        common.ExcludeAttributes(["a"])("id", {"a": 1})
+        self.assertEqual(instrumented.metrics, {})
+
+    def test_instrumentation_records(self):
+        exclude = common.ExcludeAttributes(["a"])
+        reader = common.CsvDictReader()
+        with instrumentation.Instrumentation() as instrumented:
+            with BufferingNodeExecutionContext(exclude) as context:
+                for i in range(5):
+                    context.write_sync((i, {"a": 1, "b": 2}))
+            rows = list(reader("a,b\n1,2\n3,4\n5,6\n"))
+
+        self.assertEqual(len(context.get_buffer()), 5)
+        self.assertEqual(len(rows), 3)
+
+        metrics = instrumented.metrics[exclude]
+        self.assertEqual(metrics.name, "ExcludeAttributes")
+        self.assertEqual(metrics.calls, 5)
+        self.assertEqual(metrics.records_in, 5)
+        self.assertEqual(metrics.records_out, 5)
+        self.assertEqual(len(metrics.durations), 5)
+
+        metrics = instrumented.metrics[reader]
+        self.assertEqual(metrics.calls, 1)
+        self.assertEqual(metrics.records_out, 3)
+
+    def test_instrumentation_not_modified(self):
+        node = terra.LoadFeatureInLayer(window_length=1)
+        with instrumentation.Instrumentation() as instrumented:
+            instrumented.wrap(lambda node: NOT_MODIFIED, True)(node)
+            instrumented.wrap(lambda node: None, True)(node)
+        self.assertEqual(instrumented.metrics[node].calls, 2)
+        self.assertEqual(instrumented.metrics[node].records_out, 1)
+
+    def test_instrumentation_names(self):
+        nodes = [common.ExcludeAttributes(["a"]) for _ in range(2)]
+        with instrumentation.Instrumentation() as instrumented:
+            for node in nodes:
+                node("id", {"a": 1})
+        self.assertEqual(
+            [instrumented.metrics[node].name for node in nodes],
+            ["ExcludeAttributes", "ExcludeAttributes#2"],
+        )
+
+    def test_instrumentation_latency(self):
+        node = common.MapProperties(lambda record: time.sleep(0.01) or record)
+        with instrumentation.Instrumentation() as instrumented:
+            for i in range(10):
+                list(node(i, {}))
+        metrics = instrumented.metrics[node]
+        self.assertGreaterEqual(metrics.percentile(50), 0.01)
+        self.assertGreaterEqual(metrics.seconds, 0.1)
+        self.assertLessEqual(metrics.percentile(50), metrics.percentile(99))
+
+    def test_instrumentation_http(self):
+        node = common.IsochroneCalculation()
+        with graphhopper() as server, override_settings(GRAPHHOPPER=server.url):
+            with instrumentation.Instrumentation() as instrumented:
+                rows = list(
+                    node(1, {"geom": Point(1, 2, srid=4326)}, requests.Session())
+                )
+        metrics = instrumented.metrics[node]
+        self.assertEqual(metrics.http_requests, 1)
+        self.assertEqual(metrics.records_out, len(rows))
+        self.assertGreater(metrics.bytes, 0)
+
+    def test_instrumentation_queries(self):
+        node = sql.SQLExtract("SELECT 1 AS id UNION SELECT 2", "id")
+        with instrumentation.Instrumentation() as instrumented:
+            rows = list(node())
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(instrumented.metrics[node].queries, 1)
+
+
+class Test_TestInstrumentation_Sinks(unittest.TestCase):
+    def setUp(self):
+        self.node = common.ExcludeAttributes(["a"])
+        with instrumentation.Instrumentation() as instrumented:
+            for i in range(3):
+                list(self.node(i, {"a": 1}))
+        self.metrics = list(instrumented.metrics.values())
+
+    def test_loggingsink(self):
+        with self.assertLogs("terra_bonobo_nodes.instrumentation", "INFO") as logs:
+            instrumentation.LoggingSink().export(self.metrics)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("ExcludeAttributes: 3 calls", logs.output[0])
+
+    def test_prometheussink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.prom")
+            instrumentation.PrometheusSink(path).export(self.metrics)
+            with open(path) as prom:
+                lines = prom.read().splitlines()
+        self.assertIn("# TYPE bonobo_node_calls_total counter", lines)
+        self.assertIn('bonobo_node_calls_total{node="ExcludeAttributes"} 3', lines)
+        self.assertIn(
+            'bonobo_node_latency_seconds_count{node="ExcludeAttributes"} 3', lines
+        )
+
+    def test_statsdsink(self):
+        with statsd() as server:
+            host, port = server.server_address
+            instrumentation.StatsdSink(host, port).export(self.metrics)
+            for _ in range(100):
+                if server.lines:
+                    break
+                time.sleep(0.01)
+        self.assertIn("bonobo_node.ExcludeAttributes.calls:3|c", server.lines)
+        self.assertIn("bonobo_node.ExcludeAttributes.records_out:3|c", server.lines)
+
+
+class Test_TestInstrumentation_QueryProfiler(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint(
+                "SELECT *  FROM features_1\n WHERE id = 12 AND name = 'a''b'"
+                " AND layer_id IN (%s, %s, %s) AND srid = %(srid)s"
+            ),
+            "SELECT * FROM features_1 WHERE id = ? AND name = ?"
+            " AND layer_id IN (...) AND srid = ?",
+        )
+
+    def test_queryprofiler_report(self):
+        profiler = instrumentation.QueryProfiler(slow=0.01, n_plus_one=3)
+        metrics = instrumentation.NodeMetrics("AttributeFromSQL")
+
+        def execute(sql, params, many, context):
+            if params[0] == 0:
+                time.sleep(0.01)
+
+        with instrumentation._measure(metrics):
+            for i in range(5):
+                profiler(execute, f"SELECT {i} WHERE id = %s", [i], False, {})
+            profiler(execute, "SELECT count(*) FROM features", [1], False, {})
+        # Out of nodes
+        profiler(execute, "SELECT 1", [1], False, {})
+
+        (report,) = profiler.get_report()
+        self.assertEqual(report["node"], "AttributeFromSQL")
+        self.assertEqual(report["queries"], 6)
+        self.assertEqual(
+            report["n_plus_one"],
+            [
+                {
+                    "fingerprint": "SELECT ? WHERE id = ?",
+                    "count": 5,
+                    "seconds": mock.ANY,
+                }
+            ],
+        )
+        self.assertEqual(len(report["slow"]), 1)
+        self.assertEqual(report["slow"][0]["count"], 1)
+
+        with self.assertLogs("terra_bonobo_nodes.instrumentation", "INFO") as logs:
+            profiler.export([metrics])
+        self.assertIn("N+1 pattern, 5 times", logs.output[1])
+
+    def test_queryprofiler_attributefromsql(self):
+        profiler = instrumentation.QueryProfiler(slow=0, explain=1, n_plus_one=5)
+        node = sql.AttributeFromSQL("SELECT %s::int AS id", "attribute")
+        with instrumentation.Instrumentation(queries=profiler) as instrumented:
+            for i in range(10):
+                node(i, {})
+        self.assertEqual(profiler._connections, set())
+
+        (report,) = profiler.get_report()
+        self.assertEqual(report["queries"], 10)
+        self.assertEqual(instrumented.metrics[node].queries, 10)
+        self.assertEqual(report["n_plus_one"][0]["count"], 10)
+        self.assertIn("Result", report["slow"][0]["plans"][0])
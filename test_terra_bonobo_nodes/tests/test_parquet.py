@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pyarrow.parquet as pq
+from bonobo.util.testing import BufferingNodeExecutionContext
+from django.contrib.gis.geos import Point
+
+from terra_bonobo_nodes import parquet
+
+
+class Test_TestParquet_GeoParquet(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "records.parquet")
+        self.rows = [
+            (f"id{i}", {"value": i, "geom": Point(i, i, srid=2154)}) for i in range(25)
+        ]
+
+    def write(self, rows, **options):
+        with BufferingNodeExecutionContext(
+            parquet.GeoParquetWriter(self.path, **options)
+        ) as context:
+            for row in rows:
+                context.write_sync(row)
+        return context.get_buffer()
+
+    def test_geoparquetwriter(self):
+        self.assertEqual(self.write(self.rows, row_group_size=10), self.rows)
+
+        metadata = pq.ParquetFile(self.path).metadata
+        self.assertEqual(metadata.num_row_groups, 3)
+        geo = json.loads(metadata.metadata[b"geo"])
+        self.assertEqual(geo["primary_column"], "geom")
+        self.assertEqual(geo["columns"]["geom"]["encoding"], "WKB")
+        self.assertEqual(parquet.get_srid(geo["columns"]["geom"]["crs"]), 2154)
+        self.assertEqual(
+            geo["columns"]["geom"]["covering"]["bbox"]["xmin"], ["bbox", "xmin"]
+        )
+
+    def test_geoparquetwriter_schema(self):
+        self.write(
+            [("id0", {"value": 0, "name": "a"}), ("id1", {"value": 1})],
+            row_group_size=1,
+        )
+        self.assertEqual(
+            list(parquet.GeoParquetReader(self.path)()),
+            [("id0", {"value": 0, "name": "a"}), ("id1", {"value": 1, "name": None})],
+        )
+
+        with self.assertRaises(ValueError):
+            self.write(
+                [("id0", {"value": 0}), ("id1", {"value": "a"})], row_group_size=1
+            )
+
+    def test_geoparquetwriter_widen(self):
+        rows = [
+            ("id0", {"value": 0, "empty": None}),
+            ("id1", {"value": 1.5, "empty": None, "name": "a"}),
+            ("id2", {"value": 2, "empty": 2, "geom": Point(2, 2, srid=2154)}),
+            ("id3", {"value": 3, "empty": None}),
+        ]
+        self.write(rows, row_group_size=1)
+
+        parquet_file = pq.ParquetFile(self.path)
+        self.assertEqual(4, parquet_file.metadata.num_row_groups)
+        schema = parquet_file.schema_arrow
+        self.assertEqual("double", str(schema.field("value").type))
+        self.assertEqual("int64", str(schema.field("empty").type))
+        geo = json.loads(parquet_file.metadata.metadata[b"geo"])
+        self.assertEqual(2154, parquet.get_srid(geo["columns"]["geom"]["crs"]))
+        self.assertEqual(
+            [
+                ("id0", {"value": 0, "empty": None, "name": None, "geom": None}),
+                ("id1", {"value": 1.5, "empty": None, "name": "a", "geom": None}),
+                (
+                    "id2",
+                    {
+                        "value": 2,
+                        "empty": 2,
+                        "name": None,
+                        "geom": Point(2, 2, srid=2154),
+                    },
+                ),
+                ("id3", {"value": 3, "empty": None, "name": None, "geom": None}),
+            ],
+            list(parquet.GeoParquetReader(self.path)()),
+        )
+        self.assertEqual(
+            [os.path.basename(self.path)], os.listdir(os.path.dirname(self.path))
+        )
+
+    def test_geoparquetreader(self):
+        self.write(self.rows)
+        rows = list(parquet.GeoParquetReader(self.path, batch_size=7)())
+
+        self.assertEqual(rows, self.rows)
+        self.assertEqual(rows[0][1]["geom"].srid, 2154)
+
+    def test_geoparquetreader_columns(self):
+        self.write(self.rows)
+        self.assertEqual(
+            list(parquet.GeoParquetReader(self.path, columns=["value"])())[:2],
+            [("id0", {"value": 0}), ("id1", {"value": 1})],
+        )
+
+    def test_geoparquetreader_bbox(self):
+        self.write(self.rows, row_group_size=10)
+        node = parquet.GeoParquetReader(self.path, bbox=(11.5, 0, 13, 100))
+
+        self.assertEqual(node.get_row_groups(pq.ParquetFile(self.path)), [1])
+        self.assertEqual([identifier for identifier, _ in node()], ["id12", "id13"])
+
+    def test_geoparquetreader_empty(self):
+        self.write([])
+        self.assertEqual(list(parquet.GeoParquetReader(self.path)()), [])
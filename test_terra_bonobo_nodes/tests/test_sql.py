@@ -1,5 +1,8 @@
 import unittest
 
+from bonobo.util.testing import BufferingNodeExecutionContext
+from django.db import connection
+
 from terra_bonobo_nodes import sql
 
 
@@ -37,3 +40,74 @@ class Test_TestSql_SQLExtract(unittest.TestCase):
         self.assertIsInstance(record_result, dict)
         self.assertIn(property_, record_result)
         self.assertEqual(len(record_result), 1)
+
+
+class Test_TestSql_AttributeFromSQL(unittest.TestCase):
+    def count_prepared(self, cursor, node):
+        cursor.execute(
+            "SELECT count(*) FROM pg_prepared_statements WHERE name = %s",
+            [node.get_statement_name()],
+        )
+        return cursor.fetchone()[0]
+
+    def test_attributefromsql_cursor(self):
+        node = sql.AttributeFromSQL("SELECT %s::int AS id", "attribute")
+        with BufferingNodeExecutionContext(node) as context:
+            context.write_sync(("1", {}), ("2", {}))
+            cursor = node._cursor
+
+        self.assertEqual(
+            context.get_buffer(),
+            [("1", {"attribute": [{"id": 1}]}), ("2", {"attribute": [{"id": 2}]})],
+        )
+        self.assertTrue(cursor.cursor.closed)
+        self.assertIsNone(node._cursor)
+
+    def test_attributefromsql_prepare(self):
+        node = sql.AttributeFromSQL(
+            "SELECT %s::int AS id WHERE 'a' LIKE 'a%%'", "attribute", prepare=True
+        )
+        self.assertEqual(node(1, {}), (1, {"attribute": [{"id": 1}]}))
+        self.assertEqual(node(2, {}), (2, {"attribute": [{"id": 2}]}))
+        self.assertEqual(self.count_prepared(node.get_cursor(), node), 1)
+
+        node.close_cursor()
+        with connection.cursor() as cursor:
+            self.assertEqual(self.count_prepared(cursor, node), 0)
+
+    def test_bulkattributefromsql(self):
+        node = sql.BulkAttributeFromSQL(
+            "SELECT %s::int AS id, i FROM generate_series(1, 2) AS i"
+            " WHERE 'a' LIKE 'a%%'",
+            "attribute",
+        )
+        window = [(i, {}) for i in range(3)]
+
+        self.assertEqual(
+            list(node.process_window(window)),
+            [
+                (i, {"attribute": [{"id": i, "i": 1}, {"id": i, "i": 2}]})
+                for i in range(3)
+            ],
+        )
+
+    def test_bulkattributefromsql_integer(self):
+        node = sql.BulkAttributeFromSQL(
+            "SELECT i FROM generate_series(1, 3) AS i WHERE i = %s", "attribute"
+        )
+        window = [("1", {}), (3, {}), ("4", {})]
+
+        with connection.cursor() as cursor:
+            self.assertEqual("integer", node.get_parameter_type(cursor))
+        self.assertEqual(
+            list(node.process_window(window)),
+            [
+                ("1", {"attribute": [{"i": 1}]}),
+                (3, {"attribute": [{"i": 3}]}),
+                ("4", {"attribute": []}),
+            ],
+        )
+
+    def test_bulkattributefromsql_empty(self):
+        node = sql.BulkAttributeFromSQL("SELECT %s::int AS id WHERE false", "attribute")
+        self.assertEqual(list(node.process_window([(1, {})])), [(1, {"attribute": []})])
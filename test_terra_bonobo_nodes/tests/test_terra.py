@@ -1,13 +1,26 @@
+import random
+import threading
+from copy import deepcopy
 from json import JSONDecodeError
 from unittest import mock
 
 import django
 import requests
 from bonobo.util.testing import BufferingNodeExecutionContext
-from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.db.models.functions import Centroid, GeoHash, Transform
+from django.contrib.gis.gdal import SpatialReference
+from django.contrib.gis.geos import GEOSGeometry, LineString, Point, Polygon
+from django.db import models
+from django.db.models.signals import pre_delete
 from django.utils import timezone
+from geostore.models import (
+    FeatureExtraGeom,
+    FeatureRelation,
+    LayerExtraGeom,
+    LayerRelation,
+)
 
-from terra_bonobo_nodes import terra
+from terra_bonobo_nodes import common, terra
 
 
 class Test_TestTerra_LayerClusters(django.test.TestCase):
@@ -41,6 +54,57 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
             self.assertIsInstance(cluster_result, str)
             self.assertIsInstance(features_result, terra.FeatureQuerySet)
 
+    def test_layer_cluster_aggregate(self):
+        layer_cluster = terra.LayerClusters(
+            input_layers=self.layers[:3],
+            metric_projection_srid=4326,
+            distance=3,
+            strategy="dbscan",
+            aggregate=True,
+            sum_fields={"total": "value"},
+        )
+        result = list(layer_cluster())
+        self.assertEqual(1, len(result))
+        cluster_result, aggregates = result[0]
+        self.assertIsInstance(cluster_result, str)
+        self.assertEqual(3, aggregates["point_count"])
+        self.assertEqual(3, len(aggregates["geom"]))
+        self.assertCountEqual(
+            [layer.features.get().pk for layer in self.layers[:3]], aggregates["ids"]
+        )
+        self.assertIn("total", aggregates)
+
+    def test_layer_cluster_strategy_error(self):
+        with self.assertRaises(ValueError):
+            list(terra.LayerClusters(self.layers, 4326, 2, strategy="unknown")())
+        with self.assertRaises(ValueError):
+            list(terra.LayerClusters(self.layers, 4326, 2, strategy="kmeans")())
+
+    def geohashes(self):
+        return dict(
+            terra.Feature.objects.annotate(
+                geohash=GeoHash(Transform(Centroid("geom"), 4326))
+            ).values_list("pk", "geohash")
+        )
+
+    def test_layer_cluster_spatial_order(self):
+        layer_cluster = terra.LayerClusters(
+            self.layers, 4326, 1, aggregate=True, spatial_order="geohash"
+        )
+        geohashes = self.geohashes()
+        result = [geohashes[aggregates["ids"][0]] for _, aggregates in layer_cluster()]
+
+        self.assertEqual(4, len(result))
+        self.assertEqual(sorted(result), result)
+
+        layer_cluster = terra.LayerClusters(
+            self.layers, 4326, 1, spatial_order="hilbert"
+        )
+        self.assertEqual(4, len(list(layer_cluster())))
+
+        with self.assertRaises(ValueError):
+            list(terra.LayerClusters(self.layers, 4326, 2, spatial_order="z")())
+
     def test_subdividegeom(self):
         subdividegeom = terra.SubdivideGeom()
         properties = {
@@ -57,6 +121,52 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
             self.assertIsInstance(id_result, str)
             self.assertEqual(properties_result, properties)
 
+    def test_subdividegeom_local(self):
+        polygon = Point(0, 0, srid=4326).buffer(1, quadsegs=16)
+        subdividegeom = terra.SubdivideGeom(max_vertices=16, local=True)
+
+        result = list(subdividegeom("identifier", {"geom": polygon, "a": "b"}))
+
+        self.assertGreater(len(result), 1)
+        self.assertEqual("identifier-1", result[1][0])
+        self.assertAlmostEqual(polygon.area, sum(r["geom"].area for _, r in result))
+        for _, record in result:
+            self.assertLessEqual(record["geom"].num_coords, 16)
+            self.assertEqual(4326, record["geom"].srid)
+            self.assertEqual("b", record["a"])
+
+    def test_subdividegeom_copy(self):
+        polygon = Point(0, 0, srid=4326).buffer(1, quadsegs=16)
+        properties = {"geom": polygon, "tags": ["a"]}
+        for copy_on_write in (False, True):
+            subdividegeom = terra.SubdivideGeom(
+                max_vertices=16, local=True, copy_on_write=copy_on_write
+            )
+            parts = [record for _, record in subdividegeom("id", properties)]
+            self.assertEqual(
+                copy_on_write, isinstance(parts[0], common.CopyOnWriteRecord)
+            )
+            parts[0]["tags"].append("b")
+            self.assertEqual(["a"], properties["tags"])
+            self.assertEqual(["a"], parts[1]["tags"])
+
+    def test_bulksubdividegeom(self):
+        records = [
+            ("a", {"geom": self.geometries["layerpolygon"]}),
+            ("b", {"geom": Point(0, 0, srid=4326).buffer(1, quadsegs=16)}),
+        ]
+        with BufferingNodeExecutionContext(
+            terra.BulkSubdivideGeom(max_vertices=16, window_length=2)
+        ) as context:
+            context.write_sync(*records)
+
+        result = context.get_buffer()
+
+        self.assertEqual(["a-0", "b-0"], [id_result for id_result, _ in result][:2])
+        self.assertGreater(len(result), 2)
+        for _, record in result:
+            self.assertLessEqual(record["geom"].num_coords, 16)
+
     def test_loadfeatureinlayer(self):
         id_ = "identifier"
         record = {"a": "b", "c": "d"}
@@ -86,6 +196,87 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
             self.assertEqual(id_result, id_)
             self.assertEqual(record_result, record)
 
+    def test_loadfeatureinlayer_incremental(self):
+        layer = terra.Layer.objects.create(name="incremental")
+        rows = [(f"id{i}", {"a": i, "geom": Point(i, i, srid=4326)}) for i in range(3)]
+
+        def load(rows):
+            with BufferingNodeExecutionContext(
+                terra.LoadFeatureInLayer(
+                    layer_name=layer.name,
+                    window_length=2,
+                    incremental=True,
+                    delete_missing=True,
+                    diff="diff",
+                )
+            ) as context:
+                for row in rows:
+                    context.write_sync(row)
+            return dict(context.get_buffer())
+
+        self.assertEqual(
+            {"id0", "id1", "id2"},
+            {i for i, r in load(rows).items() if r["diff"] == "inserted"},
+        )
+        unchanged = layer.features.get(identifier="id0")
+
+        rows[1][1]["a"] = "changed"
+        rows[2] = ("id3", rows[2][1])
+        with self.assertLogs(terra.logger, level="INFO") as logs:
+            result = load(rows)
+
+        self.assertEqual("updated", result["id1"]["diff"])
+        self.assertEqual("changed", result["id1"]["a"])
+        self.assertEqual("inserted", result["id3"]["diff"])
+        self.assertEqual({"diff": "deleted"}, result["id2"])
+        self.assertNotIn("id0", result)
+        self.assertIn("1 inserted, 1 updated, 1 unchanged, 1 deleted", logs.output[-1])
+        self.assertEqual(unchanged, layer.features.get(identifier="id0"))
+        self.assertEqual(
+            ["id0", "id1", "id3"],
+            sorted(layer.features.values_list("identifier", flat=True)),
+        )
+
+    def test_loadfeatureinlayer_incremental_keep_missing(self):
+        layer = terra.Layer.objects.create(name="incremental")
+        rows = [(i, {1: i, "a": i, "geom": Point(i, i, srid=4326)}) for i in range(3)]
+
+        def load(rows, error=False, **options):
+            with BufferingNodeExecutionContext(
+                terra.LoadFeatureInLayer(
+                    layer_name=layer.name, incremental=True, diff="diff", **options
+                )
+            ) as context:
+                for row in rows:
+                    context.write_sync(row)
+                if error:
+                    context.increment("err")
+            return dict(context.get_buffer())
+
+        load(rows)
+        with self.assertLogs(terra.logger, level="INFO") as logs:
+            self.assertEqual({}, load(rows[1:]))
+        self.assertIn("0 inserted, 0 updated, 2 unchanged, 0 deleted", logs.output[-1])
+
+        with self.assertLogs(terra.logger, level="WARNING") as logs:
+            self.assertEqual({}, load(rows[1:], error=True, delete_missing=True))
+        self.assertIn("incomplete load", logs.output[0])
+        self.assertEqual(3, layer.features.count())
+
+        self.assertEqual(
+            {"0": {"diff": "deleted"}}, load(rows[1:], delete_missing=True)
+        )
+        self.assertEqual(
+            ["1", "2"], sorted(layer.features.values_list("identifier", flat=True))
+        )
+
+    def test_feature_hash_mixed_keys(self):
+        geometry = Point(0, 0, srid=4326)
+        self.assertEqual(
+            terra.feature_hash(geometry, {"1": "a", "b": 2}),
+            terra.feature_hash(geometry, {1: "a", "b": 2}),
+        )
+
     def test_getfeatureobject(self):
         record = {
             "geom": "value_geom",
@@ -107,6 +298,57 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
             self.assertIsInstance(attr_result, str)
             self.assertIsInstance(properties_result, dict)
 
+    def test_extractfeatures_spatial_order(self):
+        geohashes = self.geohashes()
+        for spatial_order in ("geohash", "hilbert"):
+            extractfeature = terra.ExtractFeatures(
+                terra.Feature.objects.all(),
+                extra_properties={"pk": "pk"},
+                spatial_order=spatial_order,
+            )
+            result = [geohashes[record["pk"]] for _, record in extractfeature()]
+            self.assertEqual(len(geohashes), len(result))
+            if spatial_order == "geohash":
+                self.assertEqual(sorted(result), result)
+
+        with self.assertRaises(ValueError):
+            list(
+                terra.ExtractFeatures(
+                    terra.Feature.objects.all(),
+                    spatial_order="geohash",
+                    checkpoint=mock.Mock(),
+                )()
+            )
+
+    def test_extractfeatures_hilbert(self):
+        layer = terra.Layer.objects.create(name="hilbert")
+        # Centers of an aligned block of 8 x 8 cells of the Hilbert grid
+        size = (360 / 2**16, 180 / 2**16)
+        cells = [(i, j) for i in range(8) for j in range(8)]
+        random.Random(0).shuffle(cells)
+        for i, j in cells:
+            terra.Feature.objects.create(
+                layer=layer,
+                geom=Point((i + 0.5) * size[0], (j + 0.5) * size[1], srid=4326),
+            )
+        extractfeature = terra.ExtractFeatures(
+            layer.features.all(),
+            extra_properties={"geom": "geom"},
+            spatial_order="hilbert",
+        )
+
+        result = [
+            (
+                round(record["geom"].x / size[0] - 0.5),
+                round(record["geom"].y / size[1] - 0.5),
+            )
+            for _, record in extractfeature()
+        ]
+        self.assertEqual(64, len(result))
+        # Each feature is next to the previous one
+        for (x0, y0), (x1, y1) in zip(result, result[1:]):
+            self.assertEqual(1, abs(x1 - x0) + abs(y1 - y0))
+
     def test_booleanintersect_exception(self):
         property_ = "property"
         booleanintersect = terra.BooleanIntersect(
@@ -164,6 +406,83 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
         self.assertEqual(identifier, id_result)
         self.assertIsInstance(record_result[property_], float)
 
+    def test_intersectionpercentbyarea_metric_projection(self):
+        record = {"geom": self.geometries["layerpolygon"].buffer(1)}
+        intersectionpercentbyarea = terra.IntersectionPercentByArea(
+            "layerpolygon", "percent", metric_projection_srid=3857
+        )
+
+        _, record_result = next(intersectionpercentbyarea("id", record))
+
+        self.assertGreater(record_result["percent"], 0.0)
+        self.assertLess(record_result["percent"], 1.0)
+
+    def test_bulkintersectionpercentbyarea(self):
+        polygon = self.geometries["layerpolygon"]
+        window = [
+            ("inside", {"geom": polygon}),
+            ("half", {"geom": Polygon.from_bbox((0.5, 0, 1.5, 1))}),
+            ("outside", {"geom": Polygon.from_bbox((10, 10, 11, 11))}),
+            ("no geometry", {}),
+        ]
+        node = terra.BulkIntersectionPercentByArea("layerpolygon", "percent")
+
+        with self.assertLogs():
+            result = dict(node.process_window(window))
+
+        self.assertAlmostEqual(1.0, result["inside"]["percent"])
+        self.assertAlmostEqual(0.5, result["half"]["percent"])
+        self.assertEqual(0.0, result["outside"]["percent"])
+        self.assertNotIn("percent", result["no geometry"])
+
+    def test_bulkintersectionpercentbyarea_parity(self):
+        half = Polygon.from_bbox((0.5, 0, 1.5, 1))
+        half.srid = 4326
+        window = [
+            ("projected", {"geom": half.transform(3857, clone=True)}),
+            ("line", {"geom": LineString((0.2, 0.2), (0.8, 0.8), srid=4326)}),
+            ("point outside", {"geom": Point(10, 10, srid=4326)}),
+        ]
+        for metric_projection_srid in (None, 3857):
+            scalar = terra.IntersectionPercentByArea(
+                "layerpolygon",
+                "percent",
+                metric_projection_srid=metric_projection_srid,
+            )
+            bulk = terra.BulkIntersectionPercentByArea(
+                "layerpolygon",
+                "percent",
+                metric_projection_srid=metric_projection_srid,
+            )
+
+            with self.assertLogs():
+                expected = dict(
+                    next(scalar(identifier, deepcopy(record)))
+                    for identifier, record in window
+                )
+            with self.assertLogs():
+                result = dict(bulk.process_window(deepcopy(window)))
+
+            self.assertAlmostEqual(
+                expected["projected"]["percent"], result["projected"]["percent"]
+            )
+            self.assertNotIn("percent", expected["line"])
+            self.assertNotIn("percent", result["line"])
+            self.assertEqual(0.0, expected["point outside"]["percent"])
+            self.assertEqual(0.0, result["point outside"]["percent"])
+
+    def test_bulkintersectiongeom(self):
+        window = [
+            ("half", {"geom": Polygon.from_bbox((0.5, 0, 1.5, 1))}),
+            ("outside", {"geom": Polygon.from_bbox((10, 10, 11, 11))}),
+        ]
+        node = terra.BulkIntersectionGeom("layerpolygon", geom_dest="zone")
+
+        result = dict(node.process_window(window))
+
+        self.assertAlmostEqual(0.5, result["half"]["zone"].area)
+        self.assertIsNone(result["outside"]["zone"])
+
     def test_closestfeatures_attribute_valid(self):
         identifier = "id"
         properties = {
@@ -324,6 +643,25 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
         self.assertEqual(id_result, identifier)
         self.assertIsInstance(properties_result[property_], float)
 
+    def test_bulkaccessibilityratiobytime(self):
+        times = [[5, None], [15, 30], [None, None]]
+        window = [
+            ("a", {"times": times}),
+            ("b", {"times": False}),
+            ("c", {"times": [[11, 19]]}),
+        ]
+        node = terra.BulkAccessibilityRatioByTime([10, 20], "ratio", stats="stats")
+
+        result = dict(node.process_window(window))
+
+        _, expected = terra.AccessibilityRatioByTime([10, 20], "ratio")(
+            "a", {"times": times}
+        )
+        self.assertEqual(expected["ratio"], result["a"]["ratio"])
+        self.assertEqual({"min": [5, 30], "median": [10, 30]}, result["a"]["stats"])
+        self.assertEqual({}, result["b"])
+        self.assertEqual(1.0, result["c"]["ratio"])
+
     def test_simplifygeom(self):
         tolerance = 5
         geom_in = "geom_in"
@@ -340,6 +678,69 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
         self.assertEqual(record_result[geom_out].geom_type, geom_type)
         self.assertIn(geom_in, record_result)
 
+    def test_simplifygeom_tolerances(self):
+        polygon = Point(0, 0, srid=4326).buffer(1, quadsegs=64)
+        simplifygeom = terra.SimplifyGeom(
+            0.5, tolerances={"geom_z10": 0.1, "geom_z14": 0.001}, preserve_topology=True
+        )
+
+        _, record = simplifygeom("identifier", {"geom": polygon})
+
+        self.assertLess(record["geom"].num_coords, record["geom_z10"].num_coords)
+        self.assertLess(record["geom_z10"].num_coords, record["geom_z14"].num_coords)
+        self.assertTrue(all(geom.valid for geom in record.values()))
+
+    def test_coveragesimplifygeom(self):
+        for local in (False, True):
+            with self.subTest(local=local):
+                self.check_coveragesimplifygeom(local)
+
+    def check_coveragesimplifygeom(self, local):
+        simplifygeom = terra.CoverageSimplifyGeom(
+            0.1, geom_out="simplified", local=local
+        )
+        try:
+            simplifygeom.use_postgis()
+        except RuntimeError as e:
+            self.skipTest(str(e))
+        window = [
+            ("left", {"geom": Point(0, 0, srid=4326).buffer(1, quadsegs=64)}),
+            ("point", {"geom": Point(0, 0, srid=4326)}),
+        ]
+        window.append(
+            (
+                "right",
+                {
+                    "geom": Polygon.from_bbox((0, -2, 2, 2)).difference(
+                        window[0][1]["geom"]
+                    )
+                },
+            )
+        )
+
+        result = dict(simplifygeom.process_window(window))
+
+        left, right = result["left"]["simplified"], result["right"]["simplified"]
+        self.assertLess(left.num_coords, result["left"]["geom"].num_coords)
+        # Shared edge stays coincident, without gap nor overlap
+        self.assertAlmostEqual(0, left.intersection(right).area)
+        self.assertGreater(left.intersection(right).length, 3)
+        self.assertEqual(result["point"]["geom"], result["point"]["simplified"])
+        self.assertEqual(4326, left.srid)
+
+    def test_coveragesimplifygeom_postgis(self):
+        window = [("point", {"geom": Point(0, 0, srid=4326)})]
+        versions = ((2, 5, 4), (3, 8, 0))
+        with mock.patch.object(terra, "postgis_versions", return_value=versions):
+            simplifygeom = terra.CoverageSimplifyGeom(0.1)
+            self.assertFalse(simplifygeom.use_postgis())
+            self.assertEqual(1, len(list(simplifygeom.process_window(window))))
+
+            with mock.patch.object(terra, "shapely", None):
+                simplifygeom = terra.CoverageSimplifyGeom(0.1)
+                with self.assertRaisesRegex(RuntimeError, "PostGIS 2.5.4"):
+                    list(simplifygeom.process_window(window))
+
     def test_transformgeom(self):
         ct = 2154
         geom_in = "geom_in"
@@ -354,6 +755,51 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
         self.assertEqual(record_result[geom_out].geom_type, geom_type)
         self.assertIn(geom_in, record_result)
 
+    def test_transformgeom_cached(self):
+        transformgeom = terra.TransformGeom("2154", geom_out="geom_out")
+        for geom in (Point(2, 48, srid=4326), Point(3, 49, srid=4326)):
+            _, record = transformgeom("identifier", {"geom": geom})
+            self.assertEqual(2154, record["geom_out"].srid)
+            self.assertEqual(geom.transform(2154, clone=True), record["geom_out"])
+        self.assertEqual([4326], list(transformgeom._transforms))
+
+    def test_bulktransformgeom(self):
+        window = [
+            (i, {"geom": geom})
+            for i, geom in enumerate(
+                [
+                    self.geometries["layerpolygon"],
+                    Point(2, 48, 10, srid=4326),
+                    Point(700000, 6600000, srid=2154),
+                    Point(srid=4326),
+                ]
+            )
+        ]
+        transformgeom = terra.TransformGeom("2154", geom_out="geom_out")
+        expected = [transformgeom(*row)[1]["geom_out"] for row in deepcopy(window)]
+
+        result = terra.BulkTransformGeom("2154", geom_out="geom_out").process_window(
+            window
+        )
+
+        for geom, (_, record) in zip(expected, result):
+            self.assertEqual(2154, record["geom_out"].srid)
+            self.assertEqual(geom.hasz, record["geom_out"].hasz)
+            self.assertTrue(geom.equals_exact(record["geom_out"], 1e-6))
+
+    def test_bulktransformgeom_definition(self):
+        window = [(0, {"geom": Point(2, 48, srid=4326)})]
+        expected = terra.TransformGeom("2154")(*deepcopy(window)[0])[1]["geom"]
+
+        wkt = SpatialReference(2154).wkt
+        ((_, record),) = terra.BulkTransformGeom(wkt).process_window(deepcopy(window))
+        self.assertEqual(2154, record["geom"].srid)
+        self.assertTrue(expected.equals_exact(record["geom"], 1e-6))
+
+        proj4 = SpatialReference(2154).proj4
+        with self.assertRaises(ValueError):
+            list(terra.BulkTransformGeom(proj4).process_window(window))
+
     def test_cleanolderthan(self):
         time = timezone.now()
         identifier = "identifier"
@@ -367,3 +813,164 @@ class Test_TestTerra_LayerClusters(django.test.TestCase):
             id_result, properties_result = row
             self.assertEqual(id_result, identifier)
             self.assertEqual(properties_result, properties)
+
+    def test_cleanolderthan_chunks(self):
+        layer = self.layers[0]
+        for i in range(2):
+            terra.Feature.objects.create(geom=Point(i, i), layer=layer)
+        time = timezone.now()
+        recent = terra.Feature.objects.create(geom=Point(3, 3), layer=layer)
+
+        with self.assertLogs(terra.logger, level="INFO") as logs:
+            with BufferingNodeExecutionContext(
+                terra.CleanOlderThan(time, layer_name=layer.name, chunk_size=2)
+            ) as context:
+                context.write_sync(("identifier", {}))
+
+        self.assertIn("3 features deleted", logs.output[-1])
+        self.assertEqual([recent], list(layer.features.all()))
+        self.assertEqual(1, self.layers[1].features.count())
+
+    def test_cleanolderthan_chunks_related(self):
+        layer = self.layers[0]
+        stale, other = [
+            terra.Feature.objects.create(geom=Point(i, i), layer=layer)
+            for i in range(2)
+        ]
+        time = timezone.now()
+        recent = terra.Feature.objects.create(geom=Point(3, 3), layer=layer)
+        layer_relation = LayerRelation.objects.create(
+            name="relation", origin=layer, destination=layer
+        )
+        FeatureRelation.objects.create(
+            origin=stale, destination=recent, relation=layer_relation
+        )
+        FeatureRelation.objects.create(
+            origin=recent, destination=other, relation=layer_relation
+        )
+        FeatureExtraGeom.objects.create(
+            feature=stale,
+            layer_extra_geom=LayerExtraGeom.objects.create(layer=layer, title="extra"),
+            geom=Point(0, 0),
+        )
+
+        with self.assertLogs(terra.logger, level="INFO") as logs:
+            with BufferingNodeExecutionContext(
+                terra.CleanOlderThan(time, layer_name=layer.name, chunk_size=2)
+            ) as context:
+                context.write_sync(("identifier", {}))
+
+        self.assertNotIn("with Django", "".join(logs.output))
+        self.assertEqual([recent], list(layer.features.all()))
+        self.assertFalse(FeatureRelation.objects.exists())
+        self.assertFalse(FeatureExtraGeom.objects.exists())
+
+    def test_cleanolderthan_chunks_django(self):
+        layer = self.layers[0]
+        terra.Feature.objects.create(geom=Point(0, 0), layer=layer)
+        time = timezone.now()
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance.pk)
+
+        pre_delete.connect(receiver, sender=terra.Feature)
+        self.addCleanup(pre_delete.disconnect, receiver, sender=terra.Feature)
+        node = terra.CleanOlderThan(time, layer_name=layer.name, chunk_size=2)
+        with self.assertLogs(terra.logger, level="INFO") as logs:
+            with BufferingNodeExecutionContext(node) as context:
+                context.write_sync(("identifier", {}))
+
+        self.assertIn("with Django", logs.output[0])
+        self.assertEqual(2, len(deleted))
+        self.assertFalse(layer.features.exists())
+
+        pre_delete.disconnect(receiver, sender=terra.Feature)
+        self.assertIsNotNone(node.get_cascades())
+        related = mock.Mock(on_delete=models.SET_NULL)
+        with mock.patch.object(terra.Feature._meta, "related_objects", [related]):
+            self.assertIsNone(node.get_cascades())
+
+
+class Test_TestTerra_PartitionedExtractFeatures(django.test.TransactionTestCase):
+    # Partitions are read over other connections, data must be committed
+    def setUp(self):
+        self.layer = terra.Layer.objects.create(name="partitioned")
+        for i in range(30):
+            terra.Feature.objects.create(
+                layer=self.layer,
+                identifier=f"id{i:02}",
+                geom=Polygon.from_bbox((i % 6, i // 6, i % 6 + 0.5, i // 6 + 0.5)),
+                properties={"value": i},
+            )
+        self.queryset = terra.Feature.objects.filter(layer=self.layer)
+
+    def extract(self, **options):
+        node = terra.PartitionedExtractFeatures(self.queryset, **options)
+        node.batch_size = 4
+        return list(node())
+
+    def test_partitionedextractfeatures(self):
+        expected = sorted(terra.ExtractFeatures(self.queryset)())
+        for partition_by in ("id", "tile"):
+            for partitions in (1, 3, 4):
+                rows = self.extract(partitions=partitions, partition_by=partition_by)
+                self.assertEqual(expected, sorted(rows))
+
+    def test_partitionedextractfeatures_empty(self):
+        for identifier in ("empty0", "empty1"):
+            terra.Feature.objects.create(
+                layer=self.layer,
+                identifier=identifier,
+                geom=GEOSGeometry("POLYGON EMPTY"),
+            )
+        for partitions in (1, 4, 9):
+            node = terra.PartitionedExtractFeatures(
+                self.queryset, partitions=partitions, partition_by="tile"
+            )
+            self.assertEqual(
+                self.queryset.count(),
+                sum(partition.count() for partition in node.get_partitions()),
+            )
+            node.batch_size = 4
+            self.assertEqual(
+                sorted(terra.ExtractFeatures(self.queryset)()), sorted(node())
+            )
+
+        self.queryset = self.queryset.filter(identifier__startswith="empty")
+        rows = self.extract(partitions=4, partition_by="tile")
+        self.assertEqual(["empty0", "empty1"], sorted(i for i, _ in rows))
+
+    def test_partitionedextractfeatures_ordered(self):
+        rows = self.extract(partitions=3, ordered=True)
+        self.assertEqual(sorted(rows), rows)
+
+        rows = self.extract(partitions=4, partition_by="tile", ordered=True)
+        # Lower left tile, then lower right
+        self.assertEqual(
+            ["id00", "id01", "id02", "id06", "id07", "id08"]
+            + ["id03", "id04", "id05", "id09", "id10", "id11"],
+            [identifier for identifier, _ in rows[:12]],
+        )
+
+    def test_partitionedextractfeatures_stopped(self):
+        node = terra.PartitionedExtractFeatures(self.queryset, partitions=4)
+        node.batch_size = 1
+        threads = threading.active_count()
+        rows = node()
+        next(rows)
+        rows.close()
+        # Blocked partitions are stopped
+        self.assertEqual(threads, threading.active_count())
+
+    def test_partitionedextractfeatures_invalid(self):
+        with self.assertRaises(ValueError):
+            self.extract(partition_by="hash")
+        self.assertEqual(
+            [],
+            list(
+                terra.PartitionedExtractFeatures(
+                    terra.Feature.objects.none(), partition_by="tile"
+                )()
+            ),
+        )